@@ -1,8 +1,10 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 from mangum import Mangum
 
 from backend.apps.api.routers import bookings, parkinglots, public, searcher
 from backend.apps.container import Container
+from backend.contexts.shared.domain import ConcurrencyConflict
 
 app = FastAPI()
 container = Container()
@@ -12,4 +14,15 @@ app.include_router(parkinglots.router, prefix="/parkinglots", tags=["Parkinglots
 app.include_router(searcher.router, prefix="/searcher", tags=["Searcher"])
 app.include_router(public.router, prefix="/public", tags=["Public"])
 
+
+# raised once a command used up its retries against a hot aggregate
+@app.exception_handler(ConcurrencyConflict)
+def concurrency_conflict_handler(
+    request: Request, exc: ConcurrencyConflict
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT, content={"detail": str(exc)}
+    )
+
+
 handler = Mangum(app, lifespan="off")
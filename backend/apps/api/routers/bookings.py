@@ -1,11 +1,13 @@
+from datetime import datetime
+from typing import Annotated, Optional
+
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.responses import JSONResponse
 
 from backend.apps.api.dependencies import get_driver_id
 from backend.apps.api.routers.models import (
     CreateBookingRequest,
-    ListBookingResponse,
     Message,
 )
 from backend.apps.container import Container
@@ -13,9 +15,17 @@ from backend.contexts.booking import application as bookings
 from backend.contexts.booking.application import BookingRepository
 from backend.contexts.booking.domain import (
     BookingAggregate,
+    BookingFilter,
     BookingInProgressCannotBeCanceled,
+    BookingState,
+    InvalidBookingFilter,
+)
+from backend.contexts.shared.domain import (
+    BookingId,
+    DriverId,
+    EventBus,
+    InvalidCursor,
 )
-from backend.contexts.shared.domain import BookingId, DriverId, EventBus
 
 router = APIRouter()
 
@@ -42,15 +52,36 @@ def create_booking(
 @router.get(
     "",
     responses={
-        status.HTTP_200_OK: {"model": ListBookingResponse},
+        status.HTTP_200_OK: {"model": bookings.ListBookingsResponse},
     },
 )
 @inject
 def list_bookings(
     driver_id: DriverId = Depends(get_driver_id),
     repo: BookingRepository = Depends(Provide[Container.booking_repository]),
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Annotated[Optional[str], Query()] = None,
+    state: Annotated[Optional[BookingState], Query()] = None,
+    created_from: Annotated[Optional[datetime], Query()] = None,
+    created_until: Annotated[Optional[datetime], Query()] = None,
 ):
-    return ListBookingResponse(bookings=bookings.list_bookings(driver_id, repo))
+    try:
+        return bookings.list_bookings(
+            driver_id=driver_id,
+            repo=repo,
+            limit=limit,
+            booking_filter=BookingFilter(
+                state=state,
+                created_from=created_from,
+                created_until=created_until,
+            ),
+            cursor=cursor,
+        )
+    except (InvalidCursor, InvalidBookingFilter) as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e),
+        )
 
 
 @router.get(
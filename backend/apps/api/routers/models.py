@@ -1,13 +1,12 @@
 from datetime import timedelta
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from backend.contexts.booking.domain import BookingAggregate
+from backend.contexts.parkinglot.application import OccupancyChange
 from backend.contexts.parkinglot.domain import (
     Coordinates,
     ParkingSpace,
-    ParkinglotAggregate,
     Price,
 )
 from backend.contexts.shared.domain import BookingId, ParkinglotId
@@ -24,10 +23,6 @@ class CreateBookingRequest(BaseModel):
     duration: Optional[timedelta] = None
 
 
-class ListBookingResponse(BaseModel):
-    bookings: List[BookingAggregate]
-
-
 class CreateParkinglotRequest(BaseModel):
     parkinglot_id: ParkinglotId
     name: str
@@ -36,9 +31,16 @@ class CreateParkinglotRequest(BaseModel):
     price: Price
 
 
-class ListParkinglotsResponse(BaseModel):
-    parkinglots: List[ParkinglotAggregate]
-
-
 class ListParkinglotsSpacesResponse(BaseModel):
     spaces: List[ParkingSpace]
+
+
+class ViewportSearchRequest(BaseModel):
+    polygon: List[Coordinates] = Field(..., min_items=3, max_items=100)
+    limit: int = Field(100, gt=0, le=500)
+    min_free_spaces: int = Field(1, ge=0)
+    max_price: Optional[Price] = Field(None, ge=0)
+
+
+class OccupancyChangesRequest(BaseModel):
+    changes: List[OccupancyChange] = Field(..., min_items=1, max_items=500)
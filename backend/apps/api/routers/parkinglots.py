@@ -1,23 +1,26 @@
 from decimal import Decimal
-from typing import Annotated, List
+from typing import Annotated, List, Optional
 from uuid import UUID
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Body, Depends, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
 from fastapi.responses import JSONResponse
 
 from backend.apps.api.dependencies import get_owner_id, get_user_id
 from backend.apps.api.routers.models import (
     CreateParkinglotRequest,
-    ListParkinglotsResponse,
     ListParkinglotsSpacesResponse,
     Message,
+    OccupancyChangesRequest,
 )
 from backend.apps.container import Container
+from backend.contexts.booking import application as bookings
+from backend.contexts.booking.domain import BookingRepository, BookingState
 from backend.contexts.parkinglot import application as parkinglots
 from backend.contexts.parkinglot.domain import ParkinglotAggregate, ParkinglotRepository
 from backend.contexts.shared.domain import (
     EventBus,
+    InvalidCursor,
     OwnerId,
     ParkinglotId,
     ParkingSpaceId,
@@ -49,17 +52,23 @@ def create_parkinglot(
 @router.get(
     "",
     responses={
-        status.HTTP_200_OK: {"model": ListParkinglotsResponse},
+        status.HTTP_200_OK: {"model": parkinglots.ListParkinglotsResponse},
     },
 )
 @inject
 def list_parkinglots(
     owner_id: OwnerId = Depends(get_owner_id),
     repo: ParkinglotRepository = Depends(Provide[Container.parkinglot_repository]),
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Annotated[Optional[str], Query()] = None,
 ):
-    return ListParkinglotsResponse(
-        parkinglots=parkinglots.list_parkinglots(owner_id, repo)
-    )
+    try:
+        return parkinglots.list_parkinglots(owner_id, repo, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e),
+        )
 
 
 @router.get(
@@ -75,7 +84,11 @@ def get_parkinglot(
     owner_id: OwnerId = Depends(get_owner_id),
     repo: ParkinglotRepository = Depends(Provide[Container.parkinglot_repository]),
 ):
-    if not (parkinglot := repo.get(parkinglot_id, owner_id)):
+    if not (
+        parkinglot := parkinglots.get_parkinglot_aggregate(
+            owner_id, parkinglot_id, repo
+        )
+    ):
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
             content=Message(message="Parkinglot not found").dict(),
@@ -153,6 +166,43 @@ def list_spaces(
     )
 
 
+@router.get(
+    "/{parkinglot_id}/bookings",
+    responses={
+        status.HTTP_200_OK: {"model": bookings.ListBookingsResponse},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
+)
+@inject
+def list_bookings(
+    parkinglot_id: ParkinglotId,
+    owner_id: OwnerId = Depends(get_owner_id),
+    repo: ParkinglotRepository = Depends(Provide[Container.parkinglot_repository]),
+    booking_repo: BookingRepository = Depends(Provide[Container.booking_repository]),
+    state: Annotated[BookingState, Query()] = BookingState.ACCOMMODATED,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Annotated[Optional[str], Query()] = None,
+):
+    if not parkinglots.is_parkinglot_owner(parkinglot_id, owner_id, repo):
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content=Message(message="Parkinglot not found").dict(),
+        )
+    try:
+        return bookings.list_parkinglot_bookings(
+            parkinglot_id=parkinglot_id,
+            state=state,
+            repo=booking_repo,
+            limit=limit,
+            cursor=cursor,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e),
+        )
+
+
 @router.put("/{parkinglot_id}/spaces/{space_id}/take")
 @inject
 def take_space(
@@ -187,3 +237,23 @@ def release_space(
         repo=repo,
         bus=bus,
     )
+
+
+@router.post(
+    "/{parkinglot_id}/spaces/occupancy", status_code=status.HTTP_204_NO_CONTENT
+)
+@inject
+def apply_occupancy(
+    parkinglot_id: ParkinglotId,
+    data: OccupancyChangesRequest,
+    concentrator_id: str = Depends(get_user_id),
+    repo: ParkinglotRepository = Depends(Provide[Container.parkinglot_repository]),
+    bus: EventBus = Depends(Provide[Container.eventbus]),
+) -> None:
+    return parkinglots.concentrator_apply_occupancy(
+        parkinglot_id=parkinglot_id,
+        changes=data.changes,
+        concentrator_id=concentrator_id,
+        repo=repo,
+        bus=bus,
+    )
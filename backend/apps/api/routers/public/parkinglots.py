@@ -1,54 +1,128 @@
-from typing import List
-from fastapi import APIRouter, Depends, status
+import re
+from typing import Callable, List, Optional, Tuple
+
+from dependency_injector.wiring import Provide, inject
+from fastapi import APIRouter, Depends, Header, Response, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from backend.apps.api.routers.models import Message
-from backend.contexts.parkinglot.domain import ParkinglotRepository
 
-from backend.contexts.shared.domain import ParkinglotId
-
-from dependency_injector.wiring import Provide, inject
+from backend.apps.api.routers.models import Message
 from backend.apps.container import Container
 from backend.contexts.parkinglot import application as parkinglots
+from backend.contexts.parkinglot.domain import ParkinglotRepository
+from backend.contexts.shared.domain import ParkinglotId
+from backend.contexts.shared.infrastructure import TTLCache
 
 router = APIRouter()
 
+# public bodies by endpoint and lot, along with the lot version they show
+PublicView = Tuple[int, BaseModel]
+PublicCache = TTLCache[Tuple[str, ParkinglotId], PublicView]
+
+
+class ListParkinglotSpacesResponse(BaseModel):
+    spaces: List[parkinglots.Space]
+
+
+def requested_versions(if_none_match: Optional[str]) -> List[int]:
+    return [int(v) for v in re.findall(r'"(\d+)"', if_none_match or "")]
+
+
+# every change to a lot or its spaces bumps the lot version, so a client
+# polling an unchanged lot gets a 304 from the cache or from a projected
+# read of the version, without the lot being loaded
+def conditional_get(
+    key: Tuple[str, ParkinglotId],
+    if_none_match: Optional[str],
+    get_version: Callable[[], Optional[int]],
+    load: Callable[[], Optional[PublicView]],
+    cache: PublicCache,
+) -> Response:
+    versions = requested_versions(if_none_match)
+    view = cache.get(key)
+    # the client already saw a newer version than the cached one
+    if view and versions and max(versions) > view[0]:
+        cache.invalidate(key)
+        view = None
+    if not view:
+        if versions and (version := get_version()) in versions:
+            return not_modified(version)
+        if not (view := load()):
+            return JSONResponse(
+                status_code=status.HTTP_404_NOT_FOUND,
+                content=Message(message="Parkinglot not found").dict(),
+            )
+        cache.set(key, view)
+    version, body = view
+    if version in versions:
+        return not_modified(version)
+    return JSONResponse(
+        content=jsonable_encoder(body),
+        headers={"ETag": f'"{version}"'},
+    )
+
+
+def not_modified(version: int) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": f'"{version}"'},
+    )
+
 
 @router.get(
     "/{parkinglot_id}",
     responses={
         status.HTTP_200_OK: {"model": parkinglots.Parkinglot},
+        status.HTTP_304_NOT_MODIFIED: {"description": "Not modified"},
         status.HTTP_404_NOT_FOUND: {"model": Message},
     },
 )
 @inject
 def get_parkinglot(
     parkinglot_id: ParkinglotId,
+    if_none_match: Optional[str] = Header(None),
     repo: ParkinglotRepository = Depends(Provide[Container.parkinglot_repository]),
+    cache: PublicCache = Depends(Provide[Container.public_parkinglot_cache]),
 ):
-    if not (
-        parkinglot := parkinglots.get_parkinglot(
-            parkinglot_id=parkinglot_id,
-            repo=repo,
-        )
-    ):
-        return JSONResponse(
-            status_code=status.HTTP_404_NOT_FOUND,
-            content=Message(message="Parkinglot not found").dict(),
-        )
-    return parkinglot
+    def load() -> Optional[PublicView]:
+        if not (parkinglot := parkinglots.get_parkinglot(parkinglot_id, repo)):
+            return None
+        return parkinglot.version, parkinglot
 
-
-class ListParkinglotSpacesResponse(BaseModel):
-    spaces: List[parkinglots.Space]
+    return conditional_get(
+        key=("parkinglot", parkinglot_id),
+        if_none_match=if_none_match,
+        get_version=lambda: parkinglots.get_parkinglot_version(parkinglot_id, repo),
+        load=load,
+        cache=cache,
+    )
 
 
-@router.get("/{parkinglot_id}/spaces", response_model=ListParkinglotSpacesResponse)
+@router.get(
+    "/{parkinglot_id}/spaces",
+    responses={
+        status.HTTP_200_OK: {"model": ListParkinglotSpacesResponse},
+        status.HTTP_304_NOT_MODIFIED: {"description": "Not modified"},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
+)
 @inject
 def get_parkinglot_spaces(
     parkinglot_id: ParkinglotId,
+    if_none_match: Optional[str] = Header(None),
     repo: ParkinglotRepository = Depends(Provide[Container.parkinglot_repository]),
+    cache: PublicCache = Depends(Provide[Container.public_parkinglot_cache]),
 ):
-    return ListParkinglotSpacesResponse(
-        spaces=parkinglots.get_parkinglot_spaces(parkinglot_id=parkinglot_id, repo=repo)
+    def load() -> Optional[PublicView]:
+        if not (spaces := parkinglots.get_parkinglot_spaces(parkinglot_id, repo)):
+            return None
+        return spaces.version, ListParkinglotSpacesResponse(spaces=spaces.spaces)
+
+    return conditional_get(
+        key=("spaces", parkinglot_id),
+        if_none_match=if_none_match,
+        get_version=lambda: parkinglots.get_parkinglot_version(parkinglot_id, repo),
+        load=load,
+        cache=cache,
     )
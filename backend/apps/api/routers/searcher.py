@@ -1,10 +1,18 @@
-from typing import Annotated, Optional
+from decimal import Decimal
+from typing import Annotated, Iterator, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 
+from backend.apps.api.routers.models import ViewportSearchRequest
 from backend.apps.container import Container
 from backend.contexts.searcher import application as searcher
-from backend.contexts.searcher.domain import ParkinglotSearchRepository
+from backend.contexts.searcher.domain import (
+    ParkinglotSearchRepository,
+    SearchFilter,
+    ViewportTooLarge,
+)
+from backend.contexts.shared.domain import InvalidCursor
 from dependency_injector.wiring import Provide, inject
 
 router = APIRouter()
@@ -22,27 +30,151 @@ def search(
     start_distance: Annotated[int, Query(ge=0)] = 0,
     end_distance: Annotated[int, Query(ge=0)] = 10,
     limit: Annotated[int, Query()] = 10,
+    min_free_spaces: Annotated[int, Query(ge=0)] = 1,
+    max_price: Annotated[Optional[Decimal], Query(ge=0)] = None,
+    cursor: Annotated[Optional[str], Query()] = None,
+    stream: Annotated[bool, Query()] = False,
 ) -> searcher.SearchResponse:
-    if central_cell:
-        return searcher.search_by_cell(
-            central_cell=central_cell,
-            start_distance=start_distance,
-            end_distance=end_distance,
-            limit=limit,
-            repo=repo,
-        )
+    search_filter = SearchFilter(min_free_spaces=min_free_spaces, max_price=max_price)
+    if stream and not cursor:
+        rings: Optional[Iterator[searcher.SearchRing]] = None
+        if central_cell:
+            rings = searcher.iter_search_by_cell(
+                central_cell=central_cell,
+                start_distance=start_distance,
+                end_distance=end_distance,
+                limit=limit,
+                repo=repo,
+                search_filter=search_filter,
+            )
+        elif lat and lng:
+            rings = searcher.iter_search_by_coordinates(
+                lat=lat,
+                lng=lng,
+                start_distance=start_distance,
+                end_distance=end_distance,
+                limit=limit,
+                repo=repo,
+                search_filter=search_filter,
+            )
+        if rings:
+            return StreamingResponse(
+                (f"{ring.json()}\n" for ring in rings),
+                media_type="application/x-ndjson",
+            )
 
-    if lat and lng:
-        return searcher.search_by_coordinates(
-            lat=lat,
-            lng=lng,
-            start_distance=start_distance,
-            end_distance=end_distance,
-            limit=limit,
-            repo=repo,
+    try:
+        if central_cell:
+            return searcher.search_by_cell(
+                central_cell=central_cell,
+                start_distance=start_distance,
+                end_distance=end_distance,
+                limit=limit,
+                repo=repo,
+                search_filter=search_filter,
+                cursor=cursor,
+            )
+
+        if lat and lng:
+            return searcher.search_by_coordinates(
+                lat=lat,
+                lng=lng,
+                start_distance=start_distance,
+                end_distance=end_distance,
+                limit=limit,
+                repo=repo,
+                search_filter=search_filter,
+                cursor=cursor,
+            )
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e),
         )
 
     raise HTTPException(
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         detail="lat and lng or cell must not be null",
     )
+
+
+@router.get("/nearest")
+@inject
+def search_nearest(
+    lat: Annotated[float, Query(ge=-90, le=90)],
+    lng: Annotated[float, Query(gt=-180, le=180)],
+    radius_m: Annotated[float, Query(gt=0, le=10_000)] = 1_000,
+    limit: Annotated[int, Query(gt=0, le=100)] = 10,
+    min_free_spaces: Annotated[int, Query(ge=0)] = 1,
+    max_price: Annotated[Optional[Decimal], Query(ge=0)] = None,
+    repo: ParkinglotSearchRepository = Depends(
+        Provide[Container.parkinglot_search_repository]
+    ),
+) -> searcher.NearestResponse:
+    return searcher.search_nearest(
+        lat=lat,
+        lng=lng,
+        radius_m=radius_m,
+        limit=limit,
+        repo=repo,
+        search_filter=SearchFilter(
+            min_free_spaces=min_free_spaces, max_price=max_price
+        ),
+    )
+
+
+@router.get("/viewport")
+@inject
+def search_bbox(
+    south: Annotated[float, Query(ge=-90, le=90)],
+    west: Annotated[float, Query(gt=-180, le=180)],
+    north: Annotated[float, Query(ge=-90, le=90)],
+    east: Annotated[float, Query(gt=-180, le=180)],
+    limit: Annotated[int, Query(gt=0, le=500)] = 100,
+    min_free_spaces: Annotated[int, Query(ge=0)] = 1,
+    max_price: Annotated[Optional[Decimal], Query(ge=0)] = None,
+    repo: ParkinglotSearchRepository = Depends(
+        Provide[Container.parkinglot_search_repository]
+    ),
+) -> searcher.ViewportResponse:
+    try:
+        return searcher.search_bbox(
+            south=south,
+            west=west,
+            north=north,
+            east=east,
+            limit=limit,
+            repo=repo,
+            search_filter=SearchFilter(
+                min_free_spaces=min_free_spaces, max_price=max_price
+            ),
+        )
+    except ViewportTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e),
+        )
+
+
+@router.post("/viewport")
+@inject
+def search_viewport(
+    data: ViewportSearchRequest,
+    repo: ParkinglotSearchRepository = Depends(
+        Provide[Container.parkinglot_search_repository]
+    ),
+) -> searcher.ViewportResponse:
+    try:
+        return searcher.search_viewport(
+            polygon=[(float(c.lat), float(c.lng)) for c in data.polygon],
+            limit=data.limit,
+            repo=repo,
+            search_filter=SearchFilter(
+                min_free_spaces=data.min_free_spaces, max_price=data.max_price
+            ),
+        )
+    except ViewportTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e),
+        )
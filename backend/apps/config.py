@@ -8,8 +8,19 @@ Env = Literal["local", "aws_lambda_mangum"]
 class Settings(BaseSettings):
     dynamo_table: str = ""
     h3_cell_index: str = ""
+    h3_cell_r6_index: str = ""
+    h3_cell_r7_index: str = ""
     inverted_index: str = ""
+    expiry_index: str = ""
+    parkinglot_bookings_index: str = ""
     sns_topic_arn: str = ""
+    search_max_workers: int = 8
+    search_cache_size: int = 10_000
+    search_cache_ttl: float = 5
+    resolve_cache_size: int = 10_000
+    sweeper_batch_size: int = 100
+    public_cache_size: int = 10_000
+    public_cache_ttl: float = 5
     env: Env = "local"
     test_user_id: str = "3fa85f64-5717-4562-b3fc-2c963f66afa6"
 
@@ -10,10 +10,15 @@ from backend.contexts.parkinglot.infrastructure import (
     RamParkinglotRepository,
 )
 from backend.contexts.searcher.infraestructure import (
+    CachedParkinglotSearchRepository,
     DynamodbParkinglotSearchRepository,
     RamParkinglotSearchRepository,
 )
-from backend.contexts.shared.infrastructure import RamEventBus, SnsEventBus
+from backend.contexts.shared.infrastructure import (
+    RamEventBus,
+    SnsEventBus,
+    TTLCache,
+)
 
 
 class Container(containers.DeclarativeContainer):
@@ -28,6 +33,8 @@ class Container(containers.DeclarativeContainer):
         DynamodbBookingRepository,
         table_name=config.dynamo_table,
         inverted_index=config.inverted_index,
+        parkinglot_bookings_index=config.parkinglot_bookings_index,
+        driver_cache_size=config.resolve_cache_size,
     )
     booking_repository = providers.Selector(
         config.env,
@@ -42,6 +49,8 @@ class Container(containers.DeclarativeContainer):
         DynamodbParkinglotRepository,
         table_name=config.dynamo_table,
         inverted_index=config.inverted_index,
+        expiry_index=config.expiry_index,
+        owner_cache_size=config.resolve_cache_size,
     )
     parkinglot_repository = providers.Selector(
         config.env,
@@ -49,6 +58,13 @@ class Container(containers.DeclarativeContainer):
         aws_lambda_mangum=dynamo_parkinglot_repository,
     )
 
+    # polled public lot and spaces bodies, shared by every request
+    public_parkinglot_cache = providers.Singleton(
+        TTLCache,
+        maxsize=config.public_cache_size,
+        ttl=config.public_cache_ttl,
+    )
+
     local_parkinglot_search_repository = providers.Singleton(
         RamParkinglotSearchRepository,
     )
@@ -56,12 +72,22 @@ class Container(containers.DeclarativeContainer):
         DynamodbParkinglotSearchRepository,
         table_name=config.dynamo_table,
         index_name=config.h3_cell_index,
+        parent_index_names=providers.Dict(
+            {6: config.h3_cell_r6_index, 7: config.h3_cell_r7_index}
+        ),
+        max_workers=config.search_max_workers,
     )
-    parkinglot_search_repository = providers.Selector(
+    parkinglot_search_backend = providers.Selector(
         config.env,
         local=local_parkinglot_search_repository,
         aws_lambda_mangum=dynamo_parkinglot_search_repository,
     )
+    parkinglot_search_repository = providers.Singleton(
+        CachedParkinglotSearchRepository,
+        repo=parkinglot_search_backend,
+        maxsize=config.search_cache_size,
+        ttl=config.search_cache_ttl,
+    )
 
     local_eventbus = providers.Singleton(RamEventBus)
     sns_eventbus = providers.Singleton(
@@ -1,3 +1,5 @@
+from typing import Any, List
+
 from dependency_injector.wiring import Provide, inject
 
 from backend.apps.container import Container
@@ -5,6 +7,7 @@ from backend.contexts.booking import application as bookings
 from backend.contexts.booking.domain import BookingRepository
 from backend.contexts.parkinglot.domain import (
     BookingAccommodated,
+    BookingExpired,
     BookingRefused,
     DriverArrived,
     DriverLeft,
@@ -65,3 +68,45 @@ def handle_driver_left(
         repo=repo,
         bus=bus,
     )
+
+
+@inject
+def handle_booking_expired(
+    event: BookingExpired,
+    repo: BookingRepository = Provide[Container.booking_repository],
+    bus: EventBus = Provide[Container.eventbus],
+) -> None:
+    return bookings.expire(
+        booking_id=event.booking_id,
+        repo=repo,
+        bus=bus,
+    )
+
+
+def booking_change(event: Any) -> bookings.BookingChange:
+    if isinstance(event, BookingAccommodated):
+        return bookings.accomodate_change(event.price, event.space_id)
+    if isinstance(event, BookingRefused):
+        return bookings.cancel_by_parkinglot_change(ParkinglotId(event.aggregate_id))
+    if isinstance(event, DriverArrived):
+        return bookings.start_change()
+    if isinstance(event, DriverLeft):
+        return bookings.finish_change()
+    if isinstance(event, BookingExpired):
+        return bookings.expire_change()
+    raise ValueError(f"no booking change for {event.event_name}")
+
+
+# the events of a batch for one booking, in the order they were received
+@inject
+def handle_booking_events(
+    events: List[Any],
+    bus: EventBus,
+    repo: BookingRepository = Provide[Container.booking_repository],
+) -> None:
+    return bookings.change_booking(
+        booking_id=events[0].booking_id,
+        changes=[booking_change(event) for event in events],
+        repo=repo,
+        bus=bus,
+    )
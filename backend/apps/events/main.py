@@ -1,11 +1,18 @@
-from typing import Any, Dict, List, Protocol, Tuple, Type
+import json
+import logging
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple, Type, Union
 
 from aws_lambda_typing.context import Context
-from aws_lambda_typing.events import SNSEvent
+from aws_lambda_typing.events import SNSEvent, SQSEvent
+from dependency_injector.wiring import Provide, inject
+from pydantic import BaseModel
 
 from backend.apps.container import Container
 from backend.apps.events.booking import (
     handle_booking_accommodated,
+    handle_booking_events,
+    handle_booking_expired,
     handle_booking_refused,
     handle_driver_arrived,
     handle_driver_left,
@@ -13,6 +20,13 @@ from backend.apps.events.booking import (
 from backend.apps.events.parkinglot import (
     handle_accommodated_booking_canceled,
     handle_booking_created,
+    handle_parkinglot_events,
+)
+from backend.apps.events.searcher import (
+    handle_free_spaces_changed,
+    handle_parkinglot_created,
+    handle_parkinglot_price_changed,
+    handle_search_events,
 )
 from backend.contexts.booking.domain import (
     AccommodatedBookingCanceled,
@@ -21,13 +35,19 @@ from backend.contexts.booking.domain import (
 )
 from backend.contexts.parkinglot.domain import (
     BookingAccommodated,
+    BookingExpired,
     BookingRefused,
     DriverArrived,
     DriverLeft,
+    FreeSpacesChanged,
     ParkinglotCreated,
+    ParkinglotPriceChanged,
     ParkingSpaceCreated,
 )
-from backend.contexts.shared.domain import DomainEvent
+from backend.contexts.shared.domain import DomainEvent, EventBus
+from backend.contexts.shared.infrastructure import RamEventBus
+
+logger = logging.getLogger(__name__)
 
 
 class EventHandler(Protocol):
@@ -41,8 +61,6 @@ def null_handler(event: Any) -> None:
     ...
 
 
-container = Container()
-
 register: Dict[str, Tuple[Type[DomainEvent], List[EventHandler]]] = {
     "BookingCreated": (
         BookingCreated,
@@ -71,7 +89,19 @@ register: Dict[str, Tuple[Type[DomainEvent], List[EventHandler]]] = {
     "ParkinglotCreated": (
         ParkinglotCreated,
         [
-            null_handler,
+            handle_parkinglot_created,
+        ],
+    ),
+    "ParkinglotPriceChanged": (
+        ParkinglotPriceChanged,
+        [
+            handle_parkinglot_price_changed,
+        ],
+    ),
+    "FreeSpacesChanged": (
+        FreeSpacesChanged,
+        [
+            handle_free_spaces_changed,
         ],
     ),
     "BookingAccommodated": (
@@ -98,19 +128,126 @@ register: Dict[str, Tuple[Type[DomainEvent], List[EventHandler]]] = {
             handle_driver_left,
         ],
     ),
+    "BookingExpired": (
+        BookingExpired,
+        [
+            handle_booking_expired,
+        ],
+    ),
 }
 
 
-def handler(event: SNSEvent, context: Context):
-    for record in event["Records"]:
-        event_name = record["Sns"]["MessageAttributes"]["name"]["Value"]
-        raw_event = record["Sns"]["Message"]
+GroupHandler = Callable[[List[Any], EventBus], None]
+
+# events that change the same aggregate within a batch are handled together
+# against one loaded instance, keyed by the aggregate they target
+grouped: Dict[str, Tuple[Callable[[Any], Any], GroupHandler]] = {
+    "BookingCreated": (lambda e: e.parkinglot_id, handle_parkinglot_events),
+    "AccommodatedBookingCanceled": (
+        lambda e: e.parkinglot_id,
+        handle_parkinglot_events,
+    ),
+    "BookingAccommodated": (lambda e: e.booking_id, handle_booking_events),
+    "BookingRefused": (lambda e: e.booking_id, handle_booking_events),
+    "DriverArrived": (lambda e: e.booking_id, handle_booking_events),
+    "DriverLeft": (lambda e: e.booking_id, handle_booking_events),
+    "BookingExpired": (lambda e: e.booking_id, handle_booking_events),
+    "ParkinglotPriceChanged": (lambda e: e.aggregate_id, handle_search_events),
+    "FreeSpacesChanged": (lambda e: e.aggregate_id, handle_search_events),
+}
+
+
+class EventRecord(BaseModel):
+    message_id: str
+    name: str
+    event: Any
+    # queued records are retried one by one through the batch response,
+    # sns records by failing the invocation
+    queued: bool
+
+
+def parse_record(record: Dict[str, Any]) -> Optional[EventRecord]:
+    queued = "Sns" not in record
+    message = json.loads(record["body"]) if queued else record["Sns"]
+    event_name = message["MessageAttributes"]["name"]["Value"]
+    event_type, event_handlers = register.get(event_name, (None, None))
+    if not (event_type and event_handlers):
+        return None
+    return EventRecord(
+        message_id=record["messageId"] if queued else message["MessageId"],
+        name=event_name,
+        event=event_type.parse_raw(message["Message"]),
+        queued=queued,
+    )
+
+
+def group_records(
+    records: List[EventRecord],
+) -> Dict[Tuple[str, str], List[EventRecord]]:
+    groups: Dict[Tuple[str, str], List[EventRecord]] = defaultdict(list)
+    for record in records:
+        if record.name in grouped:
+            aggregate_of, group_handler = grouped[record.name]
+            key = (group_handler.__name__, str(aggregate_of(record.event)))
+        else:
+            key = ("", record.message_id)
+        groups[key].append(record)
+    return groups
 
-        event_type, event_handlers = register.get(event_name, (None, None))
-        if not (event_type and event_handlers):
-            continue
 
-        domain_event = event_type.parse_raw(raw_event)
-        for event_handler in event_handlers:
-            print(f"event: {event_name} | handler: {event_handler.__name__}")
-            event_handler(domain_event)
+def handle_record(record: EventRecord) -> None:
+    _, event_handlers = register[record.name]
+    for event_handler in event_handlers:
+        print(f"event: {record.name} | handler: {event_handler.__name__}")
+        event_handler(record.event)
+
+
+# returns the message ids of the records that failed on their own
+def handle_records(records: List[EventRecord]) -> List[str]:
+    failed = []
+    for record in records:
+        try:
+            handle_record(record)
+        except Exception:
+            if not record.queued:
+                raise
+            logger.exception("event failed: %s", record.name)
+            failed.append(record.message_id)
+    return failed
+
+
+@inject
+def handler(
+    event: Union[SNSEvent, SQSEvent],
+    context: Context,
+    bus: EventBus = Provide[Container.eventbus],
+) -> Dict[str, Any]:
+    records = [
+        parsed
+        for record in event["Records"]
+        if (parsed := parse_record(record))  # type: ignore
+    ]
+    # events of the grouped handlers are published together at the end, the
+    # bus splits them in batches
+    collected = RamEventBus()
+    failed: List[str] = []
+    try:
+        for (group, aggregate_id), batch in group_records(records).items():
+            if not group:
+                failed.extend(handle_records(batch))
+                continue
+            _, group_handler = grouped[batch[0].name]
+            try:
+                group_handler([r.event for r in batch], collected)
+            except Exception:
+                # whatever the group saved is not undone, the handlers are
+                # safe to run again on their own
+                logger.exception("group failed: %s | %s", group, aggregate_id)
+                failed.extend(handle_records(batch))
+    finally:
+        bus.publish(collected.events)
+    return {"batchItemFailures": [{"itemIdentifier": i} for i in failed]}
+
+
+# created once the handler exists, so wiring also injects into it
+container = Container()
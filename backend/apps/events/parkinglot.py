@@ -1,3 +1,5 @@
+from typing import Any, List
+
 from dependency_injector.wiring import Provide, inject
 
 from backend.apps.container import Container
@@ -35,3 +37,25 @@ def handle_accommodated_booking_canceled(
         repo=repo,
         bus=bus,
     )
+
+
+# the canceled bookings of a lot release their spaces with one save, new
+# bookings reserve theirs with conditional updates that never load the lot
+@inject
+def handle_parkinglot_events(
+    events: List[Any],
+    bus: EventBus,
+    repo: ParkinglotRepository = Provide[Container.parkinglot_repository],
+) -> None:
+    if released := [
+        e.space_id for e in events if isinstance(e, AccommodatedBookingCanceled)
+    ]:
+        parkinglots.release_spaces(
+            parkinglot_id=events[0].parkinglot_id,
+            space_ids=released,
+            repo=repo,
+            bus=bus,
+        )
+    for event in events:
+        if isinstance(event, BookingCreated):
+            handle_booking_created(event, repo=repo, bus=bus)
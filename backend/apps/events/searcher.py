@@ -0,0 +1,72 @@
+from typing import Any, List
+
+from dependency_injector.wiring import Provide, inject
+
+from backend.apps.container import Container
+from backend.contexts.parkinglot.domain import (
+    FreeSpacesChanged,
+    ParkinglotCreated,
+    ParkinglotPriceChanged,
+)
+from backend.contexts.searcher import application as searcher
+from backend.contexts.searcher.domain import ParkinglotSearchRepository
+from backend.contexts.shared.domain import EventBus, ParkinglotId
+
+
+@inject
+def handle_parkinglot_created(
+    event: ParkinglotCreated,
+    repo: ParkinglotSearchRepository = Provide[Container.parkinglot_search_repository],
+) -> None:
+    return searcher.index_parkinglot(
+        parkinglot_id=ParkinglotId(event.aggregate_id),
+        name=event.name,
+        street=event.street,
+        coordinates=event.coordinates,
+        price=event.price,
+        repo=repo,
+    )
+
+
+@inject
+def handle_parkinglot_price_changed(
+    event: ParkinglotPriceChanged,
+    repo: ParkinglotSearchRepository = Provide[Container.parkinglot_search_repository],
+) -> None:
+    return searcher.update_parkinglot_price(
+        parkinglot_id=ParkinglotId(event.aggregate_id),
+        h3cell=event.h3cell,
+        price=event.price,
+        event_id=event.id,
+        repo=repo,
+    )
+
+
+@inject
+def handle_free_spaces_changed(
+    event: FreeSpacesChanged,
+    repo: ParkinglotSearchRepository = Provide[Container.parkinglot_search_repository],
+) -> None:
+    return searcher.update_parkinglot_free_spaces(
+        parkinglot_id=ParkinglotId(event.aggregate_id),
+        h3cell=event.h3cell,
+        free_spaces=event.free_spaces,
+        event_id=event.id,
+        repo=repo,
+    )
+
+
+# a lot only keeps its newest price and free spaces, the older events of a
+# batch are skipped instead of being written and then overwritten
+@inject
+def handle_search_events(
+    events: List[Any],
+    bus: EventBus,
+    repo: ParkinglotSearchRepository = Provide[Container.parkinglot_search_repository],
+) -> None:
+    prices = [e for e in events if isinstance(e, ParkinglotPriceChanged)]
+    if prices:
+        handle_parkinglot_price_changed(max(prices, key=lambda e: e.id), repo=repo)
+    free_spaces = [e for e in events if isinstance(e, FreeSpacesChanged)]
+    if free_spaces:
+        handle_free_spaces_changed(max(free_spaces, key=lambda e: e.id), repo=repo)
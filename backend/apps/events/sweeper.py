@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from aws_lambda_typing.context import Context
+from aws_lambda_typing.events import EventBridgeEvent
+from dependency_injector.wiring import Provide, inject
+
+from backend.apps.container import Container
+from backend.contexts.parkinglot import application as parkinglots
+from backend.contexts.parkinglot.domain import ParkinglotRepository
+from backend.contexts.shared.domain import EventBus
+
+
+@inject
+def handler(
+    event: EventBridgeEvent,
+    context: Context,
+    repo: ParkinglotRepository = Provide[Container.parkinglot_repository],
+    bus: EventBus = Provide[Container.eventbus],
+    limit: int = Provide[Container.config.sweeper_batch_size],
+) -> None:
+    parkinglots.release_expired_bookings(
+        now=datetime.now(),
+        limit=limit,
+        repo=repo,
+        bus=bus,
+    )
+
+
+# created once the handler exists, so wiring also injects into it
+container = Container()
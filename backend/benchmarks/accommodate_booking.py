@@ -0,0 +1,67 @@
+"""
+Cost of ParkinglotAggregate.accommodate_booking and release_space by lot size,
+on a lot loaded with every space but the last one booked.
+
+    python -m backend.benchmarks.accommodate_booking
+"""
+import time
+import uuid
+from decimal import Decimal
+
+from backend.contexts.parkinglot.domain import Coordinates, ParkinglotAggregate
+from backend.contexts.shared.domain import (
+    BookingId,
+    DriverId,
+    OwnerId,
+    ParkinglotId,
+    ParkingSpaceId,
+)
+
+SIZES = [10, 1_000, 10_000]
+REPEAT = 1_000
+
+
+def make_parkinglot(spaces: int) -> str:
+    parkinglot = ParkinglotAggregate.create(
+        parkinglot_id=ParkinglotId(str(uuid.uuid4())),
+        owner_id=OwnerId(str(uuid.uuid4())),
+        name="bench",
+        street="bench",
+        coordinates=Coordinates(lat=Decimal("-34.6037"), lng=Decimal("-58.3816")),
+        price=Decimal(100),
+    )
+    parkinglot.register_spaces(
+        [ParkingSpaceId(str(uuid.uuid4())) for _ in range(spaces)]
+    )
+    driver_id = DriverId(str(uuid.uuid4()))
+    for _ in range(spaces - 1):
+        parkinglot.accommodate_booking(driver_id, BookingId())
+    return parkinglot.json()
+
+
+def main() -> None:
+    driver_id = DriverId(str(uuid.uuid4()))
+    print(f"{'spaces':>8} {'first (us)':>12} {'book+release (us)':>18}")
+    for size in SIZES:
+        parkinglot = ParkinglotAggregate.parse_raw(make_parkinglot(size))
+
+        # the first booking after loading pays for building the indexes
+        start = time.perf_counter()
+        booking_id = BookingId()
+        parkinglot.accommodate_booking(driver_id, booking_id)
+        first = time.perf_counter() - start
+        space_id = parkinglot.pull_events()[0].space_id
+        parkinglot.release_space(space_id)
+
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            parkinglot.accommodate_booking(driver_id, BookingId())
+            parkinglot.release_space(parkinglot.pull_events()[0].space_id)
+            parkinglot.pull_events()
+        cycle = (time.perf_counter() - start) / REPEAT
+
+        print(f"{size:>8} {first * 1e6:>12.1f} {cycle * 1e6:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
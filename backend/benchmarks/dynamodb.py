@@ -0,0 +1,114 @@
+import os
+import time
+from typing import Any
+
+import boto3
+
+TABLE_NAME = "smartparking-bench"
+H3_CELL_INDEX = "H3CellR8Index"
+H3_CELL_PARENT_INDEXES = {6: "H3CellR6Index", 7: "H3CellR7Index"}
+INVERTED_INDEX = "InvertedIndex"
+EXPIRY_INDEX = "ExpiryIndex"
+PARKINGLOT_BOOKINGS_INDEX = "ParkinglotBookingsIndex"
+TTL_ATTRIBUTE = "ttl"
+
+
+def setup_aws_env() -> None:
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+
+def create_table() -> Any:
+    resource = boto3.resource("dynamodb")
+    table = resource.create_table(
+        TableName=TABLE_NAME,
+        AttributeDefinitions=[
+            {"AttributeName": "pk", "AttributeType": "S"},
+            {"AttributeName": "sk", "AttributeType": "S"},
+            {"AttributeName": "h3cell_r8", "AttributeType": "S"},
+            {"AttributeName": "expiry_bucket", "AttributeType": "S"},
+            {"AttributeName": "expires_at", "AttributeType": "S"},
+            {"AttributeName": "parkinglot_state", "AttributeType": "S"},
+            *(
+                {"AttributeName": f"h3cell_r{resolution}", "AttributeType": "S"}
+                for resolution in H3_CELL_PARENT_INDEXES
+            ),
+        ],
+        KeySchema=[
+            {"AttributeName": "pk", "KeyType": "HASH"},
+            {"AttributeName": "sk", "KeyType": "RANGE"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": H3_CELL_INDEX,
+                "KeySchema": [
+                    {"AttributeName": "h3cell_r8", "KeyType": "HASH"},
+                    {"AttributeName": "sk", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            },
+            *(
+                {
+                    "IndexName": index_name,
+                    "KeySchema": [
+                        {"AttributeName": f"h3cell_r{resolution}", "KeyType": "HASH"},
+                        {"AttributeName": "sk", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                }
+                for resolution, index_name in H3_CELL_PARENT_INDEXES.items()
+            ),
+            {
+                "IndexName": INVERTED_INDEX,
+                "KeySchema": [
+                    {"AttributeName": "sk", "KeyType": "HASH"},
+                    {"AttributeName": "pk", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "KEYS_ONLY"},
+            },
+            {
+                "IndexName": EXPIRY_INDEX,
+                "KeySchema": [
+                    {"AttributeName": "expiry_bucket", "KeyType": "HASH"},
+                    {"AttributeName": "expires_at", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "KEYS_ONLY"},
+            },
+            {
+                "IndexName": PARKINGLOT_BOOKINGS_INDEX,
+                "KeySchema": [
+                    {"AttributeName": "parkinglot_state", "KeyType": "HASH"},
+                    {"AttributeName": "sk", "KeyType": "RANGE"},
+                ],
+                "Projection": {
+                    "ProjectionType": "INCLUDE",
+                    "NonKeyAttributes": [
+                        "parkinglot_id",
+                        "description",
+                        "state",
+                        "duration",
+                        "price",
+                        "created_on",
+                        "start_time",
+                        "end_time",
+                    ],
+                },
+            },
+        ],
+    )
+    table.wait_until_exists()
+    table.meta.client.update_time_to_live(
+        TableName=TABLE_NAME,
+        TimeToLiveSpecification={"Enabled": True, "AttributeName": TTL_ATTRIBUTE},
+    )
+    return table
+
+
+def add_latency(table: Any, seconds: float) -> Any:
+    def sleep(**kwargs: Any) -> None:
+        time.sleep(seconds)
+
+    table.meta.client.meta.events.register("before-call.dynamodb", sleep)
+    return table
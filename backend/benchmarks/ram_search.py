@@ -0,0 +1,98 @@
+"""
+Search throughput of RamParkinglotSearchRepository loaded with synthetic lots.
+
+    python -m backend.benchmarks.ram_search
+"""
+import random
+import time
+import uuid
+from decimal import Decimal
+from typing import Callable, List, Tuple
+
+import h3
+
+from backend.contexts.parkinglot.domain import Coordinates
+from backend.contexts.searcher.application import (
+    index_parkinglot,
+    search_by_cell,
+    search_nearest,
+)
+from backend.contexts.searcher.infraestructure import RamParkinglotSearchRepository
+from backend.contexts.shared.domain import ParkinglotId
+
+PARKINGLOTS = 100_000
+SEARCHES = 2_000
+CENTER = (-34.6037, -58.3816)
+SPREAD = 0.25
+
+
+def random_point(rng: random.Random) -> Tuple[float, float]:
+    return (
+        CENTER[0] + rng.uniform(-SPREAD, SPREAD),
+        CENTER[1] + rng.uniform(-SPREAD, SPREAD),
+    )
+
+
+def load(repo: RamParkinglotSearchRepository, rng: random.Random) -> None:
+    for i in range(PARKINGLOTS):
+        lat, lng = random_point(rng)
+        index_parkinglot(
+            parkinglot_id=ParkinglotId(str(uuid.UUID(int=rng.getrandbits(128)))),
+            name=f"parkinglot {i}",
+            street="street",
+            coordinates=Coordinates(lat=lat, lng=lng),
+            price=Decimal(rng.randint(100, 1_000)),
+            repo=repo,
+        )
+
+
+def measure(name: str, search: Callable[[float, float], int], points: List) -> None:
+    found = 0
+    start = time.perf_counter()
+    for lat, lng in points:
+        found += search(lat, lng)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<32} {len(points) / elapsed:>10.0f} searches/s"
+        f" {elapsed / len(points) * 1000:>8.3f} ms/search"
+        f" {found / len(points):>8.1f} lots/search"
+    )
+
+
+def main() -> None:
+    rng = random.Random(0)
+    repo = RamParkinglotSearchRepository()
+
+    start = time.perf_counter()
+    load(repo, rng)
+    print(f"loaded {PARKINGLOTS} lots in {time.perf_counter() - start:.2f} s")
+
+    points = [random_point(rng) for _ in range(SEARCHES)]
+    for end_distance, limit in [(2, 10), (10, 10), (10, 1_000)]:
+        measure(
+            f"by cell end={end_distance} limit={limit}",
+            lambda lat, lng: len(
+                search_by_cell(
+                    central_cell=h3.latlng_to_cell(lat, lng, 8),
+                    start_distance=0,
+                    end_distance=end_distance,
+                    limit=limit,
+                    repo=repo,
+                ).parkinglots
+            ),
+            points,
+        )
+    for radius_m in [500, 2_000]:
+        measure(
+            f"nearest radius={radius_m}m limit=10",
+            lambda lat, lng: len(
+                search_nearest(
+                    lat=lat, lng=lng, radius_m=radius_m, limit=10, repo=repo
+                ).parkinglots
+            ),
+            points,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Successful bookings per second for one hot lot under concurrent booking
+handlers, saving the whole aggregate against reserving a space with
+conditional updates.
+
+    python -m backend.benchmarks.reserve_space
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any, Callable
+
+from moto import mock_aws
+from moto.core.botocore_stubber import BotocoreStubber
+
+from backend.benchmarks.dynamodb import (
+    INVERTED_INDEX,
+    TABLE_NAME,
+    add_latency,
+    create_table,
+    setup_aws_env,
+)
+from backend.contexts.parkinglot.domain import Coordinates, ParkinglotAggregate
+from backend.contexts.parkinglot.infrastructure import DynamodbParkinglotRepository
+from backend.contexts.shared.domain import (
+    BookingId,
+    ConcurrencyConflict,
+    DriverId,
+    OwnerId,
+    ParkinglotId,
+    ParkingSpaceId,
+)
+
+SPACES = 100
+BOOKINGS = 80
+WORKERS = 16
+LATENCY = 0.005
+
+
+def serialize_requests() -> None:
+    # moto is not thread safe, one request at a time stands in for the per
+    # item atomicity of DynamoDB, the simulated latency stays concurrent
+    lock = threading.Lock()
+    process_request = BotocoreStubber.process_request
+
+    def locked(self: BotocoreStubber, request: Any) -> Any:
+        with lock:
+            return process_request(self, request)
+
+    BotocoreStubber.process_request = locked  # type: ignore[method-assign]
+
+
+def make_parkinglot() -> ParkinglotAggregate:
+    parkinglot = ParkinglotAggregate.create(
+        parkinglot_id=ParkinglotId(str(uuid.uuid4())),
+        owner_id=OwnerId(str(uuid.uuid4())),
+        name="bench",
+        street="bench",
+        coordinates=Coordinates(lat=Decimal("-34.6037"), lng=Decimal("-58.3816")),
+        price=Decimal(100),
+    )
+    parkinglot.register_spaces(
+        [ParkingSpaceId(str(uuid.uuid4())) for _ in range(SPACES)]
+    )
+    return parkinglot
+
+
+def save_aggregate(
+    repo: DynamodbParkinglotRepository, parkinglot_id: ParkinglotId
+) -> bool:
+    parkinglot = repo.get(parkinglot_id, with_spaces=True)
+    parkinglot.accommodate_booking(DriverId(str(uuid.uuid4())), BookingId())
+    try:
+        repo.save(parkinglot)
+    except ConcurrencyConflict:
+        return False
+    return True
+
+
+def reserve(repo: DynamodbParkinglotRepository, parkinglot_id: ParkinglotId) -> bool:
+    reservation = repo.reserve_space(
+        parkinglot_id, DriverId(str(uuid.uuid4())), BookingId()
+    )
+    return bool(reservation and reservation.space_id)
+
+
+def run(book: Callable[[DynamodbParkinglotRepository, ParkinglotId], bool]) -> None:
+    parkinglot = make_parkinglot()
+    DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX).save(parkinglot)
+    local = threading.local()
+
+    def handle(_: int) -> bool:
+        # boto3 resources are not thread safe, each handler gets its own
+        if not hasattr(local, "repo"):
+            local.repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX)
+            add_latency(local.repo._table, LATENCY)
+        return book(local.repo, parkinglot.id)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        succeeded = sum(executor.map(handle, range(BOOKINGS)))
+    elapsed = time.perf_counter() - start
+
+    loaded = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX).get(
+        parkinglot.id, with_spaces=True
+    )
+    booked = sum(1 for s in loaded.spaces if s.booking_id)
+    print(
+        f"{book.__name__:>15} {succeeded:>9}/{BOOKINGS} {succeeded / elapsed:>10.1f}"
+        f" {booked:>7} {loaded.free_spaces:>6}"
+    )
+
+
+def main() -> None:
+    setup_aws_env()
+    serialize_requests()
+    with mock_aws():
+        create_table()
+        print(f"{WORKERS} handlers, simulated round trip: {LATENCY * 1000:.0f} ms")
+        print(
+            f"{'path':>15} {'succeeded':>13} {'booked/s':>10} {'booked':>7} {'free':>6}"
+        )
+        run(save_aggregate)
+        run(reserve)
+
+
+if __name__ == "__main__":
+    main()
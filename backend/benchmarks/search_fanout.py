@@ -0,0 +1,98 @@
+"""
+Latency of DynamodbParkinglotSearchRepository.query by ring size, sequential
+(one worker) against the bounded worker pool.
+
+    python -m backend.benchmarks.search_fanout
+
+moto answers one request at a time, so only the simulated round trip runs
+concurrently and the speedup shown here is far below what the pool gets
+against DynamoDB. Point boto3 at DynamoDB Local or a real table, through
+AWS_ENDPOINT_URL_DYNAMODB and without mock_aws, to measure it.
+"""
+import time
+import uuid
+from statistics import median
+from typing import Any, List
+
+import h3
+from moto import mock_aws
+
+from backend.benchmarks.dynamodb import (
+    H3_CELL_INDEX,
+    H3_CELL_PARENT_INDEXES,
+    TABLE_NAME,
+    add_latency,
+    create_table,
+    setup_aws_env,
+)
+from backend.contexts.searcher.application import ring
+from backend.contexts.searcher.infraestructure import (
+    DynamodbParkinglotSearchRepository,
+    h3_index_attributes,
+)
+
+CENTRAL_CELL = h3.latlng_to_cell(-34.6037, -58.3816, 8)
+RINGS = [0, 1, 2, 5, 10]
+WORKERS = [1, 8, 16]
+LATENCY = 0.01
+REPEAT = 5
+
+
+class LatencyParkinglotSearchRepository(DynamodbParkinglotSearchRepository):
+    def _create_table(self) -> Any:
+        return add_latency(super()._create_table(), LATENCY)
+
+
+def populate(table: Any, cells: List[str]) -> None:
+    with table.batch_writer() as batch:
+        for cell in cells:
+            lat, lng = h3.cell_to_latlng(cell)
+            parkinglot_id = str(uuid.uuid4())
+            batch.put_item(
+                Item={
+                    "pk": f"PARKINGLOT::{parkinglot_id}",
+                    "sk": f"SEARCH::{parkinglot_id}",
+                    "parkinglot_id": parkinglot_id,
+                    **h3_index_attributes(cell),
+                    "name": "bench",
+                    "street": "bench",
+                    "coordinates": {"lat": str(lat), "lng": str(lng)},
+                    "price": 100,
+                    "free_spaces": 10,
+                }
+            )
+
+
+def measure(repo: DynamodbParkinglotSearchRepository, cells: List[str]) -> float:
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        repo.query(cells)
+        samples.append(time.perf_counter() - start)
+    return median(samples) * 1000
+
+
+def main() -> None:
+    setup_aws_env()
+    with mock_aws():
+        table = create_table()
+        populate(table, h3.grid_disk(CENTRAL_CELL, max(RINGS)))
+        repos = {
+            w: LatencyParkinglotSearchRepository(
+                TABLE_NAME, H3_CELL_INDEX, H3_CELL_PARENT_INDEXES, w
+            )
+            for w in WORKERS
+        }
+        print(f"simulated round trip: {LATENCY * 1000:.0f} ms")
+        print("ring  cells" + "".join(f"  workers={w:<3} ms" for w in WORKERS))
+        for distance in RINGS:
+            cells = ring(CENTRAL_CELL, distance)
+            timings = [measure(repos[w], cells) for w in WORKERS]
+            print(
+                f"{distance:>4}  {len(cells):>5}"
+                + "".join(f"  {t:>14.1f}" for t in timings)
+            )
+
+
+if __name__ == "__main__":
+    main()
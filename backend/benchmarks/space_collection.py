@@ -0,0 +1,88 @@
+"""
+Memory and time to load a lot with its spaces from DynamoDB items and to
+serialize it for the api, by lot size, with half the spaces booked.
+
+    python -m backend.benchmarks.space_collection
+"""
+import json
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any, Dict
+
+from backend.contexts.parkinglot.domain import Coordinates, ParkinglotAggregate
+from backend.contexts.shared.domain import (
+    BookingId,
+    DriverId,
+    OwnerId,
+    ParkinglotId,
+    ParkingSpaceId,
+)
+
+SIZES = [100, 2_000, 10_000]
+REPEAT = 5
+
+
+# the lot and space items as the repository reads them
+def make_item(spaces: int) -> Dict[str, Any]:
+    parkinglot = ParkinglotAggregate.create(
+        parkinglot_id=ParkinglotId(str(uuid.uuid4())),
+        owner_id=OwnerId(str(uuid.uuid4())),
+        name="bench",
+        street="bench",
+        coordinates=Coordinates(lat=Decimal("-34.6037"), lng=Decimal("-58.3816")),
+        price=Decimal(100),
+    )
+    parkinglot.register_spaces(
+        [ParkingSpaceId(str(uuid.uuid4())) for _ in range(spaces)]
+    )
+    driver_id = DriverId(str(uuid.uuid4()))
+    for _ in range(spaces // 2):
+        parkinglot.accommodate_booking(driver_id, BookingId(), timedelta(hours=1))
+    item = json.loads(
+        parkinglot.json(exclude={"spaces"}),
+        parse_float=Decimal,
+    )
+    item["spaces"] = [
+        json.loads(s.json(), parse_float=Decimal) for s in parkinglot.spaces
+    ]
+    return item
+
+
+def parse(item: Dict[str, Any]) -> ParkinglotAggregate:
+    return ParkinglotAggregate.parse_obj({**item, "spaces": list(item["spaces"])})
+
+
+def main() -> None:
+    print(
+        f"{'spaces':>8} {'parse (ms)':>11} {'memory (KiB)':>13} "
+        f"{'serialize (ms)':>15}"
+    )
+    for size in SIZES:
+        item = make_item(size)
+
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            parse(item)
+        parse_time = (time.perf_counter() - start) / REPEAT
+
+        tracemalloc.start()
+        parkinglot = parse(item)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            parkinglot.json()
+        serialize_time = (time.perf_counter() - start) / REPEAT
+
+        print(
+            f"{size:>8} {parse_time * 1e3:>11.1f} {memory / 1024:>13.0f} "
+            f"{serialize_time * 1e3:>15.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
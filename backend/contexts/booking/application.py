@@ -1,20 +1,31 @@
 from datetime import timedelta
 from decimal import Decimal
-from typing import List, Optional
+from typing import Callable, List, Optional
+
+from pydantic import BaseModel
 
 from backend.contexts.booking.domain import (
     BookingAggregate,
+    BookingCursor,
+    BookingFilter,
     BookingRepository,
+    BookingState,
+    BookingSummary,
+    InvalidBookingFilter,
 )
+from backend.contexts.shared.application import retry_on_conflict
 from backend.contexts.shared.domain import (
     BookingId,
     DriverId,
     EventBus,
     ParkingSpaceId,
     ParkinglotId,
+    decode_cursor,
+    encode_cursor,
 )
 
 
+@retry_on_conflict()
 def create_booking(
     booking_id: BookingId,
     driver_id: DriverId,
@@ -37,21 +48,7 @@ def create_booking(
     bus.publish(booking_aggregate.pull_events())
 
 
-def cancel_booking_by_parkinglot(
-    booking_id: BookingId,
-    parkinglot_id: ParkinglotId,
-    repo: BookingRepository,
-    bus: EventBus,
-) -> None:
-    if not (booking := repo.get(booking_id)):
-        return
-    if booking.parkinglot_id != parkinglot_id:
-        return
-    booking.cancel()
-    repo.save(booking)
-    bus.publish(booking.pull_events())
-
-
+@retry_on_conflict()
 def cancel_booking_by_driver(
     booking_id: BookingId,
     driver_id: DriverId,
@@ -65,11 +62,45 @@ def cancel_booking_by_driver(
     bus.publish(booking.pull_events())
 
 
+class ListBookingsResponse(BaseModel):
+    bookings: List[BookingSummary]
+    cursor: Optional[str] = None
+
+
 def list_bookings(
     driver_id: DriverId,
     repo: BookingRepository,
-) -> List[BookingAggregate]:
-    return repo.list(driver_id)
+    limit: int = 20,
+    booking_filter: Optional[BookingFilter] = None,
+    cursor: Optional[str] = None,
+) -> ListBookingsResponse:
+    if booking_filter and booking_filter.is_empty_range():
+        raise InvalidBookingFilter
+    start_after = decode_cursor(cursor, BookingCursor).last_id if cursor else None
+    page = repo.list_page(driver_id, limit, booking_filter, start_after)
+    return ListBookingsResponse(
+        bookings=page.bookings,
+        cursor=encode_cursor(BookingCursor(last_id=page.last_id))
+        if page.last_id
+        else None,
+    )
+
+
+def list_parkinglot_bookings(
+    parkinglot_id: ParkinglotId,
+    state: BookingState,
+    repo: BookingRepository,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> ListBookingsResponse:
+    start_after = decode_cursor(cursor, BookingCursor).last_id if cursor else None
+    page = repo.list_active_by_parkinglot(parkinglot_id, state, limit, start_after)
+    return ListBookingsResponse(
+        bookings=page.bookings,
+        cursor=encode_cursor(BookingCursor(last_id=page.last_id))
+        if page.last_id
+        else None,
+    )
 
 
 def get_booking(
@@ -80,30 +111,68 @@ def get_booking(
     return repo.get(booking_id, driver_id)
 
 
-def accomodate(
+BookingChange = Callable[[BookingAggregate], None]
+
+
+# applies what a batch of events brings for one booking against a single
+# load and save, the changes run again on top of a conflicting save
+@retry_on_conflict()
+def change_booking(
     booking_id: BookingId,
-    price: Decimal,
-    space_id: ParkingSpaceId,
+    changes: List[BookingChange],
     repo: BookingRepository,
     bus: EventBus,
 ) -> None:
     if not (booking := repo.get(booking_id)):
         return
-    booking.accomodate(price, space_id)
+    for change in changes:
+        change(booking)
     repo.save(booking)
     bus.publish(booking.pull_events())
 
 
+# what each event from a parkinglot changes in its booking, shared by the
+# use cases below and the handlers that apply a batch of events at once
+def accomodate_change(price: Decimal, space_id: ParkingSpaceId) -> BookingChange:
+    return lambda booking: booking.accomodate(price, space_id)
+
+
+def cancel_by_parkinglot_change(parkinglot_id: ParkinglotId) -> BookingChange:
+    def change(booking: BookingAggregate) -> None:
+        if booking.parkinglot_id == parkinglot_id:
+            booking.cancel()
+
+    return change
+
+
+def start_change() -> BookingChange:
+    return lambda booking: booking.start()
+
+
+def finish_change() -> BookingChange:
+    return lambda booking: booking.finish()
+
+
+def expire_change() -> BookingChange:
+    return lambda booking: booking.expire()
+
+
+def accomodate(
+    booking_id: BookingId,
+    price: Decimal,
+    space_id: ParkingSpaceId,
+    repo: BookingRepository,
+    bus: EventBus,
+) -> None:
+    return change_booking(booking_id, [accomodate_change(price, space_id)], repo, bus)
+
+
 def start(
     booking_id: BookingId,
     repo: BookingRepository,
     bus: EventBus,
 ) -> None:
-    if not (booking := repo.get(booking_id)):
-        return
-    booking.start()
-    repo.save(booking)
-    bus.publish(booking.pull_events())
+    return change_booking(booking_id, [start_change()], repo, bus)
 
 
 def finish(
@@ -111,8 +180,23 @@ def finish(
     repo: BookingRepository,
     bus: EventBus,
 ) -> None:
-    if not (booking := repo.get(booking_id)):
-        return
-    booking.finish()
-    repo.save(booking)
-    bus.publish(booking.pull_events())
+    return change_booking(booking_id, [finish_change()], repo, bus)
+
+
+def expire(
+    booking_id: BookingId,
+    repo: BookingRepository,
+    bus: EventBus,
+) -> None:
+    return change_booking(booking_id, [expire_change()], repo, bus)
+
+
+def cancel_booking_by_parkinglot(
+    booking_id: BookingId,
+    parkinglot_id: ParkinglotId,
+    repo: BookingRepository,
+    bus: EventBus,
+) -> None:
+    return change_booking(
+        booking_id, [cancel_by_parkinglot_change(parkinglot_id)], repo, bus
+    )
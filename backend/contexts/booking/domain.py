@@ -3,6 +3,8 @@ from decimal import Decimal
 from enum import Enum
 from typing import List, Optional, Protocol
 
+from pydantic import BaseModel
+
 from backend.contexts.shared.domain import (
     AggregateRoot,
     BookingId,
@@ -17,6 +19,7 @@ class BookingState(Enum):
     CREATED = "CREATED"
     ACCOMMODATED = "ACCOMMODATED"
     CANCELED = "CANCELED"
+    EXPIRED = "EXPIRED"
 
 
 class AccommodatedBookingCanceled(DomainEvent):
@@ -111,9 +114,66 @@ class BookingAggregate(AggregateRoot):
     def finish(self) -> None:
         self.end_time = datetime.now()
 
+    def expire(self) -> None:
+        if self.state != BookingState.ACCOMMODATED:
+            return
+        self.state = BookingState.EXPIRED
+        self.end_time = datetime.now()
+
     def pay(self) -> None:
         ...
 
+    # waiting for a space, holding one or in progress
+    def is_active(self) -> bool:
+        return (
+            self.state in (BookingState.CREATED, BookingState.ACCOMMODATED)
+            and not self.end_time
+        )
+
+
+class BookingSummary(BaseModel):
+    id: BookingId
+    parkinglot_id: ParkinglotId
+    description: str
+    state: BookingState
+    duration: Optional[timedelta]
+    price: Optional[Decimal]
+    created_on: datetime
+    start_time: Optional[datetime]
+    end_time: Optional[datetime]
+
+
+class BookingFilter(BaseModel):
+    state: Optional[BookingState] = None
+    created_from: Optional[datetime] = None
+    created_until: Optional[datetime] = None
+
+    def is_empty_range(self) -> bool:
+        return bool(
+            self.created_from
+            and self.created_until
+            and self.created_from.timestamp() > self.created_until.timestamp()
+        )
+
+    def matches(self, booking: BookingSummary) -> bool:
+        if self.state and booking.state != self.state:
+            return False
+        created = booking.id.timestamp
+        if self.created_from and created < self.created_from.timestamp():
+            return False
+        if self.created_until and created > self.created_until.timestamp():
+            return False
+        return True
+
+
+class BookingCursor(BaseModel):
+    last_id: BookingId
+
+
+class BookingPage(BaseModel):
+    bookings: List[BookingSummary]
+    last_id: Optional[BookingId] = None
+
 
 class BookingRepository(Protocol):
     def save(self, booking: BookingAggregate) -> None:
@@ -132,7 +192,30 @@ class BookingRepository(Protocol):
     ) -> List[BookingAggregate]:
         ...
 
+    def list_page(
+        self,
+        driver_id: DriverId,
+        limit: int,
+        booking_filter: Optional[BookingFilter] = None,
+        start_after: Optional[BookingId] = None,
+    ) -> BookingPage:
+        ...
+
+    def list_active_by_parkinglot(
+        self,
+        parkinglot_id: ParkinglotId,
+        state: BookingState,
+        limit: int,
+        start_after: Optional[BookingId] = None,
+    ) -> BookingPage:
+        ...
+
 
 class BookingInProgressCannotBeCanceled(Exception):
     def __str__(self) -> str:
         return "Booking in progress cannot be canceled"
+
+
+class InvalidBookingFilter(Exception):
+    def __str__(self) -> str:
+        return "created_from must not be after created_until"
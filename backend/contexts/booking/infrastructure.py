@@ -1,22 +1,64 @@
 import json
+import math
+import threading
+from collections import defaultdict
+from datetime import datetime
 from decimal import Decimal
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set
 
 import boto3
 from boto3.dynamodb.conditions import Attr, Key
 
 from backend.contexts.booking.domain import (
     BookingAggregate,
+    BookingFilter,
+    BookingPage,
     BookingRepository,
+    BookingState,
+    BookingSummary,
 )
-from backend.contexts.shared.domain import BookingId, DriverId
+from backend.contexts.shared.domain import (
+    BookingId,
+    ConcurrencyConflict,
+    DriverId,
+    ParkinglotId,
+)
+from backend.contexts.shared.infrastructure import CacheStats, TTLCache
+
+# attributes of a booking item the listings return
+SUMMARY_ATTRIBUTES = [
+    "sk",
+    "parkinglot_id",
+    "description",
+    "state",
+    "duration",
+    "price",
+    "created_on",
+    "start_time",
+    "end_time",
+]
+
+
+def parkinglot_state(parkinglot_id: ParkinglotId, state: BookingState) -> str:
+    return f"{parkinglot_id}::{state.value}"
 
 
 class DynamodbBookingRepository(BookingRepository):
-    def __init__(self, table_name: str, inverted_index: str) -> None:
+    def __init__(
+        self,
+        table_name: str,
+        inverted_index: str,
+        parkinglot_bookings_index: str = "",
+        driver_cache_size: int = 10_000,
+    ) -> None:
         self._inverted_index = inverted_index
+        self._parkinglot_bookings_index = parkinglot_bookings_index
         resource = boto3.resource("dynamodb")
         self._table = resource.Table(table_name)
+        # a booking never changes driver, entries only leave the cache by size
+        self._drivers: TTLCache[BookingId, DriverId] = TTLCache(
+            driver_cache_size, ttl=math.inf
+        )
 
     def save(self, booking: BookingAggregate) -> None:
         booking.refresh_updated_on()
@@ -24,18 +66,28 @@ class DynamodbBookingRepository(BookingRepository):
             booking.json(exclude={"id", "driver_id", "version"}),
             parse_float=Decimal,
         )
+        # only active bookings are in the sparse index of bookings by lot,
+        # the put drops the attribute once a booking ends
+        if booking.is_active():
+            item["parkinglot_state"] = parkinglot_state(
+                booking.parkinglot_id, booking.state
+            )
 
-        self._table.put_item(
-            Item={
-                "pk": str(booking.driver_id),
-                "sk": f"BOOKING::{booking.id}",
-                "version": booking.version + 1,
-                **item,
-            },
-            ConditionExpression=(
-                Attr("version").not_exists() | Attr("version").eq(booking.version)
-            ),
-        )
+        try:
+            self._table.put_item(
+                Item={
+                    "pk": str(booking.driver_id),
+                    "sk": f"BOOKING::{booking.id}",
+                    "version": booking.version + 1,
+                    **item,
+                },
+                ConditionExpression=(
+                    Attr("version").not_exists() | Attr("version").eq(booking.version)
+                ),
+            )
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException as e:
+            raise ConcurrencyConflict(str(booking.id)) from e
+        self._drivers.set(booking.id, booking.driver_id)
 
     def get(
         self,
@@ -59,15 +111,117 @@ class DynamodbBookingRepository(BookingRepository):
         self,
         driver_id: DriverId,
     ) -> List[BookingAggregate]:
-        items = self._table.query(
-            KeyConditionExpression=(
+        kwargs: Dict[str, Any] = {
+            "KeyConditionExpression": (
                 Key("pk").eq(str(driver_id)) & Key("sk").begins_with("BOOKING::")
             ),
-            ScanIndexForward=False,
-        )["Items"]
+            "ScanIndexForward": False,
+        }
+        items: List[Dict[str, Any]] = []
+        while True:
+            response = self._table.query(**kwargs)
+            items.extend(response["Items"])
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
 
         return [self._item_to_booking(item) for item in items]
 
+    # newest first, the creation dates bound the sort key because booking
+    # ids are ulids
+    def list_page(
+        self,
+        driver_id: DriverId,
+        limit: int,
+        booking_filter: Optional[BookingFilter] = None,
+        start_after: Optional[BookingId] = None,
+    ) -> BookingPage:
+        booking_filter = booking_filter or BookingFilter()
+        names = {f"#p{i}": name for i, name in enumerate(SUMMARY_ATTRIBUTES)}
+        kwargs: Dict[str, Any] = {
+            "KeyConditionExpression": Key("pk").eq(str(driver_id))
+            & Key("sk").between(
+                self._sk_bound(booking_filter.created_from, 0x00),
+                self._sk_bound(booking_filter.created_until, 0xFF),
+            ),
+            "ProjectionExpression": ", ".join(names),
+            "ExpressionAttributeNames": names,
+            "ScanIndexForward": False,
+        }
+        if booking_filter.state:
+            kwargs["FilterExpression"] = Attr("state").eq(booking_filter.state.value)
+        start_key = (
+            {"pk": str(driver_id), "sk": self._format_sk(start_after)}
+            if start_after
+            else None
+        )
+        items: List[Dict[str, Any]] = []
+        # Limit counts the items read before filtering, keep reading whole
+        # pages until there are enough and cut the page at the last one kept
+        kwargs["Limit"] = limit
+        while True:
+            if start_key:
+                kwargs["ExclusiveStartKey"] = start_key
+            response = self._table.query(**kwargs)
+            items.extend(response["Items"])
+            start_key = response.get("LastEvaluatedKey")
+            if len(items) >= limit or not start_key:
+                break
+        bookings = [self._item_to_summary(item) for item in items[:limit]]
+        if len(items) <= limit and not start_key:
+            return BookingPage(bookings=bookings)
+        return BookingPage(bookings=bookings, last_id=bookings[-1].id)
+
+    # newest first, read from the index without touching the lot
+    def list_active_by_parkinglot(
+        self,
+        parkinglot_id: ParkinglotId,
+        state: BookingState,
+        limit: int,
+        start_after: Optional[BookingId] = None,
+    ) -> BookingPage:
+        partition = parkinglot_state(parkinglot_id, state)
+        names = {f"#p{i}": name for i, name in enumerate(SUMMARY_ATTRIBUTES)}
+        kwargs: Dict[str, Any] = {
+            "IndexName": self._parkinglot_bookings_index,
+            "KeyConditionExpression": Key("parkinglot_state").eq(partition),
+            "ProjectionExpression": ", ".join(names),
+            "ExpressionAttributeNames": names,
+            "ScanIndexForward": False,
+            "Limit": limit,
+        }
+        if start_after:
+            if not (driver_id := self._resolve_driver(start_after)):
+                return BookingPage(bookings=[])
+            kwargs["ExclusiveStartKey"] = {
+                "pk": str(driver_id),
+                "sk": self._format_sk(start_after),
+                "parkinglot_state": partition,
+            }
+        response = self._table.query(**kwargs)
+        last_key = response.get("LastEvaluatedKey")
+        return BookingPage(
+            bookings=[self._item_to_summary(item) for item in response["Items"]],
+            last_id=BookingId.from_str(last_key["sk"].split("::")[1])
+            if last_key
+            else None,
+        )
+
+    def _sk_bound(self, created: Optional[datetime], fill: int) -> str:
+        if not created:
+            return "BOOKING::" if fill == 0x00 else "BOOKING::~"
+        milliseconds = int(created.timestamp() * 1000)
+        bound = BookingId.from_bytes(
+            milliseconds.to_bytes(6, "big") + bytes([fill] * 10)
+        )
+        return self._format_sk(bound)
+
+    def _item_to_summary(self, item: Dict[str, Any]) -> BookingSummary:
+        item = {"id": item["sk"].split("::")[1], **item}
+        if duration := item.get("duration"):
+            item["duration"] = int(duration)
+        return BookingSummary.parse_obj(item)
+
     def _item_to_booking(
         self,
         item: Dict[str, Any],
@@ -86,31 +240,108 @@ class DynamodbBookingRepository(BookingRepository):
         return f"BOOKING::{booking_id}"
 
     def _resolve_driver(self, booking_id: BookingId) -> Optional[DriverId]:
+        driver_id = self._drivers.get(booking_id)
+        if driver_id:
+            return driver_id
         items = self._table.query(
             IndexName=self._inverted_index,
             KeyConditionExpression=Key("sk").eq(self._format_sk(booking_id)),
         )["Items"]
         if not items:
             return None
-        return DriverId(str(items[0]["pk"]))
+        driver_id = DriverId(str(items[0]["pk"]))
+        self._drivers.set(booking_id, driver_id)
+        return driver_id
+
+    def driver_cache_stats(self) -> CacheStats:
+        return self._drivers.stats()
 
 
+# keeps copies of the bookings the way the table keeps items, so callers
+# only see their changes after a save and stale saves conflict
 class RamBookingRepository(BookingRepository):
     def __init__(self) -> None:
-        self.bookings: Dict[BookingId, BookingAggregate] = {}
+        self._bookings: Dict[BookingId, BookingAggregate] = {}
+        self._drivers: Dict[DriverId, Set[BookingId]] = defaultdict(set)
+        self._parkinglots: Dict[ParkinglotId, Set[BookingId]] = defaultdict(set)
+        self._lock = threading.Lock()
 
     def save(self, booking: BookingAggregate) -> None:
-        self.bookings[booking.id] = booking
+        booking.refresh_updated_on()
+        with self._lock:
+            stored = self._bookings.get(booking.id)
+            if stored and stored.version != booking.version:
+                raise ConcurrencyConflict(str(booking.id))
+            stored = booking.copy(update={"version": booking.version + 1}, deep=True)
+            stored.pull_events()
+            self._bookings[booking.id] = stored
+            self._drivers[booking.driver_id].add(booking.id)
+            self._parkinglots[booking.parkinglot_id].add(booking.id)
 
     def get(
         self,
         booking_id: BookingId,
         driver_id: Optional[DriverId] = None,
     ) -> Optional[BookingAggregate]:
-        return self.bookings.get(booking_id)
+        with self._lock:
+            stored = self._bookings.get(booking_id)
+            if not stored or driver_id and stored.driver_id != driver_id:
+                return None
+            return stored.copy(deep=True)
 
     def list(
         self,
         driver_id: DriverId,
     ) -> List[BookingAggregate]:
-        return [b for b in self.bookings.values() if b.driver_id == driver_id]
+        with self._lock:
+            return [
+                self._bookings[booking_id].copy(deep=True)
+                for booking_id in self._newest_first(self._drivers.get(driver_id))
+            ]
+
+    def list_page(
+        self,
+        driver_id: DriverId,
+        limit: int,
+        booking_filter: Optional[BookingFilter] = None,
+        start_after: Optional[BookingId] = None,
+    ) -> BookingPage:
+        booking_filter = booking_filter or BookingFilter()
+        with self._lock:
+            summaries = [
+                summary
+                for booking_id in self._newest_first(self._drivers.get(driver_id))
+                if not start_after or booking_id.bytes < start_after.bytes
+                if booking_filter.matches(
+                    summary := BookingSummary(**self._bookings[booking_id].dict())
+                )
+            ]
+        page = summaries[:limit]
+        if len(summaries) <= limit:
+            return BookingPage(bookings=page)
+        return BookingPage(bookings=page, last_id=page[-1].id)
+
+    def list_active_by_parkinglot(
+        self,
+        parkinglot_id: ParkinglotId,
+        state: BookingState,
+        limit: int,
+        start_after: Optional[BookingId] = None,
+    ) -> BookingPage:
+        with self._lock:
+            summaries = [
+                BookingSummary(**booking.dict())
+                for booking_id in self._newest_first(
+                    self._parkinglots.get(parkinglot_id)
+                )
+                if not start_after or booking_id.bytes < start_after.bytes
+                if (booking := self._bookings[booking_id]).is_active()
+                and booking.state == state
+            ]
+        page = summaries[:limit]
+        if len(summaries) <= limit:
+            return BookingPage(bookings=page)
+        return BookingPage(bookings=page, last_id=page[-1].id)
+
+    def _newest_first(self, booking_ids: Optional[Set[BookingId]]) -> List[BookingId]:
+        return sorted(booking_ids or (), key=lambda b: b.bytes, reverse=True)
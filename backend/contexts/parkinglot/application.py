@@ -1,4 +1,6 @@
+import logging
 from datetime import datetime, timedelta
+from enum import Enum
 from typing import List, Optional
 from uuid import UUID
 
@@ -8,9 +10,12 @@ from backend.contexts.parkinglot.domain import (
     Coordinates,
     ParkingSpace,
     ParkinglotAggregate,
+    ParkinglotCursor,
     ParkinglotRepository,
+    ParkinglotSummary,
     Price,
 )
+from backend.contexts.shared.application import retry_on_conflict
 from backend.contexts.shared.domain import (
     BookingId,
     DriverId,
@@ -18,9 +23,14 @@ from backend.contexts.shared.domain import (
     OwnerId,
     ParkinglotId,
     ParkingSpaceId,
+    decode_cursor,
+    encode_cursor,
 )
 
+logger = logging.getLogger(__name__)
 
+
+@retry_on_conflict()
 def create_parkinglot(
     parkinglot_id: ParkinglotId,
     name: str,
@@ -46,6 +56,9 @@ def create_parkinglot(
     return None
 
 
+# books a space with conditional updates instead of saving the whole
+# aggregate, so concurrent bookings for a lot do not conflict on its version
+@retry_on_conflict()
 def accomodate_booking(
     booking_id: BookingId,
     parkinglot_id: ParkinglotId,
@@ -54,18 +67,19 @@ def accomodate_booking(
     repo: ParkinglotRepository,
     bus: EventBus,
 ) -> None:
-    if not (parkinglot := repo.get(parkinglot_id)):
-        return None
-    parkinglot.accommodate_booking(
+    reservation = repo.reserve_space(
+        parkinglot_id=parkinglot_id,
         driver_id=driver_id,
         booking_id=booking_id,
         booking_duration=booking_duration,
     )
-    repo.save(parkinglot)
-    bus.publish(parkinglot.pull_events())
+    if not reservation:
+        return None
+    bus.publish(reservation.events())
     return None
 
 
+@retry_on_conflict()
 def register_concentrator(
     parkinglot_id: ParkinglotId,
     owner_id: OwnerId,
@@ -81,6 +95,7 @@ def register_concentrator(
     return None
 
 
+@retry_on_conflict()
 def register_spaces_command(
     parkinglot_id: ParkinglotId,
     space_ids: List[ParkingSpaceId],
@@ -88,7 +103,7 @@ def register_spaces_command(
     repo: ParkinglotRepository,
     bus: EventBus,
 ):
-    if not (parkinglot := repo.get(parkinglot_id, owner_id)):
+    if not (parkinglot := repo.get(parkinglot_id, owner_id, with_spaces=True)):
         return None
     parkinglot.register_spaces(space_ids)
     repo.save(parkinglot)
@@ -96,6 +111,7 @@ def register_spaces_command(
     return None
 
 
+@retry_on_conflict()
 def change_parkinglot_price(
     parkinglot_id: ParkinglotId,
     price: Price,
@@ -111,11 +127,34 @@ def change_parkinglot_price(
     return None
 
 
+class ListParkinglotsResponse(BaseModel):
+    parkinglots: List[ParkinglotSummary]
+    cursor: Optional[str] = None
+
+
 def list_parkinglots(
     owner_id: OwnerId,
     repo: ParkinglotRepository,
-) -> List[ParkinglotAggregate]:
-    return repo.list(owner_id)
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> ListParkinglotsResponse:
+    start_after = decode_cursor(cursor, ParkinglotCursor).last_id if cursor else None
+    page = repo.list_page(owner_id, limit, start_after)
+    return ListParkinglotsResponse(
+        parkinglots=page.parkinglots,
+        cursor=encode_cursor(ParkinglotCursor(last_id=page.last_id))
+        if page.last_id
+        else None,
+    )
+
+
+# resolves the owner without reading the lot, the lookup is cached
+def is_parkinglot_owner(
+    parkinglot_id: ParkinglotId,
+    owner_id: OwnerId,
+    repo: ParkinglotRepository,
+) -> bool:
+    return repo.get_owner(parkinglot_id) == owner_id
 
 
 def get_parkinglot_aggregate(
@@ -123,7 +162,7 @@ def get_parkinglot_aggregate(
     parkinglot_id: ParkinglotId,
     repo: ParkinglotRepository,
 ) -> Optional[ParkinglotAggregate]:
-    return repo.get(parkinglot_id, owner_id)
+    return repo.get(parkinglot_id, owner_id, with_spaces=True)
 
 
 def list_parkinglot_spaces(
@@ -131,11 +170,11 @@ def list_parkinglot_spaces(
     parkinglot_id: ParkinglotId,
     repo: ParkinglotRepository,
 ) -> List[ParkingSpace]:
-    if not (parkinglot := repo.get(parkinglot_id)):
+    if not (parkinglot := repo.get(parkinglot_id, with_spaces=True)):
         return []
     if user_id not in (parkinglot.owner_id, parkinglot.concentrator_id):
         return []
-    return parkinglot.spaces
+    return list(parkinglot.spaces)
 
 
 class Parkinglot(BaseModel):
@@ -145,6 +184,7 @@ class Parkinglot(BaseModel):
     coordinates: Coordinates
     price: Price
     free_spaces: int
+    version: int
 
 
 def get_parkinglot(
@@ -156,35 +196,51 @@ def get_parkinglot(
     return Parkinglot(**parkinglot.dict())
 
 
+def get_parkinglot_version(
+    parkinglot_id: ParkinglotId,
+    repo: ParkinglotRepository,
+) -> Optional[int]:
+    return repo.get_version(parkinglot_id)
+
+
 class Space(BaseModel):
     id: ParkingSpaceId
     booked: bool
     booked_util: Optional[datetime] = None
 
 
+class ParkinglotSpaces(BaseModel):
+    version: int
+    spaces: List[Space]
+
+
 def get_parkinglot_spaces(
     parkinglot_id: ParkinglotId,
     repo: ParkinglotRepository,
-) -> List[Space]:
-    if not (parkinglot := repo.get(parkinglot_id)):
-        return []
-    return [
-        Space(
-            id=s.id,
-            booked=bool(s.booked_by),
-            booked_util=s.booked_util,
-        )
-        for s in parkinglot.spaces
-    ]
+) -> Optional[ParkinglotSpaces]:
+    if not (parkinglot := repo.get(parkinglot_id, with_spaces=True)):
+        return None
+    return ParkinglotSpaces(
+        version=parkinglot.version,
+        spaces=[
+            Space(
+                id=s.id,
+                booked=bool(s.booked_by),
+                booked_util=s.booked_util,
+            )
+            for s in parkinglot.spaces
+        ],
+    )
 
 
+@retry_on_conflict()
 def release_space(
     parkinglot_id: ParkinglotId,
     space_id: ParkingSpaceId,
     repo: ParkinglotRepository,
     bus: EventBus,
 ) -> None:
-    if not (parkinglot := repo.get(parkinglot_id)):
+    if not (parkinglot := repo.get(parkinglot_id, with_spaces=True)):
         return None
     parkinglot.release_space(space_id)
     repo.save(parkinglot)
@@ -192,6 +248,27 @@ def release_space(
     return None
 
 
+# releases the spaces of a burst of canceled bookings with one load and
+# save of the lot
+@retry_on_conflict()
+def release_spaces(
+    parkinglot_id: ParkinglotId,
+    space_ids: List[ParkingSpaceId],
+    repo: ParkinglotRepository,
+    bus: EventBus,
+) -> None:
+    if not (parkinglot := repo.get(parkinglot_id, with_spaces=True)):
+        return None
+    for space_id in space_ids:
+        parkinglot.release_space(space_id)
+    if not (events := parkinglot.pull_events()):
+        return None
+    repo.save(parkinglot)
+    bus.publish(events)
+    return None
+
+
+@retry_on_conflict()
 def concentrator_take_space(
     parkinglot_id: ParkinglotId,
     space_id: ParkingSpaceId,
@@ -199,7 +276,7 @@ def concentrator_take_space(
     repo: ParkinglotRepository,
     bus: EventBus,
 ):
-    if not (parkinglot := repo.get(parkinglot_id)):
+    if not (parkinglot := repo.get(parkinglot_id, with_spaces=True)):
         return None
     if concentrator_id != parkinglot.concentrator_id:
         return None
@@ -209,6 +286,7 @@ def concentrator_take_space(
     return None
 
 
+@retry_on_conflict()
 def concentrator_release_space(
     parkinglot_id: ParkinglotId,
     space_id: ParkingSpaceId,
@@ -216,7 +294,7 @@ def concentrator_release_space(
     repo: ParkinglotRepository,
     bus: EventBus,
 ):
-    if not (parkinglot := repo.get(parkinglot_id)):
+    if not (parkinglot := repo.get(parkinglot_id, with_spaces=True)):
         return None
     if concentrator_id != parkinglot.concentrator_id:
         return None
@@ -225,3 +303,76 @@ def concentrator_release_space(
     repo.save(parkinglot)
     bus.publish(parkinglot.pull_events())
     return None
+
+
+class OccupancyAction(Enum):
+    TAKE = "take"
+    RELEASE = "release"
+
+
+class OccupancyChange(BaseModel):
+    space_id: ParkingSpaceId
+    action: OccupancyAction
+    timestamp: datetime
+
+
+# replays the sensor changes a concentrator buffered in the order they
+# happened, against a single load and save of the lot
+@retry_on_conflict()
+def concentrator_apply_occupancy(
+    parkinglot_id: ParkinglotId,
+    changes: List[OccupancyChange],
+    concentrator_id: str,
+    repo: ParkinglotRepository,
+    bus: EventBus,
+) -> None:
+    if not (parkinglot := repo.get(parkinglot_id, with_spaces=True)):
+        return None
+    if concentrator_id != parkinglot.concentrator_id:
+        return None
+    for change in sorted(changes, key=lambda c: c.timestamp):
+        if change.action == OccupancyAction.TAKE:
+            parkinglot.take_space(change.space_id, at=change.timestamp)
+        else:
+            parkinglot.release_space(change.space_id)
+    repo.save(parkinglot)
+    bus.publish(parkinglot.pull_events())
+    return None
+
+
+# releases every expired space of a lot with a single save
+@retry_on_conflict()
+def release_expired_spaces(
+    parkinglot_id: ParkinglotId,
+    owner_id: OwnerId,
+    now: datetime,
+    repo: ParkinglotRepository,
+    bus: EventBus,
+) -> None:
+    if not (parkinglot := repo.get(parkinglot_id, owner_id, with_spaces=True)):
+        return None
+    parkinglot.release_expired_spaces(now)
+    if not (events := parkinglot.pull_events()):
+        return None
+    repo.save(parkinglot)
+    bus.publish(events)
+    return None
+
+
+def release_expired_bookings(
+    now: datetime,
+    limit: int,
+    repo: ParkinglotRepository,
+    bus: EventBus,
+) -> int:
+    released = 0
+    # a lot that keeps failing is logged and left for the next sweep, so it
+    # does not hold back the other lots
+    for parkinglot_id, owner_id in repo.expired_parkinglots(until=now, limit=limit):
+        try:
+            release_expired_spaces(parkinglot_id, owner_id, now, repo, bus)
+        except Exception:
+            logger.exception("releasing expired spaces failed: %s", parkinglot_id)
+            continue
+        released += 1
+    return released
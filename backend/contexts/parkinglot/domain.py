@@ -1,11 +1,30 @@
-from datetime import datetime, timedelta
+import heapq
+import uuid
+from array import array
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-from typing import List, Optional, Protocol
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Set,
+    Tuple,
+    overload,
+)
 
-from pydantic import BaseModel, Field
 import h3
+import ulid
+from pydantic import BaseModel, Field, PrivateAttr
+from pydantic.datetime_parse import parse_datetime
+from pydantic.json import ENCODERS_BY_TYPE
 
 from backend.contexts.shared.domain import (
+    ULID,
     AggregateRoot,
     BookingId,
     DomainEvent,
@@ -17,6 +36,9 @@ from backend.contexts.shared.domain import (
 
 Price = Decimal
 
+H3_RESOLUTION = 8
+H3_PARENT_RESOLUTIONS = (6, 7)
+
 
 class Coordinates(BaseModel):
     lat: Decimal = Field(..., ge=-90, le=90)
@@ -35,27 +57,248 @@ class ParkingSpace(BaseModel):
     def is_booked(self) -> bool:
         return self.booked_by is not None
 
+    # a read-only view of a row of ParkingSpaces, changes go through the
+    # aggregate so they reach the columns
+    class Config:
+        allow_mutation = False
+
+
+# timestamps are kept as microseconds from the epoch, this marks no value
+NO_TIMESTAMP = -(2**63)
+EPOCH = datetime(1970, 1, 1)
+NO_ID = bytes(16)
+
+
+def to_micros(value: Any) -> int:
+    if value is None:
+        return NO_TIMESTAMP
+    if not isinstance(value, datetime):
+        # the datetimes the repository writes, anything else goes the slow way
+        try:
+            value = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            value = parse_datetime(value)
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value: int) -> Optional[datetime]:
+    if value == NO_TIMESTAMP:
+        return None
+    return EPOCH + timedelta(microseconds=value)
+
+
+def isoformat(value: int) -> Optional[str]:
+    return (moment := from_micros(value)) and moment.isoformat()
+
+
+def id_bytes(value: Any) -> bytes:
+    if value is None:
+        return NO_ID
+    if isinstance(value, (uuid.UUID, ulid.ULID)):
+        return value.bytes
+    value = str(value)
+    # booking ids are ulids, every other id is an uuid
+    if len(value) == 26:
+        return ulid.ULID.from_str(value).bytes
+    return bytes.fromhex(value.replace("-", ""))
+
+
+# spaces of a lot in columns keyed by position, a booked bit per space and
+# fixed size ids and timestamps, ParkingSpace models are only built for the
+# spaces that are read
+class ParkingSpaces(Sequence[ParkingSpace]):
+    def __init__(self, spaces: Iterable[Any] = ()) -> None:
+        self._ids = bytearray()
+        self._internal_ids = array("q")
+        self._booked = bytearray()
+        self._booked_by = bytearray()
+        self._booking_ids = bytearray()
+        self._booked_from = array("q")
+        self._booked_util = array("q")
+        self._arrivals = array("q")
+        self._positions: Optional[Dict[bytes, int]] = None
+        for space in spaces:
+            self.append(space)
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, v: Any) -> "ParkingSpaces":
+        if isinstance(v, ParkingSpaces):
+            return v
+        if not isinstance(v, (list, tuple)):
+            raise TypeError("spaces must be a list")
+        return cls(v)
+
+    @classmethod
+    def __modify_schema__(cls, field_schema: Dict[str, Any]) -> None:
+        field_schema.update(type="array", items=ParkingSpace.schema())
+
+    def __len__(self) -> int:
+        return len(self._internal_ids)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (ParkingSpaces, list, tuple)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"ParkingSpaces({list(self)!r})"
+
+    @overload
+    def __getitem__(self, position: int) -> ParkingSpace:
+        ...
+
+    @overload
+    def __getitem__(self, position: slice) -> List[ParkingSpace]:
+        ...
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("space position out of range")
+        booked = self.is_booked(position)
+        return ParkingSpace.construct(
+            id=self.id_at(position),
+            internal_id=self._internal_ids[position],
+            booked_by=self._driver_at(position),
+            booked_from=from_micros(self._booked_from[position]),
+            booked_util=from_micros(self._booked_util[position]),
+            booking_id=self._booking_at(position) if booked else None,
+            driver_arrival_time=from_micros(self._arrivals[position]),
+        )
+
+    def append(self, space: Any) -> None:
+        if isinstance(space, ParkingSpace):
+            space = space.__dict__
+        position = len(self)
+        space_id = id_bytes(space["id"])
+        self._ids += space_id
+        self._internal_ids.append(int(space["internal_id"]))
+        if position % 8 == 0:
+            self._booked.append(0)
+        self._booked_by += id_bytes(space.get("booked_by"))
+        self._booking_ids += id_bytes(space.get("booking_id"))
+        self._booked_from.append(to_micros(space.get("booked_from")))
+        self._booked_util.append(to_micros(space.get("booked_util")))
+        self._arrivals.append(to_micros(space.get("driver_arrival_time")))
+        if space.get("booking_id") is not None:
+            self._booked[position >> 3] |= 1 << (position & 7)
+        if self._positions is not None:
+            self._positions[space_id] = position
+
+    def position(self, space_id: ParkingSpaceId) -> Optional[int]:
+        if self._positions is None:
+            ids = self._ids
+            self._positions = {
+                bytes(ids[i : i + 16]): i >> 4 for i in range(0, len(ids), 16)
+            }
+        return self._positions.get(space_id.bytes)
+
+    def id_at(self, position: int) -> ParkingSpaceId:
+        return ParkingSpaceId(
+            bytes=bytes(self._ids[position * 16 : position * 16 + 16])
+        )
+
+    def internal_id_at(self, position: int) -> int:
+        return self._internal_ids[position]
+
+    def is_booked(self, position: int) -> bool:
+        return bool(self._booked[position >> 3] & (1 << (position & 7)))
+
+    def free_positions(self) -> Iterator[int]:
+        for byte_position, byte in enumerate(self._booked):
+            if byte == 0xFF:
+                continue
+            for bit in range(8):
+                position = (byte_position << 3) + bit
+                if position < len(self) and not byte & (1 << bit):
+                    yield position
+
+    def expired_positions(self, now: datetime) -> List[int]:
+        until = to_micros(now)
+        return [
+            position
+            for position, booked_util in enumerate(self._booked_util)
+            if booked_util != NO_TIMESTAMP
+            and booked_util <= until
+            and self.is_booked(position)
+            and self._booked_by[position * 16 : position * 16 + 16] != NO_ID
+        ]
+
+    def next_expiry(self) -> Optional[datetime]:
+        expiries = [
+            booked_util
+            for position, booked_util in enumerate(self._booked_util)
+            if booked_util != NO_TIMESTAMP and self.is_booked(position)
+        ]
+        return from_micros(min(expiries)) if expiries else None
+
     def book(
         self,
+        position: int,
         driver_id: DriverId,
         booking_id: BookingId,
         booking_duration: Optional[timedelta],
     ) -> None:
-        self.booked_by = driver_id
-        self.booking_id = booking_id
-        self.booked_from = datetime.now()
-        if booking_duration:
-            self.booked_util = self.booked_from + booking_duration
+        booked_from = datetime.now()
+        self._set_id(self._booked_by, position, driver_id.bytes)
+        self._set_id(self._booking_ids, position, booking_id.bytes)
+        self._booked_from[position] = to_micros(booked_from)
+        self._booked_util[position] = (
+            to_micros(booked_from + booking_duration)
+            if booking_duration
+            else NO_TIMESTAMP
+        )
+        self._booked[position >> 3] |= 1 << (position & 7)
+
+    def take(self, position: int, at: Optional[datetime] = None) -> None:
+        self._arrivals[position] = to_micros(at or datetime.now())
+
+    def release(self, position: int) -> None:
+        self._set_id(self._booked_by, position, NO_ID)
+        self._set_id(self._booking_ids, position, NO_ID)
+        self._booked_from[position] = NO_TIMESTAMP
+        self._booked_util[position] = NO_TIMESTAMP
+        self._arrivals[position] = NO_TIMESTAMP
+        self._booked[position >> 3] &= ~(1 << (position & 7)) & 0xFF
+
+    def _driver_at(self, position: int) -> Optional[DriverId]:
+        driver = bytes(self._booked_by[position * 16 : position * 16 + 16])
+        return None if driver == NO_ID else uuid.UUID(bytes=driver)
+
+    def _booking_at(self, position: int) -> BookingId:
+        return ULID.from_bytes(
+            bytes(self._booking_ids[position * 16 : position * 16 + 16])
+        )
+
+    def _set_id(self, column: bytearray, position: int, value: bytes) -> None:
+        column[position * 16 : position * 16 + 16] = value
+
+    # same shape the list of models had in the aggregate json
+    def json_list(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": str(uuid.UUID(bytes=bytes(self._ids[i * 16 : i * 16 + 16]))),
+                "internal_id": self._internal_ids[i],
+                "booked_by": (driver := self._driver_at(i)) and str(driver),
+                "booked_from": isoformat(self._booked_from[i]),
+                "booked_util": isoformat(self._booked_util[i]),
+                "booking_id": str(self._booking_at(i)) if self.is_booked(i) else None,
+                "driver_arrival_time": isoformat(self._arrivals[i]),
+            }
+            for i in range(len(self))
+        ]
 
-    def take(self):
-        self.driver_arrival_time = datetime.now()
 
-    def release(self) -> None:
-        self.booked_by = None
-        self.booked_from = None
-        self.booked_util = None
-        self.booking_id = None
-        self.driver_arrival_time = None
+ENCODERS_BY_TYPE[ParkingSpaces] = ParkingSpaces.json_list
 
 
 class ParkinglotAggregate(AggregateRoot):
@@ -68,7 +311,12 @@ class ParkinglotAggregate(AggregateRoot):
     price: Price
     concentrator_id: Optional[str]
     free_spaces: int = 0
-    spaces: List[ParkingSpace] = Field(default_factory=list)
+    spaces: ParkingSpaces = Field(default_factory=ParkingSpaces)
+    # free positions in spaces, built on first use after loading the aggregate
+    _free_heap: Optional[List[Tuple[int, int]]] = PrivateAttr(None)
+    _changed_spaces: Set[ParkingSpaceId] = PrivateAttr(default_factory=set)
+    # header values as loaded without the spaces, saves write what changed
+    _loaded_header: Optional[Dict[str, Any]] = PrivateAttr(None)
 
     @classmethod
     def create(
@@ -88,7 +336,7 @@ class ParkinglotAggregate(AggregateRoot):
             name=name,
             street=street,
             coordinates=coordinates,
-            h3cell=h3.latlng_to_cell(coordinates.lat, coordinates.lng, 8),
+            h3cell=h3.latlng_to_cell(coordinates.lat, coordinates.lng, H3_RESOLUTION),
             price=price,
             concentrator_id=None,
         )
@@ -99,6 +347,7 @@ class ParkinglotAggregate(AggregateRoot):
                 name=parkinglot.name,
                 street=parkinglot.street,
                 coordinates=parkinglot.coordinates,
+                price=parkinglot.price,
             )
         )
         return parkinglot
@@ -107,10 +356,30 @@ class ParkinglotAggregate(AggregateRoot):
         self.concentrator_id = concentrator_id
 
     def change_price(self, price: Price) -> None:
+        if price == self.price:
+            return None
         self.price = price
+        self.push_event(
+            ParkinglotPriceChanged(
+                aggregate_id=str(self.id),
+                price=self.price,
+                h3cell=self.h3cell,
+            )
+        )
 
     def find_free_space(self) -> Optional[ParkingSpace]:
-        return next((s for s in self.spaces if s.booking_id is None), None)
+        if (position := self.free_position()) is None:
+            return None
+        return self.spaces[position]
+
+    def free_position(self) -> Optional[int]:
+        heap = self.free_space_heap()
+        while heap:
+            _, position = heap[0]
+            if not self.spaces.is_booked(position):
+                return position
+            heapq.heappop(heap)
+        return None
 
     def accommodate_booking(
         self,
@@ -123,28 +392,66 @@ class ParkinglotAggregate(AggregateRoot):
                 BookingRefused(aggregate_id=str(self.id), booking_id=booking_id)
             )
             return None
-        if not (free_space := self.find_free_space()):
+        if (position := self.free_position()) is None:
             self.push_event(
                 BookingRefused(aggregate_id=str(self.id), booking_id=booking_id)
             )
             return None
-        free_space.book(driver_id, booking_id, booking_duration)
+        self.spaces.book(position, driver_id, booking_id, booking_duration)
+        heapq.heappop(self.free_space_heap())
+        space_id = self.spaces.id_at(position)
+        self.mark_space_changed(space_id)
         self.free_spaces -= 1
         self.push_event(
             BookingAccommodated(
                 aggregate_id=str(self.id),
                 booking_id=booking_id,
                 price=self.price,
-                space_id=free_space.id,
+                space_id=space_id,
             )
         )
+        self.push_free_spaces_changed()
 
     def find_space(self, space_id: ParkingSpaceId) -> Optional[ParkingSpace]:
-        return next((s for s in self.spaces if s.id == space_id), None)
+        if (position := self.spaces.position(space_id)) is None:
+            return None
+        return self.spaces[position]
+
+    def free_space_heap(self) -> List[Tuple[int, int]]:
+        if self._free_heap is None:
+            self._free_heap = [
+                (self.spaces.internal_id_at(position), position)
+                for position in self.spaces.free_positions()
+            ]
+            heapq.heapify(self._free_heap)
+        return self._free_heap
+
+    def mark_space_changed(self, space_id: ParkingSpaceId) -> None:
+        self._changed_spaces.add(space_id)
+
+    def track_header(self, header: Dict[str, Any]) -> None:
+        self._loaded_header = header
+
+    def loaded_header(self) -> Optional[Dict[str, Any]]:
+        return self._loaded_header
+
+    def pull_changed_spaces(self) -> List[ParkingSpace]:
+        changed = sorted(
+            position
+            for space_id in self._changed_spaces
+            if (position := self.spaces.position(space_id)) is not None
+        )
+        self._changed_spaces = set()
+        return [self.spaces[position] for position in changed]
 
-    def take_space(self, space_id: ParkingSpaceId) -> None:
-        if not (space := self.find_space(space_id)):
+    def take_space(
+        self,
+        space_id: ParkingSpaceId,
+        at: Optional[datetime] = None,
+    ) -> None:
+        if (position := self.spaces.position(space_id)) is None:
             return None
+        space = self.spaces[position]
         if not space.booking_id or not space.booked_by:
             self.push_event(
                 DriverArrivedAtUnBookedSpace(
@@ -153,7 +460,8 @@ class ParkinglotAggregate(AggregateRoot):
                 )
             )
             return None
-        space.take()
+        self.spaces.take(position, at)
+        self.mark_space_changed(space.id)
         self.push_event(
             DriverArrived(
                 aggregate_id=str(self.id),
@@ -166,20 +474,23 @@ class ParkinglotAggregate(AggregateRoot):
 
     def register_spaces(self, space_ids: List[ParkingSpaceId]) -> None:
         initial_internal_id = len(self.spaces)
-        spaces = [
-            ParkingSpace(id=space_id, internal_id=initial_internal_id + i)
-            for i, space_id in enumerate(space_ids)
-        ]
-        self.free_spaces += len(spaces)
-        self.spaces.extend(spaces)
-        for space in spaces:
+        for i, space_id in enumerate(space_ids):
+            self.spaces.append(
+                ParkingSpace(id=space_id, internal_id=initial_internal_id + i)
+            )
+            self.mark_space_changed(space_id)
             self.push_event(
-                ParkingSpaceCreated(aggregate_id=str(self.id), space_id=space.id)
+                ParkingSpaceCreated(aggregate_id=str(self.id), space_id=space_id)
             )
+        self.free_spaces += len(space_ids)
+        self._free_heap = None
+        if space_ids:
+            self.push_free_spaces_changed()
 
     def release_space(self, space_id: ParkingSpaceId) -> None:
-        if not (space := self.find_space(space_id)):
+        if (position := self.spaces.position(space_id)) is None:
             return None
+        space = self.spaces[position]
         if not space.booked_by or not space.booking_id:
             return None
         self.push_event(
@@ -190,16 +501,91 @@ class ParkinglotAggregate(AggregateRoot):
                 booking_id=space.booking_id,
             )
         )
-        space.release()
+        self._free_position(position)
         self.free_spaces += 1
+        self.push_free_spaces_changed()
+        return None
+
+    def release_expired_spaces(self, now: datetime) -> None:
+        if not (expired := self.spaces.expired_positions(now)):
+            return None
+        for position in expired:
+            space = self.spaces[position]
+            self.push_event(
+                BookingExpired(
+                    aggregate_id=str(self.id),
+                    space_id=space.id,
+                    driver_id=space.booked_by,
+                    booking_id=space.booking_id,
+                )
+            )
+            self._free_position(position)
+        self.free_spaces += len(expired)
+        self.push_free_spaces_changed()
         return None
 
+    def _free_position(self, position: int) -> None:
+        free_heap = self.free_space_heap()
+        self.spaces.release(position)
+        self.mark_space_changed(self.spaces.id_at(position))
+        heapq.heappush(free_heap, (self.spaces.internal_id_at(position), position))
+
+    def push_free_spaces_changed(self) -> None:
+        self.push_event(
+            FreeSpacesChanged(
+                aggregate_id=str(self.id),
+                free_spaces=self.free_spaces,
+                h3cell=self.h3cell,
+            )
+        )
+
+
+class SpaceReservation(BaseModel):
+    parkinglot_id: ParkinglotId
+    booking_id: BookingId
+    space_id: Optional[ParkingSpaceId]
+    price: Price
+    h3cell: str
+    free_spaces: int
+
+    def events(self) -> List[DomainEvent]:
+        if not self.space_id:
+            return [
+                BookingRefused(
+                    aggregate_id=str(self.parkinglot_id), booking_id=self.booking_id
+                )
+            ]
+        return [
+            BookingAccommodated(
+                aggregate_id=str(self.parkinglot_id),
+                booking_id=self.booking_id,
+                price=self.price,
+                space_id=self.space_id,
+            ),
+            FreeSpacesChanged(
+                aggregate_id=str(self.parkinglot_id),
+                free_spaces=self.free_spaces,
+                h3cell=self.h3cell,
+            ),
+        ]
+
 
 class ParkinglotCreated(DomainEvent):
     owner_id: OwnerId
     name: str
     street: str
     coordinates: Coordinates
+    price: Price
+
+
+class ParkinglotPriceChanged(DomainEvent):
+    price: Price
+    h3cell: str
+
+
+class FreeSpacesChanged(DomainEvent):
+    free_spaces: int
+    h3cell: str
 
 
 class BookingAccommodated(DomainEvent):
@@ -232,6 +618,31 @@ class DriverLeft(DomainEvent):
     booking_id: BookingId
 
 
+class BookingExpired(DomainEvent):
+    space_id: ParkingSpaceId
+    driver_id: DriverId
+    booking_id: BookingId
+
+
+class ParkinglotSummary(BaseModel):
+    id: ParkinglotId
+    name: str
+    street: str
+    coordinates: Coordinates
+    price: Price
+    free_spaces: int
+    concentrator_id: Optional[str]
+
+
+class ParkinglotCursor(BaseModel):
+    last_id: ParkinglotId
+
+
+class ParkinglotSummaryPage(BaseModel):
+    parkinglots: List[ParkinglotSummary]
+    last_id: Optional[ParkinglotId] = None
+
+
 class ParkinglotRepository(Protocol):
     def save(self, parkinglot: ParkinglotAggregate) -> None:
         ...
@@ -240,8 +651,39 @@ class ParkinglotRepository(Protocol):
         self,
         parkinglot_id: ParkinglotId,
         owner_id: Optional[OwnerId] = None,
+        with_spaces: bool = False,
     ) -> Optional[ParkinglotAggregate]:
         ...
 
+    def get_version(self, parkinglot_id: ParkinglotId) -> Optional[int]:
+        ...
+
+    def get_owner(self, parkinglot_id: ParkinglotId) -> Optional[OwnerId]:
+        ...
+
     def list(self, owner_id: OwnerId) -> List[ParkinglotAggregate]:
         ...
+
+    def list_page(
+        self,
+        owner_id: OwnerId,
+        limit: int,
+        start_after: Optional[ParkinglotId] = None,
+    ) -> ParkinglotSummaryPage:
+        ...
+
+    def reserve_space(
+        self,
+        parkinglot_id: ParkinglotId,
+        driver_id: DriverId,
+        booking_id: BookingId,
+        booking_duration: Optional[timedelta] = None,
+    ) -> Optional[SpaceReservation]:
+        ...
+
+    def expired_parkinglots(
+        self,
+        until: datetime,
+        limit: int,
+    ) -> List[Tuple[ParkinglotId, OwnerId]]:
+        ...
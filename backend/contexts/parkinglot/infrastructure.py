@@ -1,73 +1,566 @@
 import json
+import math
+import random
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 import boto3
 from boto3.dynamodb.conditions import Attr, Key
-from pydantic import parse_obj_as
 
-from backend.contexts.parkinglot.domain import ParkinglotAggregate, ParkinglotRepository
-from backend.contexts.shared.domain import OwnerId, ParkinglotId
+from backend.contexts.parkinglot.domain import (
+    BookingAccommodated,
+    ParkingSpace,
+    ParkingSpaces,
+    ParkinglotAggregate,
+    ParkinglotRepository,
+    ParkinglotSummary,
+    ParkinglotSummaryPage,
+    SpaceReservation,
+)
+from backend.contexts.shared.domain import (
+    BookingId,
+    ConcurrencyConflict,
+    DriverId,
+    OwnerId,
+    ParkinglotId,
+    ParkingSpaceId,
+)
+from backend.contexts.shared.infrastructure import CacheStats, TTLCache
+
+# the lot item goes in the same transaction as its spaces
+MAX_TRANSACTION_SPACES = 99
+
+# reservation markers only answer redeliveries of the booking that made
+# them, dynamodb deletes them through the table ttl after this long
+RESERVATION_RETENTION = timedelta(days=14)
+
+# space items read per page when looking for a free one to reserve
+FREE_SPACES_PAGE = 25
+
+# attributes of the lot item, without the spaces older lots embed
+HEADER_ATTRIBUTES = [
+    "pk",
+    "sk",
+    *(
+        f
+        for f in ParkinglotAggregate.__fields__
+        if f not in ("id", "owner_id", "spaces")
+    ),
+]
+
+# attributes of a lot header the listings return
+SUMMARY_ATTRIBUTES = [
+    "pk",
+    "sk",
+    *(f for f in ParkinglotSummary.__fields__ if f != "id"),
+]
+
+# booked spaces are indexed by expiry in monthly partitions, the sweeper
+# reads the current and the previous ones
+EXPIRY_LOOKBACK_MONTHS = 1
+
+
+def expiry_bucket(booked_util: datetime) -> str:
+    return f"EXPIRY::{booked_util:%Y-%m}"
+
+
+def expiry_buckets(until: datetime) -> List[str]:
+    year, month = until.year, until.month
+    buckets = []
+    for _ in range(EXPIRY_LOOKBACK_MONTHS + 1):
+        buckets.append(f"EXPIRY::{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return buckets[::-1]
 
 
 class DynamodbParkinglotRepository(ParkinglotRepository):
-    def __init__(self, table_name: str, inverted_index: str) -> None:
+    def __init__(
+        self,
+        table_name: str,
+        inverted_index: str,
+        expiry_index: str = "",
+        owner_cache_size: int = 10_000,
+    ) -> None:
         self._inverted_index = inverted_index
+        self._expiry_index = expiry_index
         resource = boto3.resource("dynamodb")
         self._table = resource.Table(table_name)
+        # a lot never changes owner, entries only leave the cache by size
+        self._owners: TTLCache[ParkinglotId, OwnerId] = TTLCache(
+            owner_cache_size, ttl=math.inf
+        )
 
     def save(self, parkinglot: ParkinglotAggregate) -> None:
         parkinglot.refresh_updated_on()
-        item = json.loads(
-            parkinglot.json(exclude={"id", "owner_id", "version"}),
+        header = self._header(parkinglot)
+        if (loaded := parkinglot.loaded_header()) is not None:
+            self._update_header(
+                parkinglot,
+                {k: v for k, v in header.items() if loaded.get(k) != v},
+            )
+            parkinglot.track_header(header)
+            return None
+        item = {
+            "pk": str(parkinglot.owner_id),
+            "sk": f"PARKINGLOT::{parkinglot.id}",
+            "version": parkinglot.version + 1,
+            **header,
+        }
+        spaces = [
+            self._space_item(parkinglot, space)
+            for space in parkinglot.pull_changed_spaces()
+        ]
+        client = self._table.meta.client
+        if not spaces:
+            try:
+                self._table.put_item(
+                    Item=item,
+                    ConditionExpression=(
+                        Attr("version").not_exists()
+                        | Attr("version").eq(parkinglot.version)
+                    ),
+                )
+            except client.exceptions.ConditionalCheckFailedException as e:
+                raise ConcurrencyConflict(str(parkinglot.id)) from e
+            self._owners.set(parkinglot.id, parkinglot.owner_id)
+            return None
+
+        # only registering or migrating many spaces at once goes over the
+        # transaction size, the spaces that do not fit are written once the
+        # version check passed, so a conflict never leaves spaces behind for
+        # the retried command to register again
+        spaces, remaining = (
+            spaces[:MAX_TRANSACTION_SPACES],
+            spaces[MAX_TRANSACTION_SPACES:],
+        )
+
+        # the resource client serializes the items like the table does
+        try:
+            client.transact_write_items(
+                TransactItems=[
+                    {
+                        "Put": {
+                            "TableName": self._table.name,
+                            "Item": item,
+                            "ConditionExpression": (
+                                "attribute_not_exists(version) OR version = :version"
+                            ),
+                            "ExpressionAttributeValues": {
+                                ":version": parkinglot.version
+                            },
+                        }
+                    },
+                    *(
+                        {"Put": {"TableName": self._table.name, "Item": s}}
+                        for s in spaces
+                    ),
+                ]
+            )
+        except client.exceptions.TransactionCanceledException as e:
+            # the lot put goes first, a failed version check cancels it
+            if e.response["CancellationReasons"][0]["Code"] == "ConditionalCheckFailed":
+                raise ConcurrencyConflict(str(parkinglot.id)) from e
+            raise
+        if remaining:
+            with self._table.batch_writer() as batch:
+                for space in remaining:
+                    batch.put_item(Item=space)
+        self._owners.set(parkinglot.id, parkinglot.owner_id)
+
+    def _header(self, parkinglot: ParkinglotAggregate) -> Dict[str, Any]:
+        return json.loads(
+            parkinglot.json(exclude={"id", "owner_id", "version", "spaces"}),
             parse_float=Decimal,
         )
-        self._table.put_item(
-            Item={
+
+    # a lot loaded without its spaces only writes the attributes that changed
+    def _update_header(
+        self,
+        parkinglot: ParkinglotAggregate,
+        changed: Dict[str, Any],
+    ) -> None:
+        names = {f"#a{i}": name for i, name in enumerate(changed)}
+        assignments = [f"{n} = :a{i}" for i, n in enumerate(names)]
+        kwargs: Dict[str, Any] = {
+            "Key": {
                 "pk": str(parkinglot.owner_id),
-                "sk": f"PARKINGLOT::{parkinglot.id}",
-                "version": parkinglot.version + 1,
-                **item,
+                "sk": self._format_sk(parkinglot.id),
             },
-            ConditionExpression=(
-                Attr("version").not_exists() | Attr("version").eq(parkinglot.version)
-            ),
-        )
+            "UpdateExpression": "SET " + ", ".join([*assignments, "version = :next"]),
+            "ConditionExpression": "version = :version",
+            "ExpressionAttributeValues": {
+                **{f":a{i}": value for i, value in enumerate(changed.values())},
+                ":next": parkinglot.version + 1,
+                ":version": parkinglot.version,
+            },
+        }
+        if names:
+            kwargs["ExpressionAttributeNames"] = names
+        try:
+            self._table.update_item(**kwargs)
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException as e:
+            raise ConcurrencyConflict(str(parkinglot.id)) from e
 
     def get(
         self,
         parkinglot_id: ParkinglotId,
         owner_id: Optional[OwnerId] = None,
+        with_spaces: bool = False,
     ) -> Optional[ParkinglotAggregate]:
         owner_id = owner_id or self._resolve_owner(parkinglot_id)
         if not owner_id:
             return None
+        attributes = (
+            [*HEADER_ATTRIBUTES, "spaces"] if with_spaces else HEADER_ATTRIBUTES
+        )
         item = self._table.get_item(
-            Key={"pk": str(owner_id), "sk": f"PARKINGLOT::{parkinglot_id}"}
+            Key={"pk": str(owner_id), "sk": f"PARKINGLOT::{parkinglot_id}"},
+            **self._projection(attributes),
         ).get("Item")
-        return ParkinglotAggregate.parse_obj(self._parse_item(item)) if item else None
+        if not item:
+            return None
+        if not with_spaces:
+            return self._partial(item)
+        # lots saved before spaces had their own items embed them, every
+        # space is rewritten as an item on the next save
+        embedded = "spaces" in item
+        if not embedded:
+            item["spaces"] = self._query_spaces(owner_id, parkinglot_id)
+        parkinglot = ParkinglotAggregate.parse_obj(self._parse_item(item))
+        if embedded:
+            for space in parkinglot.spaces:
+                parkinglot.mark_space_changed(space.id)
+        return parkinglot
+
+    def _partial(self, item: Dict[str, Any]) -> ParkinglotAggregate:
+        parkinglot = ParkinglotAggregate.parse_obj(self._parse_item(item))
+        parkinglot.track_header(self._header(parkinglot))
+        return parkinglot
+
+    def _projection(self, attributes: List[str]) -> Dict[str, Any]:
+        names = {f"#p{i}": name for i, name in enumerate(attributes)}
+        return {
+            "ProjectionExpression": ", ".join(names),
+            "ExpressionAttributeNames": names,
+        }
+
+    def get_version(self, parkinglot_id: ParkinglotId) -> Optional[int]:
+        if not (owner_id := self._resolve_owner(parkinglot_id)):
+            return None
+        item = self._table.get_item(
+            Key={"pk": str(owner_id), "sk": self._format_sk(parkinglot_id)},
+            ProjectionExpression="version",
+        ).get("Item")
+        return int(item["version"]) if item else None
+
+    def get_owner(self, parkinglot_id: ParkinglotId) -> Optional[OwnerId]:
+        return self._resolve_owner(parkinglot_id)
+
+    def _query_spaces(
+        self,
+        owner_id: OwnerId,
+        parkinglot_id: ParkinglotId,
+    ) -> List[Dict[str, Any]]:
+        kwargs: Dict[str, Any] = {
+            "KeyConditionExpression": (
+                Key("pk").eq(str(owner_id))
+                & Key("sk").begins_with(f"SPACE::{parkinglot_id}::")
+            ),
+        }
+        items: List[Dict[str, Any]] = []
+        while True:
+            response = self._table.query(**kwargs)
+            items.extend(response["Items"])
+            if "LastEvaluatedKey" not in response:
+                return items
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def _space_item(
+        self,
+        parkinglot: ParkinglotAggregate,
+        space: ParkingSpace,
+    ) -> Dict[str, Any]:
+        item = {
+            "pk": str(parkinglot.owner_id),
+            "sk": f"SPACE::{parkinglot.id}::{space.internal_id:06d}",
+            **json.loads(space.json(), parse_float=Decimal),
+        }
+        # only booked spaces with a duration are in the sparse expiry index
+        if space.booking_id and space.booked_util:
+            item["expiry_bucket"] = expiry_bucket(space.booked_util)
+            item["expires_at"] = item["booked_util"]
+        return item
+
+    def reserve_space(
+        self,
+        parkinglot_id: ParkinglotId,
+        driver_id: DriverId,
+        booking_id: BookingId,
+        booking_duration: Optional[timedelta] = None,
+    ) -> Optional[SpaceReservation]:
+        if not (owner_id := self._resolve_owner(parkinglot_id)):
+            return None
+        space_id = self._claim_free_space(
+            owner_id, parkinglot_id, driver_id, booking_id, booking_duration
+        )
+        if not space_id and self._migrate_embedded_spaces(owner_id, parkinglot_id):
+            space_id = self._claim_free_space(
+                owner_id, parkinglot_id, driver_id, booking_id, booking_duration
+            )
+        item = self._table.get_item(
+            Key={"pk": str(owner_id), "sk": self._format_sk(parkinglot_id)},
+            ProjectionExpression="price, h3cell, free_spaces",
+            ConsistentRead=True,
+        ).get("Item")
+        if not item:
+            return None
+        return SpaceReservation(
+            parkinglot_id=parkinglot_id,
+            booking_id=booking_id,
+            space_id=space_id,
+            **item,
+        )
+
+    # decrements free_spaces, books one free space and records the booking
+    # in a single transaction, a space booked by someone else moves to the
+    # next one
+    def _claim_free_space(
+        self,
+        owner_id: OwnerId,
+        parkinglot_id: ParkinglotId,
+        driver_id: DriverId,
+        booking_id: BookingId,
+        booking_duration: Optional[timedelta],
+    ) -> Optional[ParkingSpaceId]:
+        client = self._table.meta.client
+        booked_from = datetime.now()
+        booked_util = booked_from + booking_duration if booking_duration else None
+        space_update = (
+            "SET booked_by = :driver_id, booking_id = :booking_id, "
+            "booked_from = :booked_from, booked_util = :booked_util"
+        )
+        space_values = {
+            ":driver_id": str(driver_id),
+            ":booking_id": str(booking_id),
+            ":booked_from": booked_from.isoformat(),
+            ":booked_util": booked_util.isoformat() if booked_util else None,
+            ":null": "NULL",
+        }
+        if booked_util:
+            space_update += (
+                ", expiry_bucket = :expiry_bucket, expires_at = :booked_util"
+            )
+            space_values[":expiry_bucket"] = expiry_bucket(booked_util)
+        reservation_key = {
+            "pk": str(owner_id),
+            "sk": f"RESERVATION::{parkinglot_id}::{booking_id}",
+        }
+        reservation_ttl = int((booked_from + RESERVATION_RETENTION).timestamp())
+        if reserved := self._reserved_space(reservation_key):
+            return reserved
+        for space in self._free_spaces(owner_id, parkinglot_id):
+            try:
+                client.transact_write_items(
+                    TransactItems=[
+                        {
+                            "Update": {
+                                "TableName": self._table.name,
+                                "Key": {
+                                    "pk": str(owner_id),
+                                    "sk": self._format_sk(parkinglot_id),
+                                },
+                                "UpdateExpression": (
+                                    "SET free_spaces = free_spaces - :one "
+                                    "ADD version :one"
+                                ),
+                                "ConditionExpression": "free_spaces > :zero",
+                                "ExpressionAttributeValues": {":one": 1, ":zero": 0},
+                            }
+                        },
+                        {
+                            "Update": {
+                                "TableName": self._table.name,
+                                "Key": {"pk": space["pk"], "sk": space["sk"]},
+                                "UpdateExpression": space_update,
+                                "ConditionExpression": (
+                                    "attribute_not_exists(booking_id) "
+                                    "OR attribute_type(booking_id, :null)"
+                                ),
+                                "ExpressionAttributeValues": space_values,
+                            }
+                        },
+                        {
+                            "Put": {
+                                "TableName": self._table.name,
+                                "Item": {
+                                    **reservation_key,
+                                    "space_id": space["id"],
+                                    "ttl": reservation_ttl,
+                                },
+                                "ConditionExpression": "attribute_not_exists(sk)",
+                            }
+                        },
+                    ]
+                )
+            except client.exceptions.TransactionCanceledException as e:
+                lot, booked, reservation = [
+                    r["Code"] for r in e.response["CancellationReasons"]
+                ]
+                if reservation == "ConditionalCheckFailed":
+                    return self._reserved_space(reservation_key)
+                if lot == "ConditionalCheckFailed":
+                    return None
+                if booked == "ConditionalCheckFailed":
+                    continue
+                # a transaction conflict on the shared lot counter says
+                # nothing about this space, the command retries it
+                raise ConcurrencyConflict(str(parkinglot_id)) from e
+            return ParkingSpaceId(space["id"])
+        return None
+
+    # a redelivered booking gets back the space it already holds
+    def _reserved_space(self, key: Dict[str, str]) -> Optional[ParkingSpaceId]:
+        item = self._table.get_item(Key=key, ConsistentRead=True).get("Item")
+        return ParkingSpaceId(item["space_id"]) if item else None
+
+    def _free_spaces(
+        self,
+        owner_id: OwnerId,
+        parkinglot_id: ParkinglotId,
+    ) -> Iterator[Dict[str, Any]]:
+        kwargs: Dict[str, Any] = {
+            "KeyConditionExpression": (
+                Key("pk").eq(str(owner_id))
+                & Key("sk").begins_with(f"SPACE::{parkinglot_id}::")
+            ),
+            "FilterExpression": (
+                Attr("booking_id").not_exists()
+                | Attr("booking_id").attribute_type("NULL")
+            ),
+            "ProjectionExpression": "pk, sk, id",
+            "Limit": FREE_SPACES_PAGE,
+        }
+        while True:
+            response = self._table.query(**kwargs)
+            # concurrent bookings read the same page, shuffling spreads them
+            # over different spaces
+            spaces = response["Items"]
+            random.shuffle(spaces)
+            yield from spaces
+            if "LastEvaluatedKey" not in response:
+                return None
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def _migrate_embedded_spaces(
+        self,
+        owner_id: OwnerId,
+        parkinglot_id: ParkinglotId,
+    ) -> bool:
+        item = self._table.get_item(
+            Key={"pk": str(owner_id), "sk": self._format_sk(parkinglot_id)},
+            ProjectionExpression="#spaces",
+            ExpressionAttributeNames={"#spaces": "spaces"},
+        ).get("Item")
+        if not item or "spaces" not in item:
+            return False
+        if parkinglot := self.get(parkinglot_id, owner_id, with_spaces=True):
+            self.save(parkinglot)
+        return True
+
+    # oldest expiries first, lots with many expired spaces show up once
+    def expired_parkinglots(
+        self,
+        until: datetime,
+        limit: int,
+    ) -> List[Tuple[ParkinglotId, OwnerId]]:
+        parkinglots: Dict[str, str] = {}
+        for bucket in expiry_buckets(until):
+            kwargs: Dict[str, Any] = {
+                "IndexName": self._expiry_index,
+                "KeyConditionExpression": (
+                    Key("expiry_bucket").eq(bucket)
+                    & Key("expires_at").lte(until.isoformat())
+                ),
+            }
+            while len(parkinglots) < limit:
+                response = self._table.query(**kwargs)
+                for item in response["Items"]:
+                    parkinglot_id = str(item["sk"]).split("::")[1]
+                    parkinglots.setdefault(parkinglot_id, str(item["pk"]))
+                if "LastEvaluatedKey" not in response:
+                    break
+                kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        return [
+            (ParkinglotId(parkinglot_id), OwnerId(owner_id))
+            for parkinglot_id, owner_id in list(parkinglots.items())[:limit]
+        ]
 
     def _format_sk(self, parkinglot_id: ParkinglotId) -> str:
         return f"PARKINGLOT::{parkinglot_id}"
 
     def _resolve_owner(self, parkinglot_id: ParkinglotId) -> Optional[OwnerId]:
+        owner_id = self._owners.get(parkinglot_id)
+        if owner_id:
+            return owner_id
         items = self._table.query(
             IndexName=self._inverted_index,
             KeyConditionExpression=Key("sk").eq(self._format_sk(parkinglot_id)),
         )["Items"]
         if not items:
             return None
-        return OwnerId(str(items[0]["pk"]))
+        owner_id = OwnerId(str(items[0]["pk"]))
+        self._owners.set(parkinglot_id, owner_id)
+        return owner_id
+
+    def owner_cache_stats(self) -> CacheStats:
+        return self._owners.stats()
 
     def list(self, owner_id: OwnerId) -> List[ParkinglotAggregate]:
-        items = self._table.query(
-            KeyConditionExpression=(
+        kwargs: Dict[str, Any] = {
+            "KeyConditionExpression": (
                 Key("pk").eq(str(owner_id)) & Key("sk").begins_with("PARKINGLOT::")
             ),
-        )["Items"]
+            **self._projection(HEADER_ATTRIBUTES),
+        }
+        items: List[Dict[str, Any]] = []
+        while True:
+            response = self._table.query(**kwargs)
+            items.extend(response["Items"])
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        return [self._partial(i) for i in items]
 
-        return parse_obj_as(
-            List[ParkinglotAggregate], (self._parse_item(i) for i in items)
+    def list_page(
+        self,
+        owner_id: OwnerId,
+        limit: int,
+        start_after: Optional[ParkinglotId] = None,
+    ) -> ParkinglotSummaryPage:
+        kwargs: Dict[str, Any] = {
+            "KeyConditionExpression": (
+                Key("pk").eq(str(owner_id)) & Key("sk").begins_with("PARKINGLOT::")
+            ),
+            "Limit": limit,
+            **self._projection(SUMMARY_ATTRIBUTES),
+        }
+        if start_after:
+            kwargs["ExclusiveStartKey"] = {
+                "pk": str(owner_id),
+                "sk": self._format_sk(start_after),
+            }
+        response = self._table.query(**kwargs)
+        last_key = response.get("LastEvaluatedKey")
+        return ParkinglotSummaryPage(
+            parkinglots=[
+                ParkinglotSummary.parse_obj(self._parse_item(item))
+                for item in response["Items"]
+            ],
+            last_id=str(last_key["sk"]).split("::")[1] if last_key else None,
         )
 
     def _parse_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
@@ -76,16 +569,163 @@ class DynamodbParkinglotRepository(ParkinglotRepository):
         return item
 
 
+# keeps copies of the aggregates the way the table keeps items, so callers
+# only see their changes after a save and stale saves conflict
 class RamParkinglotRepository(ParkinglotRepository):
+    def __init__(self) -> None:
+        self._parkinglots: Dict[ParkinglotId, ParkinglotAggregate] = {}
+        self._owners: Dict[OwnerId, Set[ParkinglotId]] = defaultdict(set)
+        self._expiries: Dict[ParkinglotId, datetime] = {}
+        self._reservations: Dict[Tuple[ParkinglotId, BookingId], ParkingSpaceId] = {}
+        self._lock = threading.Lock()
+
     def save(self, parkinglot: ParkinglotAggregate) -> None:
-        return super().save(parkinglot)
+        parkinglot.refresh_updated_on()
+        with self._lock:
+            stored = self._parkinglots.get(parkinglot.id)
+            # a lot loaded without its spaces only updates its header
+            if parkinglot.loaded_header() is not None:
+                if not stored or stored.version != parkinglot.version:
+                    raise ConcurrencyConflict(str(parkinglot.id))
+                header = self._header(parkinglot.copy(deep=True))
+                self._parkinglots[parkinglot.id] = stored.copy(
+                    update={**header, "version": parkinglot.version + 1}
+                )
+                parkinglot.track_header(header)
+                return None
+            if stored and stored.version != parkinglot.version:
+                raise ConcurrencyConflict(str(parkinglot.id))
+            stored = parkinglot.copy(
+                update={"version": parkinglot.version + 1}, deep=True
+            )
+            stored.pull_events()
+            parkinglot.pull_changed_spaces()
+            stored.pull_changed_spaces()
+            self._parkinglots[parkinglot.id] = stored
+            self._owners[parkinglot.owner_id].add(parkinglot.id)
+            self._index_expiry(stored)
 
     def get(
         self,
         parkinglot_id: ParkinglotId,
         owner_id: Optional[OwnerId] = None,
+        with_spaces: bool = False,
     ) -> Optional[ParkinglotAggregate]:
-        return super().get(parkinglot_id, owner_id)
+        with self._lock:
+            stored = self._parkinglots.get(parkinglot_id)
+            if not stored or owner_id and stored.owner_id != owner_id:
+                return None
+            if with_spaces:
+                return stored.copy(deep=True)
+            return self._partial(stored)
+
+    def get_version(self, parkinglot_id: ParkinglotId) -> Optional[int]:
+        with self._lock:
+            stored = self._parkinglots.get(parkinglot_id)
+            return stored.version if stored else None
+
+    def get_owner(self, parkinglot_id: ParkinglotId) -> Optional[OwnerId]:
+        with self._lock:
+            stored = self._parkinglots.get(parkinglot_id)
+            return stored.owner_id if stored else None
 
     def list(self, owner_id: OwnerId) -> List[ParkinglotAggregate]:
-        return super().list(owner_id)
+        with self._lock:
+            return [
+                self._partial(self._parkinglots[parkinglot_id])
+                for parkinglot_id in self._owned(owner_id)
+            ]
+
+    def list_page(
+        self,
+        owner_id: OwnerId,
+        limit: int,
+        start_after: Optional[ParkinglotId] = None,
+    ) -> ParkinglotSummaryPage:
+        with self._lock:
+            parkinglot_ids = [
+                parkinglot_id
+                for parkinglot_id in self._owned(owner_id)
+                if not start_after or str(parkinglot_id) > str(start_after)
+            ]
+            page = [
+                ParkinglotSummary(**self._parkinglots[parkinglot_id].dict())
+                for parkinglot_id in parkinglot_ids[:limit]
+            ]
+        if len(parkinglot_ids) <= limit:
+            return ParkinglotSummaryPage(parkinglots=page)
+        return ParkinglotSummaryPage(parkinglots=page, last_id=page[-1].id)
+
+    def reserve_space(
+        self,
+        parkinglot_id: ParkinglotId,
+        driver_id: DriverId,
+        booking_id: BookingId,
+        booking_duration: Optional[timedelta] = None,
+    ) -> Optional[SpaceReservation]:
+        with self._lock:
+            if not (stored := self._parkinglots.get(parkinglot_id)):
+                return None
+            space_id = self._reservations.get((parkinglot_id, booking_id))
+            # a redelivered booking gets back the space it already holds
+            if not space_id and stored.free_spaces > 0:
+                stored.accommodate_booking(driver_id, booking_id, booking_duration)
+                space_id = next(
+                    (
+                        e.space_id
+                        for e in stored.pull_events()
+                        if isinstance(e, BookingAccommodated)
+                    ),
+                    None,
+                )
+                stored.pull_changed_spaces()
+                if space_id:
+                    self._reservations[(parkinglot_id, booking_id)] = space_id
+                    stored.version += 1
+                    self._index_expiry(stored)
+            return SpaceReservation(
+                parkinglot_id=parkinglot_id,
+                booking_id=booking_id,
+                space_id=space_id,
+                price=stored.price,
+                h3cell=stored.h3cell,
+                free_spaces=stored.free_spaces,
+            )
+
+    # oldest expiries first
+    def expired_parkinglots(
+        self,
+        until: datetime,
+        limit: int,
+    ) -> List[Tuple[ParkinglotId, OwnerId]]:
+        with self._lock:
+            expired = sorted(
+                (expiry, parkinglot_id)
+                for parkinglot_id, expiry in self._expiries.items()
+                if expiry <= until
+            )
+            return [
+                (parkinglot_id, self._parkinglots[parkinglot_id].owner_id)
+                for _, parkinglot_id in expired[:limit]
+            ]
+
+    def _owned(self, owner_id: OwnerId) -> List[ParkinglotId]:
+        return sorted(self._owners.get(owner_id, ()), key=str)
+
+    def _partial(self, stored: ParkinglotAggregate) -> ParkinglotAggregate:
+        parkinglot = stored.copy(update={"spaces": ParkingSpaces()}, deep=True)
+        parkinglot.track_header(self._header(parkinglot))
+        return parkinglot
+
+    def _header(self, parkinglot: ParkinglotAggregate) -> Dict[str, Any]:
+        return {
+            name: getattr(parkinglot, name)
+            for name in parkinglot.__fields__
+            if name not in ("id", "owner_id", "version", "spaces")
+        }
+
+    def _index_expiry(self, parkinglot: ParkinglotAggregate) -> None:
+        if expiry := parkinglot.spaces.next_expiry():
+            self._expiries[parkinglot.id] = expiry
+        else:
+            self._expiries.pop(parkinglot.id, None)
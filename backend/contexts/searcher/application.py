@@ -1,15 +1,79 @@
-from typing import List
+import math
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import h3
+import numpy as np
 from pydantic import BaseModel
 
-from backend.contexts.searcher.domain import Parkinglot, ParkinglotSearchRepository
+from backend.contexts.parkinglot.domain import (
+    H3_PARENT_RESOLUTIONS,
+    H3_RESOLUTION,
+    Coordinates,
+    Price,
+)
+from backend.contexts.searcher.domain import (
+    Parkinglot,
+    ParkinglotSearchRepository,
+    SearchCursor,
+    SearchFilter,
+    ViewportTooLarge,
+)
+from backend.contexts.shared.domain import (
+    ULID,
+    InvalidCursor,
+    ParkinglotId,
+    decode_cursor,
+    encode_cursor,
+)
+
+# a coarser cell replaces its children once this share of them is searched,
+# the extra lots it brings are dropped by the ring filter
+MIN_PARENT_COVERAGE = 0.5
+
+EARTH_RADIUS_M = 6371008.8
+
+# a viewport is searched at the finest indexed resolution that stays under
+# this many cells
+MAX_VIEWPORT_CELLS = 300
+
+LatLng = Tuple[float, float]
 
 
 class SearchResponse(BaseModel):
     central_cell: str
     current_distance: int
     parkinglots: List[Parkinglot]
+    cursor: Optional[str] = None
+
+
+class SearchRing(BaseModel):
+    distance: int
+    parkinglots: List[Parkinglot]
+
+
+class NearbyParkinglot(Parkinglot):
+    distance_m: float
+
+
+class NearestResponse(BaseModel):
+    central_cell: str
+    radius_m: float
+    parkinglots: List[NearbyParkinglot]
+
+
+class ParkinglotCluster(BaseModel):
+    h3cell: str
+    coordinates: Coordinates
+    count: int
+    free_spaces: int
+    min_price: Price
+
+
+class ViewportResponse(BaseModel):
+    resolution: int
+    parkinglots: List[Parkinglot]
+    clusters: List[ParkinglotCluster]
 
 
 def search_by_coordinates(
@@ -19,13 +83,17 @@ def search_by_coordinates(
     end_distance: int,
     limit: int,
     repo: ParkinglotSearchRepository,
+    search_filter: Optional[SearchFilter] = None,
+    cursor: Optional[str] = None,
 ) -> SearchResponse:
     return search_by_cell(
-        central_cell=h3.latlng_to_cell(lat, lng, 8),
+        central_cell=h3.latlng_to_cell(lat, lng, H3_RESOLUTION),
         start_distance=start_distance,
         end_distance=end_distance,
         limit=limit,
         repo=repo,
+        search_filter=search_filter,
+        cursor=cursor,
     )
 
 
@@ -35,22 +103,370 @@ def search_by_cell(
     end_distance: int,
     limit: int,
     repo: ParkinglotSearchRepository,
+    search_filter: Optional[SearchFilter] = None,
+    cursor: Optional[str] = None,
 ) -> SearchResponse:
-    current_distance = start_distance - 1
-    parkinglots = []
-    while len(parkinglots) < limit:
-        current_distance += 1
-        cells = (
-            [central_cell]
-            if current_distance == 0
-            else h3.grid_ring(central_cell, current_distance)
+    if cursor:
+        return resume_search(
+            central_cell=central_cell,
+            search_cursor=decode_cursor(cursor, SearchCursor),
+            start_distance=start_distance,
+            end_distance=end_distance,
+            limit=limit,
+            repo=repo,
+            search_filter=search_filter,
         )
-        parkinglots.extend(repo.query(cells))
-        if current_distance >= end_distance:
+
+    distances = range(start_distance, max(start_distance, end_distance) + 1)
+    cell_distances = {
+        cell: distance
+        for distance in distances
+        for cell in ring(central_cell, distance)
+    }
+
+    rings: Dict[int, List[Parkinglot]] = defaultdict(list)
+    for parkinglot in repo.query(cover_cells(cell_distances), search_filter):
+        if (distance := cell_distances.get(parkinglot.h3cell)) is not None:
+            rings[distance].append(parkinglot)
+
+    parkinglots: List[Parkinglot] = []
+    for current_distance in distances:
+        parkinglots.extend(sorted(rings[current_distance], key=lambda p: p.h3cell))
+        if len(parkinglots) >= limit:
             break
 
+    next_cursor = None
+    if current_distance < end_distance:
+        next_cursor = encode_cursor(SearchCursor(distance=current_distance + 1))
     return SearchResponse(
         central_cell=central_cell,
         current_distance=current_distance,
         parkinglots=parkinglots,
+        cursor=next_cursor,
+    )
+
+
+# continues cell by cell from the exact position of the cursor, so a page
+# only reads the cells that were not returned yet
+def resume_search(
+    central_cell: str,
+    search_cursor: SearchCursor,
+    start_distance: int,
+    end_distance: int,
+    limit: int,
+    repo: ParkinglotSearchRepository,
+    search_filter: Optional[SearchFilter] = None,
+) -> SearchResponse:
+    # the cursor comes from the client, it is checked before any ring is built
+    if not start_distance <= search_cursor.distance <= end_distance:
+        raise InvalidCursor
+    if search_cursor.offset < 0:
+        raise InvalidCursor
+    parkinglots: List[Parkinglot] = []
+    position = search_cursor
+    current_distance = search_cursor.distance
+    cells = ring(central_cell, current_distance)
+    if search_cursor.offset >= len(cells):
+        raise InvalidCursor
+
+    while position.distance <= end_distance and len(parkinglots) < limit:
+        if position.distance != current_distance:
+            current_distance = position.distance
+            cells = ring(central_cell, current_distance)
+        page = repo.query_page(
+            cells[position.offset],
+            limit=limit - len(parkinglots),
+            search_filter=search_filter,
+            start_key=position.last_key,
+        )
+        parkinglots.extend(page.parkinglots)
+        position = next_position(position, page.last_key, len(cells))
+
+    return SearchResponse(
+        central_cell=central_cell,
+        current_distance=current_distance,
+        parkinglots=parkinglots,
+        cursor=encode_cursor(position) if position.distance <= end_distance else None,
+    )
+
+
+def next_position(
+    position: SearchCursor,
+    last_key: Optional[Dict[str, Any]],
+    ring_size: int,
+) -> SearchCursor:
+    if last_key:
+        return position.copy(update={"last_key": last_key})
+    if position.offset + 1 < ring_size:
+        return SearchCursor(distance=position.distance, offset=position.offset + 1)
+    return SearchCursor(distance=position.distance + 1)
+
+
+def iter_search_by_coordinates(
+    lat: float,
+    lng: float,
+    start_distance: int,
+    end_distance: int,
+    limit: int,
+    repo: ParkinglotSearchRepository,
+    search_filter: Optional[SearchFilter] = None,
+) -> Iterator[SearchRing]:
+    return iter_search_by_cell(
+        central_cell=h3.latlng_to_cell(lat, lng, H3_RESOLUTION),
+        start_distance=start_distance,
+        end_distance=end_distance,
+        limit=limit,
+        repo=repo,
+        search_filter=search_filter,
+    )
+
+
+# queries ring by ring so the nearest lots are out before the outer rings
+# are read, at the cost of not compacting the rings into coarser cells
+def iter_search_by_cell(
+    central_cell: str,
+    start_distance: int,
+    end_distance: int,
+    limit: int,
+    repo: ParkinglotSearchRepository,
+    search_filter: Optional[SearchFilter] = None,
+) -> Iterator[SearchRing]:
+    found = 0
+    for distance in range(start_distance, max(start_distance, end_distance) + 1):
+        parkinglots = sorted(
+            repo.query(ring(central_cell, distance), search_filter),
+            key=lambda p: p.h3cell,
+        )
+        yield SearchRing(distance=distance, parkinglots=parkinglots)
+        found += len(parkinglots)
+        if found >= limit:
+            return
+
+
+def ring(central_cell: str, distance: int) -> List[str]:
+    if distance == 0:
+        return [central_cell]
+    return sorted(h3.grid_ring(central_cell, distance))
+
+
+def cover_cells(
+    cells: Iterable[str],
+    resolutions: Sequence[int] = H3_PARENT_RESOLUTIONS,
+    min_coverage: float = MIN_PARENT_COVERAGE,
+) -> List[str]:
+    remaining = set(cells)
+    cover: List[str] = []
+    for resolution in sorted(resolutions):
+        children = 7 ** (H3_RESOLUTION - resolution)
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for cell in remaining:
+            groups[h3.cell_to_parent(cell, resolution)].append(cell)
+        for parent, group in sorted(groups.items()):
+            if len(group) >= min_coverage * children:
+                cover.append(parent)
+                remaining.difference_update(group)
+    return cover + sorted(remaining)
+
+
+def search_nearest(
+    lat: float,
+    lng: float,
+    radius_m: float,
+    limit: int,
+    repo: ParkinglotSearchRepository,
+    search_filter: Optional[SearchFilter] = None,
+) -> NearestResponse:
+    central_cell = h3.latlng_to_cell(lat, lng, H3_RESOLUTION)
+    cells = h3.grid_disk(central_cell, rings_for_radius(central_cell, radius_m))
+    candidates = repo.query(cover_cells(cells), search_filter)
+
+    distances = haversine(
+        lat,
+        lng,
+        np.array([float(p.coordinates.lat) for p in candidates]),
+        np.array([float(p.coordinates.lng) for p in candidates]),
+    )
+    inside = np.flatnonzero(distances <= radius_m)
+    nearest = inside[np.argsort(distances[inside], kind="stable")][:limit]
+
+    return NearestResponse(
+        central_cell=central_cell,
+        radius_m=radius_m,
+        parkinglots=[
+            NearbyParkinglot(**candidates[i].dict(), distance_m=distances[i])
+            for i in nearest
+        ],
+    )
+
+
+def rings_for_radius(central_cell: str, radius_m: float) -> int:
+    # the inner radius of a k disk is about 1.5 * k edges, the extra edge
+    # accounts for the point being anywhere inside the central cell
+    edge_m = min(
+        h3.edge_length(edge, "m") for edge in h3.origin_to_directed_edges(central_cell)
     )
+    return math.ceil((radius_m + edge_m) / (1.5 * edge_m))
+
+
+def haversine(
+    lat: float,
+    lng: float,
+    lats: np.ndarray,
+    lngs: np.ndarray,
+) -> np.ndarray:
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def search_bbox(
+    south: float,
+    west: float,
+    north: float,
+    east: float,
+    limit: int,
+    repo: ParkinglotSearchRepository,
+    search_filter: Optional[SearchFilter] = None,
+) -> ViewportResponse:
+    return search_viewport(
+        polygon=[(south, west), (south, east), (north, east), (north, west)],
+        limit=limit,
+        repo=repo,
+        search_filter=search_filter,
+    )
+
+
+def search_viewport(
+    polygon: List[LatLng],
+    limit: int,
+    repo: ParkinglotSearchRepository,
+    search_filter: Optional[SearchFilter] = None,
+) -> ViewportResponse:
+    resolution = viewport_resolution(polygon)
+    cells = viewport_cells(polygon, resolution)
+    if resolution == H3_RESOLUTION:
+        cells = cover_cells(cells)
+    candidates = repo.query(cells, search_filter)
+
+    inside = contains(
+        polygon,
+        np.array([float(p.coordinates.lat) for p in candidates]),
+        np.array([float(p.coordinates.lng) for p in candidates]),
+    )
+    parkinglots = [p for p, i in zip(candidates, inside) if i]
+    if len(parkinglots) <= limit:
+        return ViewportResponse(
+            resolution=resolution, parkinglots=parkinglots, clusters=[]
+        )
+    return ViewportResponse(
+        resolution=resolution,
+        parkinglots=[],
+        clusters=cluster_parkinglots(parkinglots, resolution, limit),
+    )
+
+
+def viewport_resolution(polygon: List[LatLng]) -> int:
+    area_m2 = polygon_area(polygon)
+    for resolution in (H3_RESOLUTION, *sorted(H3_PARENT_RESOLUTIONS, reverse=True)):
+        cells = area_m2 / h3.average_hexagon_area(resolution, "m^2")
+        if cells <= MAX_VIEWPORT_CELLS:
+            return resolution
+    raise ViewportTooLarge
+
+
+def viewport_cells(polygon: List[LatLng], resolution: int) -> List[str]:
+    # polygon_to_cells only returns cells whose center is inside, the
+    # buffer ring catches lots in the cells cut by the edges
+    cells = set(h3.polygon_to_cells(h3.Polygon(polygon), resolution))
+    cells.update(h3.latlng_to_cell(lat, lng, resolution) for lat, lng in polygon)
+    return sorted({c for cell in cells for c in h3.grid_disk(cell, 1)})
+
+
+def polygon_area(polygon: List[LatLng]) -> float:
+    lats = np.radians([lat for lat, _ in polygon])
+    lngs = np.radians([lng for _, lng in polygon])
+    x = lngs * np.cos(lats.mean()) * EARTH_RADIUS_M
+    y = lats * EARTH_RADIUS_M
+    return abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+
+
+def contains(polygon: List[LatLng], lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    inside = np.zeros(len(lats), dtype=bool)
+    for (lat1, lng1), (lat2, lng2) in zip(polygon, polygon[1:] + polygon[:1]):
+        crosses = (lat1 > lats) != (lat2 > lats)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lng_at_lat = lng1 + (lats - lat1) * (lng2 - lng1) / (lat2 - lat1)
+        inside ^= crosses & (lngs < lng_at_lat)
+    return inside
+
+
+def cluster_parkinglots(
+    parkinglots: List[Parkinglot],
+    resolution: int,
+    limit: int,
+) -> List[ParkinglotCluster]:
+    while True:
+        groups: Dict[str, List[Parkinglot]] = defaultdict(list)
+        for parkinglot in parkinglots:
+            groups[h3.cell_to_parent(parkinglot.h3cell, resolution)].append(parkinglot)
+        if len(groups) <= limit or resolution == 0:
+            break
+        resolution -= 1
+
+    return [
+        ParkinglotCluster(
+            h3cell=h3cell,
+            coordinates=Coordinates(
+                lat=round(np.mean([float(p.coordinates.lat) for p in group]), 6),
+                lng=round(np.mean([float(p.coordinates.lng) for p in group]), 6),
+            ),
+            count=len(group),
+            free_spaces=sum(p.free_spaces for p in group),
+            min_price=min(p.price for p in group),
+        )
+        for h3cell, group in sorted(groups.items())
+    ]
+
+
+def index_parkinglot(
+    parkinglot_id: ParkinglotId,
+    name: str,
+    street: str,
+    coordinates: Coordinates,
+    price: Price,
+    repo: ParkinglotSearchRepository,
+) -> None:
+    repo.save(
+        Parkinglot(
+            h3cell=h3.latlng_to_cell(coordinates.lat, coordinates.lng, H3_RESOLUTION),
+            parkinglot_id=parkinglot_id,
+            name=name,
+            street=street,
+            coordinates=coordinates,
+            price=price,
+        )
+    )
+
+
+def update_parkinglot_price(
+    parkinglot_id: ParkinglotId,
+    h3cell: str,
+    price: Price,
+    event_id: ULID,
+    repo: ParkinglotSearchRepository,
+) -> None:
+    repo.update_price(parkinglot_id, h3cell, price, event_id)
+
+
+def update_parkinglot_free_spaces(
+    parkinglot_id: ParkinglotId,
+    h3cell: str,
+    free_spaces: int,
+    event_id: ULID,
+    repo: ParkinglotSearchRepository,
+) -> None:
+    repo.update_free_spaces(parkinglot_id, h3cell, free_spaces, event_id)
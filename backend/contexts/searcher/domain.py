@@ -1,8 +1,8 @@
-from typing import List, Protocol
+from typing import Any, Dict, List, Optional, Protocol
 from pydantic import BaseModel
-from backend.contexts.parkinglot.domain import Coordinates
+from backend.contexts.parkinglot.domain import Coordinates, Price
 
-from backend.contexts.shared.domain import ParkinglotId
+from backend.contexts.shared.domain import ULID, ParkinglotId
 
 
 class Parkinglot(BaseModel):
@@ -11,8 +11,72 @@ class Parkinglot(BaseModel):
     name: str
     street: str
     coordinates: Coordinates
+    price: Price
+    free_spaces: int = 0
+
+
+class SearchFilter(BaseModel):
+    min_free_spaces: int = 0
+    max_price: Optional[Price] = None
+
+    def matches(self, parkinglot: Parkinglot) -> bool:
+        if parkinglot.free_spaces < self.min_free_spaces:
+            return False
+        if self.max_price is not None and parkinglot.price > self.max_price:
+            return False
+        return True
+
+
+class SearchCursor(BaseModel):
+    distance: int
+    offset: int = 0
+    last_key: Optional[Dict[str, Any]] = None
+
+
+class ParkinglotPage(BaseModel):
+    parkinglots: List[Parkinglot]
+    last_key: Optional[Dict[str, Any]] = None
 
 
 class ParkinglotSearchRepository(Protocol):
-    def query(self, h3hashes: List[str]) -> List[Parkinglot]:
+    def save(self, parkinglot: Parkinglot) -> None:
+        ...
+
+    def update_price(
+        self,
+        parkinglot_id: ParkinglotId,
+        h3cell: str,
+        price: Price,
+        event_id: ULID,
+    ) -> None:
         ...
+
+    def update_free_spaces(
+        self,
+        parkinglot_id: ParkinglotId,
+        h3cell: str,
+        free_spaces: int,
+        event_id: ULID,
+    ) -> None:
+        ...
+
+    def query(
+        self,
+        h3hashes: List[str],
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[Parkinglot]:
+        ...
+
+    def query_page(
+        self,
+        h3hash: str,
+        limit: int,
+        search_filter: Optional[SearchFilter] = None,
+        start_key: Optional[Dict[str, Any]] = None,
+    ) -> ParkinglotPage:
+        ...
+
+
+class ViewportTooLarge(Exception):
+    def __str__(self) -> str:
+        return "Viewport too large"
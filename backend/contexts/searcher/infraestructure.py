@@ -1,34 +1,420 @@
-from typing import Any, Dict, List
+import json
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from functools import partial
+from typing import Any, Collection, Dict, List, Optional
 
 import boto3
+import h3
+from botocore.exceptions import ClientError
 from pydantic import parse_obj_as
-from backend.contexts.searcher.domain import Parkinglot, ParkinglotSearchRepository
-from boto3.dynamodb.conditions import Key
+from backend.contexts.parkinglot.domain import (
+    H3_PARENT_RESOLUTIONS,
+    H3_RESOLUTION,
+    Price,
+)
+from backend.contexts.searcher.domain import (
+    Parkinglot,
+    ParkinglotPage,
+    ParkinglotSearchRepository,
+    SearchFilter,
+)
+from backend.contexts.shared.domain import ULID, InvalidCursor, ParkinglotId
+from backend.contexts.shared.infrastructure import TTLCache
+from boto3.dynamodb.conditions import Attr, ConditionBase, Key
+
+
+def h3_index_attribute(resolution: int) -> str:
+    return f"h3cell_r{resolution}"
+
+
+def h3_index_attributes(h3cell: str) -> Dict[str, str]:
+    return {
+        h3_index_attribute(resolution): h3.cell_to_parent(h3cell, resolution)
+        for resolution in (H3_RESOLUTION, *H3_PARENT_RESOLUTIONS)
+    }
 
 
 class DynamodbParkinglotSearchRepository(ParkinglotSearchRepository):
-    def __init__(self, table_name: str, index_name: str) -> None:
-        self._index_name = index_name
-        resource = boto3.resource("dynamodb")
-        self._table = resource.Table(table_name)
-
-    def query(self, h3cells: List[str]) -> List[Parkinglot]:
-        parkinglots: List[Parkinglot] = []
-        for h3cell in h3cells:
-            items = self._table.query(
-                IndexName=self._index_name,
-                KeyConditionExpression=Key("h3cell").eq(h3cell),
-            )["Items"]
-            parkinglots.extend(
-                parse_obj_as(List[Parkinglot], (self._format_item(i) for i in items))
-            )
-        return parkinglots
+    def __init__(
+        self,
+        table_name: str,
+        index_name: str,
+        parent_index_names: Dict[int, str],
+        max_workers: int = 8,
+    ) -> None:
+        self._table_name = table_name
+        self._index_names = {H3_RESOLUTION: index_name, **parent_index_names}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # boto3 resources are not thread safe, each worker gets its own table
+        self._local = threading.local()
+
+    # price and free spaces may already come from events that overtook
+    # the ParkinglotCreated one
+    def save(self, parkinglot: Parkinglot) -> None:
+        item = json.loads(parkinglot.json(exclude={"h3cell"}), parse_float=Decimal)
+        self._update_item(
+            parkinglot.parkinglot_id,
+            {**item, **h3_index_attributes(parkinglot.h3cell)},
+            keep_existing={"price", "free_spaces"},
+        )
+
+    def update_price(
+        self,
+        parkinglot_id: ParkinglotId,
+        h3cell: str,
+        price: Price,
+        event_id: ULID,
+    ) -> None:
+        self._update_item(
+            parkinglot_id,
+            {"price": price, "price_event_id": str(event_id)},
+            condition=self._newer_than("price_event_id", event_id),
+        )
+
+    def update_free_spaces(
+        self,
+        parkinglot_id: ParkinglotId,
+        h3cell: str,
+        free_spaces: int,
+        event_id: ULID,
+    ) -> None:
+        self._update_item(
+            parkinglot_id,
+            {"free_spaces": free_spaces, "free_spaces_event_id": str(event_id)},
+            condition=self._newer_than("free_spaces_event_id", event_id),
+        )
+
+    def query(
+        self,
+        h3cells: List[str],
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[Parkinglot]:
+        query_cell = partial(
+            self._query_cell, filter_expression=self._filter_expression(search_filter)
+        )
+        if len(h3cells) <= 1:
+            results = map(query_cell, h3cells)
+        else:
+            results = self._executor.map(query_cell, h3cells)
+        # results come back in the order of the cells, overlapping cells
+        # return the same lot more than once and the first one is kept
+        parkinglots: Dict[ParkinglotId, Parkinglot] = {}
+        for cell_parkinglots in results:
+            for parkinglot in cell_parkinglots:
+                parkinglots.setdefault(parkinglot.parkinglot_id, parkinglot)
+        return list(parkinglots.values())
+
+    def query_page(
+        self,
+        h3hash: str,
+        limit: int,
+        search_filter: Optional[SearchFilter] = None,
+        start_key: Optional[Dict[str, Any]] = None,
+    ) -> ParkinglotPage:
+        kwargs = self._query_kwargs(h3hash, self._filter_expression(search_filter))
+        if start_key:
+            self._check_start_key(h3hash, start_key)
+        items: List[Dict[str, Any]] = []
+        # Limit counts the items read before filtering, keep reading until
+        # the page is full or the cell is exhausted
+        while len(items) < limit:
+            kwargs["Limit"] = limit - len(items)
+            if start_key:
+                kwargs["ExclusiveStartKey"] = start_key
+            try:
+                response = self._get_table().query(**kwargs)
+            except ClientError as e:
+                if "ExclusiveStartKey" in kwargs and (
+                    e.response["Error"]["Code"] == "ValidationException"
+                ):
+                    raise InvalidCursor from e
+                raise
+            items.extend(response["Items"])
+            start_key = response.get("LastEvaluatedKey")
+            if not start_key:
+                break
+        return ParkinglotPage(parkinglots=self._parse_items(items), last_key=start_key)
+
+    # start keys come back from clients inside search cursors
+    def _check_start_key(self, h3hash: str, start_key: Dict[str, Any]) -> None:
+        attribute = h3_index_attribute(h3.get_resolution(h3hash))
+        if set(start_key) != {"pk", "sk", attribute}:
+            raise InvalidCursor
+        if not all(isinstance(value, str) for value in start_key.values()):
+            raise InvalidCursor
+        if start_key[attribute] != h3hash:
+            raise InvalidCursor
+
+    def _query_cell(
+        self,
+        h3cell: str,
+        filter_expression: Optional[ConditionBase],
+    ) -> List[Parkinglot]:
+        kwargs = self._query_kwargs(h3cell, filter_expression)
+        items: List[Dict[str, Any]] = []
+        while True:
+            response = self._get_table().query(**kwargs)
+            items.extend(response["Items"])
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        return self._parse_items(items)
+
+    def _query_kwargs(
+        self,
+        h3cell: str,
+        filter_expression: Optional[ConditionBase],
+    ) -> Dict[str, Any]:
+        resolution = h3.get_resolution(h3cell)
+        kwargs: Dict[str, Any] = {
+            "IndexName": self._index_names[resolution],
+            "KeyConditionExpression": Key(h3_index_attribute(resolution)).eq(h3cell),
+        }
+        if filter_expression:
+            kwargs["FilterExpression"] = filter_expression
+        return kwargs
+
+    def _parse_items(self, items: List[Dict[str, Any]]) -> List[Parkinglot]:
+        return parse_obj_as(List[Parkinglot], [self._format_item(i) for i in items])
+
+    def _filter_expression(
+        self, search_filter: Optional[SearchFilter]
+    ) -> Optional[ConditionBase]:
+        if not search_filter:
+            return None
+        conditions: List[ConditionBase] = []
+        if search_filter.min_free_spaces:
+            conditions.append(Attr("free_spaces").gte(search_filter.min_free_spaces))
+        if search_filter.max_price is not None:
+            conditions.append(Attr("price").lte(search_filter.max_price))
+        if not conditions:
+            return None
+        expression = conditions[0]
+        for condition in conditions[1:]:
+            expression = expression & condition
+        return expression
+
+    def _get_table(self) -> Any:
+        if not (table := getattr(self._local, "table", None)):
+            table = self._local.table = self._create_table()
+        return table
+
+    def _create_table(self) -> Any:
+        resource = boto3.session.Session().resource("dynamodb")
+        return resource.Table(self._table_name)
 
     def _format_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
-        item["parkinglot_id"] = str(item["sk"]).split("::")[1]
+        item["h3cell"] = item[h3_index_attribute(H3_RESOLUTION)]
         return item
 
+    def _update_item(
+        self,
+        parkinglot_id: ParkinglotId,
+        values: Dict[str, Any],
+        keep_existing: Collection[str] = (),
+        condition: Optional[ConditionBase] = None,
+    ) -> None:
+        names = {f"#a{i}": name for i, name in enumerate(values)}
+        assignments = [
+            f"{n} = if_not_exists({n}, :a{i})"
+            if name in keep_existing
+            else f"{n} = :a{i}"
+            for i, (n, name) in enumerate(names.items())
+        ]
+        kwargs: Dict[str, Any] = {
+            "Key": {
+                "pk": f"PARKINGLOT::{parkinglot_id}",
+                "sk": f"SEARCH::{parkinglot_id}",
+            },
+            "UpdateExpression": "SET " + ", ".join(assignments),
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": {
+                f":a{i}": value for i, value in enumerate(values.values())
+            },
+        }
+        if condition:
+            kwargs["ConditionExpression"] = condition
+        table = self._get_table()
+        try:
+            table.update_item(**kwargs)
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            # a newer event was already applied
+            return None
+
+    def _newer_than(self, attribute: str, event_id: ULID) -> ConditionBase:
+        return Attr(attribute).not_exists() | Attr(attribute).lt(str(event_id))
+
 
 class RamParkinglotSearchRepository(ParkinglotSearchRepository):
-    def query(self, h3hashes: List[str]) -> List[Parkinglot]:
-        return super().query(h3hashes)
+    def __init__(self) -> None:
+        self._parkinglots: Dict[ParkinglotId, Parkinglot] = {}
+        self._cells: Dict[str, Dict[ParkinglotId, Parkinglot]] = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def save(self, parkinglot: Parkinglot) -> None:
+        with self._lock:
+            if previous := self._parkinglots.get(parkinglot.parkinglot_id):
+                for h3cell in self._index_cells(previous):
+                    self._cells[h3cell].pop(previous.parkinglot_id, None)
+            self._parkinglots[parkinglot.parkinglot_id] = parkinglot
+            for h3cell in self._index_cells(parkinglot):
+                self._cells[h3cell][parkinglot.parkinglot_id] = parkinglot
+
+    def update_price(
+        self,
+        parkinglot_id: ParkinglotId,
+        h3cell: str,
+        price: Price,
+        event_id: ULID,
+    ) -> None:
+        self._update(parkinglot_id, price=price)
+
+    def update_free_spaces(
+        self,
+        parkinglot_id: ParkinglotId,
+        h3cell: str,
+        free_spaces: int,
+        event_id: ULID,
+    ) -> None:
+        self._update(parkinglot_id, free_spaces=free_spaces)
+
+    def query(
+        self,
+        h3hashes: List[str],
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[Parkinglot]:
+        with self._lock:
+            return [
+                parkinglot
+                for h3hash in h3hashes
+                for parkinglot in self._cells.get(h3hash, {}).values()
+                if not search_filter or search_filter.matches(parkinglot)
+            ]
+
+    def query_page(
+        self,
+        h3hash: str,
+        limit: int,
+        search_filter: Optional[SearchFilter] = None,
+        start_key: Optional[Dict[str, Any]] = None,
+    ) -> ParkinglotPage:
+        with self._lock:
+            parkinglots = sorted(
+                self._cells.get(h3hash, {}).values(),
+                key=lambda p: str(p.parkinglot_id),
+            )
+        if start_key:
+            if set(start_key) != {"parkinglot_id"} or not isinstance(
+                start_key["parkinglot_id"], str
+            ):
+                raise InvalidCursor
+            parkinglots = [
+                p
+                for p in parkinglots
+                if str(p.parkinglot_id) > start_key["parkinglot_id"]
+            ]
+        if search_filter:
+            parkinglots = [p for p in parkinglots if search_filter.matches(p)]
+        page = parkinglots[:limit]
+        if len(parkinglots) <= limit:
+            return ParkinglotPage(parkinglots=page)
+        return ParkinglotPage(
+            parkinglots=page,
+            last_key={"parkinglot_id": str(page[-1].parkinglot_id)},
+        )
+
+    def _update(self, parkinglot_id: ParkinglotId, **changes: Any) -> None:
+        if parkinglot := self._parkinglots.get(parkinglot_id):
+            self.save(parkinglot.copy(update=changes))
+
+    def _index_cells(self, parkinglot: Parkinglot) -> List[str]:
+        return [parkinglot.h3cell] + [
+            h3.cell_to_parent(parkinglot.h3cell, resolution)
+            for resolution in H3_PARENT_RESOLUTIONS
+        ]
+
+
+# the updates only invalidate the cache of the process that applies them,
+# the events one, the api keeps cells until they expire so its ttl has to
+# stay at a few seconds
+class CachedParkinglotSearchRepository(ParkinglotSearchRepository):
+    def __init__(
+        self,
+        repo: ParkinglotSearchRepository,
+        maxsize: int,
+        ttl: float,
+    ) -> None:
+        self._repo = repo
+        self._cache: TTLCache[str, List[Parkinglot]] = TTLCache(maxsize, ttl)
+
+    def save(self, parkinglot: Parkinglot) -> None:
+        self._repo.save(parkinglot)
+        self.invalidate(parkinglot.h3cell)
+
+    def update_price(
+        self,
+        parkinglot_id: ParkinglotId,
+        h3cell: str,
+        price: Price,
+        event_id: ULID,
+    ) -> None:
+        self._repo.update_price(parkinglot_id, h3cell, price, event_id)
+        self.invalidate(h3cell)
+
+    def update_free_spaces(
+        self,
+        parkinglot_id: ParkinglotId,
+        h3cell: str,
+        free_spaces: int,
+        event_id: ULID,
+    ) -> None:
+        self._repo.update_free_spaces(parkinglot_id, h3cell, free_spaces, event_id)
+        self.invalidate(h3cell)
+
+    # cells are cached unfiltered so that every filter can share them
+    def query(
+        self,
+        h3hashes: List[str],
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[Parkinglot]:
+        cells = {h3hash: self._cache.get(h3hash) for h3hash in h3hashes}
+        if misses := [h3hash for h3hash, lots in cells.items() if lots is None]:
+            cells.update(self._query_misses(misses))
+        return [
+            p
+            for h3hash in h3hashes
+            for p in cells[h3hash] or []
+            if not search_filter or search_filter.matches(p)
+        ]
+
+    # pages are read past the cache, resumed searches need the exact keys
+    def query_page(
+        self,
+        h3hash: str,
+        limit: int,
+        search_filter: Optional[SearchFilter] = None,
+        start_key: Optional[Dict[str, Any]] = None,
+    ) -> ParkinglotPage:
+        return self._repo.query_page(h3hash, limit, search_filter, start_key)
+
+    def invalidate(self, h3cell: str) -> None:
+        self._cache.invalidate(h3cell)
+        for resolution in H3_PARENT_RESOLUTIONS:
+            self._cache.invalidate(h3.cell_to_parent(h3cell, resolution))
+
+    def _query_misses(self, h3hashes: List[str]) -> Dict[str, List[Parkinglot]]:
+        cells: Dict[str, List[Parkinglot]] = {h3hash: [] for h3hash in h3hashes}
+        resolutions = {h3.get_resolution(h3hash) for h3hash in h3hashes}
+        # overlapping cells return the same lot more than once
+        parkinglots = {p.parkinglot_id: p for p in self._repo.query(h3hashes)}
+        for parkinglot in parkinglots.values():
+            for resolution in resolutions:
+                parent = h3.cell_to_parent(parkinglot.h3cell, resolution)
+                if parent in cells:
+                    cells[parent].append(parkinglot)
+        for h3hash, parkinglots in cells.items():
+            self._cache.set(h3hash, parkinglots)
+        return cells
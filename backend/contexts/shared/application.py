@@ -0,0 +1,73 @@
+import functools
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, TypeVar
+
+from pydantic import BaseModel
+
+from backend.contexts.shared.domain import ConcurrencyConflict
+
+Result = TypeVar("Result")
+
+
+class CommandStats(BaseModel):
+    calls: int = 0
+    conflicts: int = 0
+    retries: int = 0
+    exhausted: int = 0
+
+
+_stats: Dict[str, CommandStats] = defaultdict(CommandStats)
+_stats_lock = threading.Lock()
+
+
+def command_stats() -> Dict[str, CommandStats]:
+    with _stats_lock:
+        return {name: stats.copy() for name, stats in _stats.items()}
+
+
+def reset_command_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+def _count(command: str, **counters: int) -> None:
+    with _stats_lock:
+        stats = _stats[command]
+        for counter, value in counters.items():
+            setattr(stats, counter, getattr(stats, counter) + value)
+
+
+# commands load the aggregate themselves, so running them again after a
+# conflict re-applies the change on top of the latest version
+def retry_on_conflict(
+    attempts: int = 4,
+    base_delay: float = 0.02,
+    max_delay: float = 0.5,
+) -> Callable[[Callable[..., Result]], Callable[..., Result]]:
+    def decorator(command: Callable[..., Result]) -> Callable[..., Result]:
+        name = command.__name__
+
+        @functools.wraps(command)
+        def wrapper(*args, **kwargs) -> Result:
+            _count(name, calls=1)
+            attempt = 0
+            while True:
+                try:
+                    return command(*args, **kwargs)
+                except ConcurrencyConflict:
+                    _count(name, conflicts=1)
+                    attempt += 1
+                    if attempt >= attempts:
+                        _count(name, exhausted=1)
+                        raise
+                # full jitter keeps workers retrying the same aggregate apart
+                delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+                time.sleep(random.uniform(0, delay))
+                _count(name, retries=1)
+
+        return wrapper
+
+    return decorator
@@ -1,6 +1,7 @@
+import base64
 import uuid
 from datetime import datetime
-from typing import List, Protocol, TypeVar
+from typing import List, Protocol, Type, TypeVar
 
 import ulid
 from pydantic import BaseModel, Field, PrivateAttr
@@ -8,6 +9,7 @@ from pydantic.json import ENCODERS_BY_TYPE
 
 EventData = TypeVar("EventData")
 AggregateId = TypeVar("AggregateId")
+Cursor = TypeVar("Cursor", bound=BaseModel)
 
 
 class ULID(ulid.ULID):
@@ -27,6 +29,10 @@ class ULID(ulid.ULID):
             examples=[str(ULID()), str(ULID())],
         )
 
+    # ulid defines equality without a hash, ids are used as cache and dict keys
+    def __hash__(self) -> int:
+        return hash(self.bytes)
+
 
 ENCODERS_BY_TYPE[ULID] = str
 
@@ -92,3 +98,28 @@ class AggregateRoot(BaseModel):
             ULID: lambda v: str(v),
             datetime: lambda v: v.timestamp(),
         }
+
+
+class InvalidCursor(Exception):
+    def __str__(self) -> str:
+        return "Invalid cursor"
+
+
+def encode_cursor(cursor: BaseModel) -> str:
+    return base64.urlsafe_b64encode(cursor.json().encode()).decode()
+
+
+def decode_cursor(cursor: str, model: Type[Cursor]) -> Cursor:
+    try:
+        return model.parse_raw(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError as e:
+        raise InvalidCursor from e
+
+
+class ConcurrencyConflict(Exception):
+    def __init__(self, aggregate_id: str) -> None:
+        super().__init__(aggregate_id)
+        self.aggregate_id = aggregate_id
+
+    def __str__(self) -> str:
+        return f"Aggregate {self.aggregate_id} was changed concurrently"
@@ -1,8 +1,76 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
 import boto3
+from pydantic import BaseModel
+
 from backend.contexts.shared.domain import DomainEvent, EventBus
 
+Key = TypeVar("Key", bound=Hashable)
+Value = TypeVar("Value")
+
+
+class CacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    size: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class TTLCache(Generic[Key, Value]):
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries: "OrderedDict[Key, Tuple[float, Value]]" = OrderedDict()
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
 
-from typing import List
+    def get(self, key: Key) -> Optional[Value]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return entry[1]
+
+    def set(self, key: Key, value: Value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def invalidate(self, key: Key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return self._stats.copy(update={"size": len(self._entries)})
 
 
 class RamEventBus(EventBus):
@@ -13,31 +81,141 @@ class RamEventBus(EventBus):
         self.events.extend(events)
 
 
+# limits of a single sns publish_batch request
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+
+
+class PublishStats(BaseModel):
+    requests: int = 0
+    entries: int = 0
+    failed: int = 0
+    total_latency_ms: float = 0.0
+    max_latency_ms: float = 0.0
+
+    @property
+    def mean_latency_ms(self) -> float:
+        return self.total_latency_ms / self.requests if self.requests else 0.0
+
+
+class EventsNotPublished(Exception):
+    def __init__(self, event_ids: List[str]) -> None:
+        super().__init__(event_ids)
+        self.event_ids = event_ids
+
+    def __str__(self) -> str:
+        return f"Events {', '.join(self.event_ids)} could not be published"
+
+
 class SnsEventBus(EventBus):
-    def __init__(self, topic_arn: str) -> None:
+    def __init__(
+        self,
+        topic_arn: str,
+        max_workers: int = 4,
+        attempts: int = 3,
+        base_delay: float = 0.05,
+    ) -> None:
         self._topic_arn = topic_arn
         self._client = boto3.client("sns")
+        self._max_workers = max_workers
+        self._attempts = attempts
+        self._base_delay = base_delay
+        self._stats = PublishStats()
+        self._stats_lock = threading.Lock()
 
     def publish(self, events: List[DomainEvent]) -> None:
-        if not events:
+        batches = list(self._batches([self._entry(e) for e in events]))
+        if len(batches) <= 1:
+            for batch in batches:
+                self._publish_batch(batch)
             return
-        self._client.publish_batch(
-            TopicArn=self._topic_arn,
-            PublishBatchRequestEntries=[
-                {
-                    "Id": str(e.id),
-                    "Message": e.json(),
-                    "MessageAttributes": {
-                        "name": {
-                            "DataType": "String",
-                            "StringValue": e.event_name,
-                        },
-                        "aggregate_id": {
-                            "DataType": "String",
-                            "StringValue": str(e.aggregate_id),
-                        },
-                    },
-                }
-                for e in events
-            ],
+        workers = min(self._max_workers, len(batches))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            failed = [
+                event_id
+                for event_ids in executor.map(self._try_publish_batch, batches)
+                for event_id in event_ids
+            ]
+        if failed:
+            raise EventsNotPublished(failed)
+
+    def _try_publish_batch(self, entries: List[Dict[str, Any]]) -> List[str]:
+        try:
+            self._publish_batch(entries)
+        except EventsNotPublished as e:
+            return e.event_ids
+        return []
+
+    # only the failed entries are sent again, sender faults never succeed
+    def _publish_batch(self, entries: List[Dict[str, Any]]) -> None:
+        for attempt in range(self._attempts):
+            started = time.perf_counter()
+            response = self._client.publish_batch(
+                TopicArn=self._topic_arn,
+                PublishBatchRequestEntries=entries,
+            )
+            failed = {f["Id"]: f["SenderFault"] for f in response.get("Failed", [])}
+            self._record(len(entries), len(failed), time.perf_counter() - started)
+            if not failed:
+                return
+            if any(failed.values()) or attempt == self._attempts - 1:
+                raise EventsNotPublished(list(failed))
+            entries = [e for e in entries if e["Id"] in failed]
+            time.sleep(random.uniform(0, self._base_delay * 2**attempt))
+
+    def stats(self) -> PublishStats:
+        with self._stats_lock:
+            return self._stats.copy()
+
+    # every publish_batch request, retries included
+    def _record(self, entries: int, failed: int, seconds: float) -> None:
+        latency_ms = seconds * 1000
+        with self._stats_lock:
+            self._stats.requests += 1
+            self._stats.entries += entries
+            self._stats.failed += failed
+            self._stats.total_latency_ms += latency_ms
+            self._stats.max_latency_ms = max(self._stats.max_latency_ms, latency_ms)
+
+    def _batches(
+        self,
+        entries: List[Dict[str, Any]],
+    ) -> Iterator[List[Dict[str, Any]]]:
+        batch: List[Dict[str, Any]] = []
+        size = 0
+        for entry in entries:
+            entry_size = self._entry_size(entry)
+            if batch and (
+                len(batch) == MAX_BATCH_ENTRIES or size + entry_size > MAX_BATCH_BYTES
+            ):
+                yield batch
+                batch, size = [], 0
+            batch.append(entry)
+            size += entry_size
+        if batch:
+            yield batch
+
+    def _entry(self, event: DomainEvent) -> Dict[str, Any]:
+        return {
+            "Id": str(event.id),
+            "Message": event.json(),
+            "MessageAttributes": {
+                "name": {
+                    "DataType": "String",
+                    "StringValue": event.event_name,
+                },
+                "aggregate_id": {
+                    "DataType": "String",
+                    "StringValue": str(event.aggregate_id),
+                },
+            },
+        }
+
+    # sns counts the message and every attribute name, type and value
+    def _entry_size(self, entry: Dict[str, Any]) -> int:
+        return len(entry["Message"].encode()) + sum(
+            len(name.encode())
+            + len(value["DataType"].encode())
+            + len(value["StringValue"].encode())
+            for name, value in entry["MessageAttributes"].items()
         )
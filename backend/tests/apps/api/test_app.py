@@ -1,9 +1,78 @@
+import uuid
+from decimal import Decimal
+
+from dependency_injector import providers
 from fastapi.testclient import TestClient
+from moto import mock_aws
 
 from backend.apps.api.main import app
+from backend.benchmarks.dynamodb import (
+    INVERTED_INDEX,
+    TABLE_NAME,
+    create_table,
+    setup_aws_env,
+)
+from backend.contexts.parkinglot.infrastructure import DynamodbParkinglotRepository
+from backend.contexts.parkinglot.domain import Coordinates, ParkinglotAggregate
+from backend.contexts.shared.domain import OwnerId, ParkinglotId, ParkingSpaceId
 
 client = TestClient(app)
 
 
 def test_read_root():
     assert True
+
+
+def test_bookings_reject_an_inverted_creation_range():
+    response = client.get(
+        "/bookings",
+        params={
+            "created_from": "2024-01-02T00:00:00",
+            "created_until": "2024-01-01T00:00:00",
+        },
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"] == "created_from must not be after created_until"
+
+
+def test_public_parkinglot_answers_not_modified():
+    setup_aws_env()
+    with mock_aws():
+        create_table()
+        repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX)
+        parkinglot = ParkinglotAggregate.create(
+            parkinglot_id=ParkinglotId(str(uuid.uuid4())),
+            owner_id=OwnerId(str(uuid.uuid4())),
+            name="parkinglot",
+            street="street",
+            coordinates=Coordinates(lat=Decimal("-34.6037"), lng=Decimal("-58.3816")),
+            price=Decimal(100),
+        )
+        parkinglot.register_spaces(
+            [ParkingSpaceId(str(uuid.uuid4())) for _ in range(2)]
+        )
+        repo.save(parkinglot)
+        url = f"/public/parkinglots/{parkinglot.id}"
+        with app.container.parkinglot_repository.override(  # type: ignore
+            providers.Object(repo)
+        ):
+            response = client.get(url)
+            assert response.status_code == 200
+            assert response.headers["ETag"] == '"1"'
+            assert response.json()["version"] == 1
+
+            response = client.get(url, headers={"If-None-Match": '"1"'})
+            assert response.status_code == 304
+
+            loaded = repo.get(parkinglot.id)
+            loaded.change_price(Decimal(300))
+            repo.save(loaded)
+            assert client.get(url).json()["price"] == 100
+
+            response = client.get(url, headers={"If-None-Match": '"2"'})
+            assert response.status_code == 304
+            assert client.get(url).json()["price"] == 300
+
+            response = client.get(f"{url}/spaces")
+            assert response.headers["ETag"] == '"2"'
+            assert len(response.json()["spaces"]) == 2
@@ -0,0 +1,126 @@
+import json
+import uuid
+from decimal import Decimal
+from typing import Any, Dict, List
+
+import pytest
+from dependency_injector import providers
+
+from backend.apps.events import booking as booking_events
+from backend.apps.events import main
+from backend.apps.events import parkinglot as parkinglot_events
+from backend.contexts.booking.domain import BookingAggregate, BookingCreated
+from backend.contexts.booking.infrastructure import RamBookingRepository
+from backend.contexts.parkinglot.domain import (
+    BookingRefused,
+    Coordinates,
+    DriverLeft,
+    ParkinglotAggregate,
+)
+from backend.contexts.parkinglot.infrastructure import RamParkinglotRepository
+from backend.contexts.shared.domain import (
+    BookingId,
+    DomainEvent,
+    DriverId,
+    OwnerId,
+    ParkinglotId,
+    ParkingSpaceId,
+)
+
+
+class CountingEventBus:
+    def __init__(self) -> None:
+        self.batches: List[List[DomainEvent]] = []
+
+    def publish(self, events: List[DomainEvent]) -> None:
+        self.batches.append(events)
+
+
+def sqs_record(event: DomainEvent) -> Dict[str, Any]:
+    message_id = str(uuid.uuid4())
+    return {
+        "messageId": message_id,
+        "body": json.dumps(
+            {
+                "MessageId": message_id,
+                "Message": event.json(),
+                "MessageAttributes": {
+                    "name": {"Type": "String", "Value": event.event_name}
+                },
+            }
+        ),
+    }
+
+
+def test_batch_is_handled_per_aggregate_with_fallback(
+    caplog: pytest.LogCaptureFixture,
+):
+    parkinglots = RamParkinglotRepository()
+    bookings = RamBookingRepository()
+    bus = CountingEventBus()
+    parkinglot = ParkinglotAggregate.create(
+        parkinglot_id=ParkinglotId(str(uuid.uuid4())),
+        owner_id=OwnerId(str(uuid.uuid4())),
+        name="parkinglot",
+        street="street",
+        coordinates=Coordinates(lat=Decimal("-34.6037"), lng=Decimal("-58.3816")),
+        price=Decimal(100),
+    )
+    parkinglot.register_spaces([ParkingSpaceId(str(uuid.uuid4())) for _ in range(3)])
+    parkinglots.save(parkinglot)
+    created = [
+        BookingCreated(
+            aggregate_id=str(BookingId()),
+            parkinglot_id=parkinglot.id,
+            driver_id=DriverId(str(uuid.uuid4())),
+            duration=None,
+        )
+        for _ in range(3)
+    ]
+    started = BookingAggregate.create(
+        id=BookingId(),
+        driver_id=DriverId(str(uuid.uuid4())),
+        parkinglot_id=parkinglot.id,
+        duration=None,
+        description="started",
+    )
+    started.accomodate(Decimal(100), parkinglot.spaces[0].id)
+    started.start()
+    bookings.save(started)
+    refused = sqs_record(
+        BookingRefused(aggregate_id=str(parkinglot.id), booking_id=started.id)
+    )
+    left = sqs_record(
+        DriverLeft(
+            aggregate_id=str(parkinglot.id),
+            space_id=parkinglot.spaces[0].id,
+            driver_id=started.driver_id,
+            booking_id=started.id,
+        )
+    )
+
+    main.container.wire(modules=[main, booking_events, parkinglot_events])
+    with main.container.parkinglot_repository.override(
+        providers.Object(parkinglots)
+    ), main.container.booking_repository.override(
+        providers.Object(bookings)
+    ), main.container.eventbus.override(
+        providers.Object(bus)
+    ):
+        response = main.handler(
+            {"Records": [*(sqs_record(e) for e in created), left, refused]},
+            None,  # type: ignore
+        )
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": refused["messageId"]}]}
+    assert parkinglots.get(parkinglot.id).free_spaces == 0
+    assert [e.event_name for e in bus.batches[-1]] == [
+        "BookingAccommodated",
+        "FreeSpacesChanged",
+    ] * 3
+    assert bookings.get(started.id).end_time is not None
+    assert [r.getMessage().split(":")[0] for r in caplog.records] == [
+        "group failed",
+        "event failed",
+    ]
+    assert all(r.exc_info for r in caplog.records)
@@ -0,0 +1,188 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List
+
+import pytest
+
+from backend.benchmarks.dynamodb import (
+    INVERTED_INDEX,
+    PARKINGLOT_BOOKINGS_INDEX,
+    TABLE_NAME,
+)
+from backend.contexts.booking.application import (
+    list_bookings,
+    list_parkinglot_bookings,
+)
+from backend.contexts.booking.domain import (
+    BookingAggregate,
+    BookingFilter,
+    BookingState,
+)
+from backend.contexts.booking.infrastructure import (
+    DynamodbBookingRepository,
+    RamBookingRepository,
+)
+from backend.contexts.shared.domain import (
+    BookingId,
+    ConcurrencyConflict,
+    DriverId,
+    ParkinglotId,
+    ParkingSpaceId,
+)
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def test_bookings_are_listed_by_pages_of_summaries(dynamodb_table: Any):
+    repo = DynamodbBookingRepository(TABLE_NAME, INVERTED_INDEX)
+    driver_id = DriverId(str(uuid.uuid4()))
+    for day in range(6):
+        booking = BookingAggregate.create(
+            id=BookingId.from_timestamp((START + timedelta(days=day)).timestamp()),
+            driver_id=driver_id,
+            parkinglot_id=ParkinglotId(str(uuid.uuid4())),
+            duration=timedelta(hours=1),
+            description=f"day {day}",
+        )
+        if day % 2:
+            booking.accomodate(Decimal(10), ParkingSpaceId(str(uuid.uuid4())))
+        repo.save(booking)
+    queries: List[Dict[str, Any]] = []
+
+    def record(params: Any, model: Any, **kwargs: Any) -> None:
+        if model.name == "Query":
+            queries.append(params)
+
+    repo._table.meta.client.meta.events.register(
+        "provide-client-params.dynamodb", record
+    )
+
+    descriptions: List[str] = []
+    cursor = None
+    while True:
+        page = list_bookings(driver_id, repo, limit=2, cursor=cursor)
+        descriptions.extend(b.description for b in page.bookings)
+        if not (cursor := page.cursor):
+            break
+    assert descriptions == [f"day {day}" for day in reversed(range(6))]
+    assert "ProjectionExpression" in queries[0]
+    assert "driver_id" not in queries[0]["ExpressionAttributeNames"].values()
+
+    page = list_bookings(
+        driver_id,
+        repo,
+        limit=10,
+        booking_filter=BookingFilter(
+            state=BookingState.ACCOMMODATED,
+            created_from=START + timedelta(days=2),
+            created_until=START + timedelta(days=4),
+        ),
+    )
+    assert [b.description for b in page.bookings] == ["day 3"]
+    assert page.bookings[0].duration == timedelta(hours=1)
+    assert page.cursor is None
+
+
+def test_filtered_pages_read_a_fixed_number_of_items(dynamodb_table: Any):
+    repo = DynamodbBookingRepository(TABLE_NAME, INVERTED_INDEX)
+    driver_id = DriverId(str(uuid.uuid4()))
+    for day in range(9):
+        booking = BookingAggregate.create(
+            id=BookingId.from_timestamp((START + timedelta(days=day)).timestamp()),
+            driver_id=driver_id,
+            parkinglot_id=ParkinglotId(str(uuid.uuid4())),
+            duration=None,
+            description=f"day {day}",
+        )
+        if day % 3 == 0:
+            booking.accomodate(Decimal(10), ParkingSpaceId(str(uuid.uuid4())))
+        repo.save(booking)
+    limits: List[int] = []
+
+    def record(params: Any, model: Any, **kwargs: Any) -> None:
+        if model.name == "Query":
+            limits.append(params["Limit"])
+
+    repo._table.meta.client.meta.events.register(
+        "provide-client-params.dynamodb", record
+    )
+
+    descriptions: List[str] = []
+    cursor = None
+    while True:
+        page = list_bookings(
+            driver_id,
+            repo,
+            limit=2,
+            booking_filter=BookingFilter(state=BookingState.CREATED),
+            cursor=cursor,
+        )
+        assert len(page.bookings) <= 2
+        descriptions.extend(b.description for b in page.bookings)
+        if not (cursor := page.cursor):
+            break
+    assert descriptions == [f"day {day}" for day in reversed(range(9)) if day % 3 != 0]
+    assert set(limits) == {2}
+
+
+def test_ram_repository_indexes_bookings_by_driver():
+    repo = RamBookingRepository()
+    driver_id = DriverId(str(uuid.uuid4()))
+    bookings = [
+        BookingAggregate.create(
+            id=BookingId.from_timestamp((START + timedelta(days=day)).timestamp()),
+            driver_id=DriverId(str(uuid.uuid4())) if day == 1 else driver_id,
+            parkinglot_id=ParkinglotId(str(uuid.uuid4())),
+            duration=None,
+            description=f"day {day}",
+        )
+        for day in range(3)
+    ]
+    for booking in bookings:
+        repo.save(booking)
+
+    assert [b.description for b in repo.list(driver_id)] == ["day 2", "day 0"]
+    assert repo.get(bookings[0].id, bookings[1].driver_id) is None
+    loaded = repo.get(bookings[0].id, driver_id)
+    loaded.accomodate(Decimal(10), ParkingSpaceId(str(uuid.uuid4())))
+    repo.save(loaded)
+    assert repo.get(bookings[0].id).state == BookingState.ACCOMMODATED
+    with pytest.raises(ConcurrencyConflict):
+        repo.save(bookings[0])
+
+
+def test_active_bookings_are_listed_by_parkinglot(dynamodb_table: Any):
+    repo = DynamodbBookingRepository(
+        TABLE_NAME, INVERTED_INDEX, PARKINGLOT_BOOKINGS_INDEX
+    )
+    parkinglot_id = ParkinglotId(str(uuid.uuid4()))
+    bookings = []
+    for day in range(5):
+        booking = BookingAggregate.create(
+            id=BookingId.from_timestamp((START + timedelta(days=day)).timestamp()),
+            driver_id=DriverId(str(uuid.uuid4())),
+            parkinglot_id=parkinglot_id,
+            duration=None,
+            description=f"day {day}",
+        )
+        booking.accomodate(Decimal(10), ParkingSpaceId(str(uuid.uuid4())))
+        repo.save(booking)
+        bookings.append(booking)
+    ended = repo.get(bookings[1].id)
+    ended.expire()
+    repo.save(ended)
+
+    descriptions: List[str] = []
+    cursor = None
+    while True:
+        page = list_parkinglot_bookings(
+            parkinglot_id, BookingState.ACCOMMODATED, repo, limit=2, cursor=cursor
+        )
+        descriptions.extend(b.description for b in page.bookings)
+        if not (cursor := page.cursor):
+            break
+    assert descriptions == ["day 4", "day 3", "day 2", "day 0"]
+    assert (
+        repo.list_active_by_parkinglot(parkinglot_id, BookingState.CREATED, 10)
+    ).bookings == []
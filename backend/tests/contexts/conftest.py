@@ -0,0 +1,56 @@
+import uuid
+from decimal import Decimal
+from typing import Any, Callable, Iterator
+
+import h3
+import pytest
+from moto import mock_aws
+
+from backend.benchmarks.dynamodb import create_table, setup_aws_env
+from backend.contexts.parkinglot.domain import Coordinates, ParkinglotAggregate
+from backend.contexts.searcher.domain import Parkinglot
+from backend.contexts.shared.domain import OwnerId, ParkinglotId, ParkingSpaceId
+
+
+@pytest.fixture
+def dynamodb_table() -> Iterator[Any]:
+    setup_aws_env()
+    with mock_aws():
+        yield create_table()
+
+
+@pytest.fixture
+def make_parkinglot() -> Callable[[int], ParkinglotAggregate]:
+    def make(spaces: int) -> ParkinglotAggregate:
+        parkinglot = ParkinglotAggregate.create(
+            parkinglot_id=ParkinglotId(str(uuid.uuid4())),
+            owner_id=OwnerId(str(uuid.uuid4())),
+            name="parkinglot",
+            street="street",
+            coordinates=Coordinates(lat=Decimal("-34.6037"), lng=Decimal("-58.3816")),
+            price=Decimal(100),
+        )
+        parkinglot.register_spaces(
+            [ParkingSpaceId(str(uuid.uuid4())) for _ in range(spaces)]
+        )
+        return parkinglot
+
+    return make
+
+
+# the slim lot the searcher indexes, placed at the center of its cell
+@pytest.fixture
+def make_search_parkinglot() -> Callable[..., Parkinglot]:
+    def make(h3cell: str, price: int = 100, free_spaces: int = 10) -> Parkinglot:
+        lat, lng = h3.cell_to_latlng(h3cell)
+        return Parkinglot(
+            h3cell=h3cell,
+            parkinglot_id=ParkinglotId(str(uuid.uuid4())),
+            name="parkinglot",
+            street="street",
+            coordinates=Coordinates(lat=lat, lng=lng),
+            price=Decimal(price),
+            free_spaces=free_spaces,
+        )
+
+    return make
@@ -0,0 +1,116 @@
+import uuid
+from typing import Callable
+
+import pytest
+
+from backend.contexts.parkinglot.domain import (
+    BookingRefused,
+    ParkingSpace,
+    ParkinglotAggregate,
+)
+from backend.contexts.shared.domain import BookingId, DriverId, ParkingSpaceId
+
+
+def book(parkinglot: ParkinglotAggregate) -> BookingId:
+    booking_id = BookingId()
+    parkinglot.accommodate_booking(DriverId(str(uuid.uuid4())), booking_id)
+    return booking_id
+
+
+def booked_space(parkinglot: ParkinglotAggregate, booking_id: BookingId):
+    return next(s for s in parkinglot.spaces if s.booking_id == booking_id)
+
+
+def test_accommodate_booking_takes_the_lowest_free_internal_id(
+    make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    parkinglot = make_parkinglot(3)
+
+    first, second = book(parkinglot), book(parkinglot)
+    parkinglot.release_space(booked_space(parkinglot, first).id)
+    third = book(parkinglot)
+
+    assert booked_space(parkinglot, second).internal_id == 1
+    assert booked_space(parkinglot, third).internal_id == 0
+    assert parkinglot.free_spaces == 1
+
+
+def test_accommodate_booking_refuses_when_every_space_is_booked(
+    make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    parkinglot = make_parkinglot(2)
+    book(parkinglot), book(parkinglot)
+    parkinglot.pull_events()
+
+    # inconsistent counter, the spaces are still the source of truth
+    parkinglot.free_spaces = 1
+    book(parkinglot)
+
+    assert [type(e) for e in parkinglot.pull_events()] == [BookingRefused]
+
+
+def test_space_indexes_are_rebuilt_after_loading(
+    make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    parkinglot = make_parkinglot(3)
+    booking_id = book(parkinglot)
+    space = booked_space(parkinglot, booking_id)
+
+    loaded = ParkinglotAggregate.parse_raw(parkinglot.json())
+
+    assert loaded.find_space(space.id).booking_id == booking_id
+    assert loaded.find_free_space().internal_id == 1
+    loaded.release_space(space.id)
+    assert loaded.find_free_space().internal_id == 0
+
+
+def test_register_spaces_extends_the_indexes(
+    make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    parkinglot = make_parkinglot(1)
+    book(parkinglot)
+    space_id = ParkingSpaceId(str(uuid.uuid4()))
+
+    parkinglot.register_spaces([space_id])
+
+    assert parkinglot.find_space(space_id).internal_id == 1
+    assert parkinglot.find_free_space().id == space_id
+
+
+def test_spaces_keep_every_field_in_columns(
+    make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    parkinglot = make_parkinglot(10)
+    booking_ids = [book(parkinglot) for _ in range(9)]
+    parkinglot.release_space(booked_space(parkinglot, booking_ids[3]).id)
+    parkinglot.take_space(booked_space(parkinglot, booking_ids[8]).id)
+    spaces = [ParkingSpace.parse_raw(s.json()) for s in parkinglot.spaces]
+
+    loaded = ParkinglotAggregate.parse_obj(
+        {**parkinglot.dict(), "spaces": [s.dict() for s in spaces]}
+    )
+
+    assert list(loaded.spaces) == spaces
+    assert [s.internal_id for s in loaded.spaces if not s.booking_id] == [3, 9]
+    assert loaded.spaces[8].driver_arrival_time is not None
+    assert loaded.find_free_space().internal_id == 3
+    encoded = loaded.spaces.json_list()
+    assert encoded[8]["driver_arrival_time"] == (
+        loaded.spaces[8].driver_arrival_time.isoformat()
+    )
+    assert encoded[8]["booked_from"] == loaded.spaces[8].booked_from.isoformat()
+    assert encoded[3]["booked_from"] is None
+
+
+def test_indexed_spaces_cannot_be_changed_behind_the_aggregate(
+    make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    parkinglot = make_parkinglot(2)
+    booking_id = BookingId()
+    space = parkinglot.spaces[0]
+
+    with pytest.raises(TypeError):
+        space.booking_id = booking_id
+    assert not hasattr(space, "book")
+    assert parkinglot.spaces[0].booking_id is None
+    assert parkinglot.free_spaces == 2
@@ -0,0 +1,420 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, List
+
+import boto3
+import pytest
+
+from backend.benchmarks.dynamodb import EXPIRY_INDEX, INVERTED_INDEX, TABLE_NAME
+from backend.contexts.parkinglot.application import (
+    accomodate_booking,
+    OccupancyChange,
+    change_parkinglot_price,
+    concentrator_apply_occupancy,
+    release_expired_bookings,
+)
+from backend.contexts.parkinglot.domain import ParkinglotAggregate
+from backend.contexts.parkinglot.infrastructure import (
+    DynamodbParkinglotRepository,
+    RamParkinglotRepository,
+)
+from backend.contexts.shared.application import command_stats, reset_command_stats
+from backend.contexts.shared.domain import (
+    BookingId,
+    ConcurrencyConflict,
+    DriverId,
+    OwnerId,
+    ParkingSpaceId,
+)
+from backend.contexts.shared.infrastructure import RamEventBus
+
+
+def record_writes(table: Any) -> List[str]:
+    writes: List[str] = []
+
+    def record(params: Any, **kwargs: Any) -> None:
+        if "TransactItems" in params:
+            writes.extend(i["Put"]["Item"]["sk"] for i in params["TransactItems"])
+        elif "Item" in params:
+            writes.append(params["Item"]["sk"])
+
+    table.meta.client.meta.events.register("provide-client-params.dynamodb", record)
+    return writes
+
+
+def test_save_writes_only_the_changed_spaces(
+    dynamodb_table: Any, make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX)
+    parkinglot = make_parkinglot(150)
+    repo.save(parkinglot)
+    writes = record_writes(repo._table)
+
+    loaded = repo.get(parkinglot.id, with_spaces=True)
+    loaded.accommodate_booking(DriverId(str(uuid.uuid4())), BookingId())
+    repo.save(loaded)
+
+    assert writes == [
+        f"PARKINGLOT::{parkinglot.id}",
+        f"SPACE::{parkinglot.id}::000000",
+    ]
+    reloaded = repo.get(parkinglot.id, parkinglot.owner_id, with_spaces=True)
+    assert reloaded.version == 2
+    assert reloaded.free_spaces == 149
+    assert len(reloaded.spaces) == 150
+    assert reloaded.spaces[0].booking_id is not None
+    assert repo.get(parkinglot.id, parkinglot.owner_id).spaces == []
+
+
+def test_conflicting_save_leaves_no_spaces_behind(
+    dynamodb_table: Any, make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX)
+    parkinglot = make_parkinglot(0)
+    repo.save(parkinglot)
+    first = repo.get(parkinglot.id, with_spaces=True)
+    second = repo.get(parkinglot.id, with_spaces=True)
+    first.register_spaces([ParkingSpaceId(str(uuid.uuid4())) for _ in range(150)])
+    repo.save(first)
+    second.register_spaces([ParkingSpaceId(str(uuid.uuid4())) for _ in range(150)])
+
+    with pytest.raises(ConcurrencyConflict):
+        repo.save(second)
+    reloaded = repo.get(parkinglot.id, with_spaces=True)
+    assert [s.id for s in reloaded.spaces] == [s.id for s in first.spaces]
+
+
+def test_get_migrates_embedded_spaces(
+    dynamodb_table: Any, make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX)
+    parkinglot = make_parkinglot(3)
+    item = json.loads(
+        parkinglot.json(exclude={"id", "owner_id", "version"}),
+        parse_float=Decimal,
+    )
+    boto3.resource("dynamodb").Table(TABLE_NAME).put_item(
+        Item={
+            "pk": str(parkinglot.owner_id),
+            "sk": f"PARKINGLOT::{parkinglot.id}",
+            "version": 1,
+            **item,
+        }
+    )
+
+    repo.save(repo.get(parkinglot.id, with_spaces=True))
+
+    migrated = repo.get(parkinglot.id, with_spaces=True)
+    assert [s.id for s in migrated.spaces] == [s.id for s in parkinglot.spaces]
+    assert migrated.pull_changed_spaces() == []
+
+
+def test_partial_save_updates_only_the_changed_attributes(
+    dynamodb_table: Any, make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX)
+    parkinglot = make_parkinglot(50)
+    repo.save(parkinglot)
+    calls: List[Any] = []
+    repo._table.meta.client.meta.events.register(
+        "provide-client-params.dynamodb",
+        lambda params, model, **kwargs: calls.append((model.name, params)),
+    )
+
+    loaded = repo.get(parkinglot.id)
+    loaded.change_price(Decimal(250))
+    repo.save(loaded)
+
+    assert [name for name, _ in calls] == ["GetItem", "UpdateItem"]
+    update = calls[1][1]
+    assert sorted(update["ExpressionAttributeNames"].values()) == [
+        "price",
+        "updated_on",
+    ]
+    reloaded = repo.get(parkinglot.id, with_spaces=True)
+    assert (reloaded.price, reloaded.version) == (Decimal(250), 2)
+    assert len(reloaded.spaces) == 50
+    with pytest.raises(ConcurrencyConflict):
+        repo.save(loaded)
+
+
+def test_get_resolves_the_owner_once(
+    dynamodb_table: Any, make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    parkinglot = make_parkinglot(1)
+    DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX).save(parkinglot)
+    repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX)
+
+    assert repo.get(parkinglot.id).owner_id == parkinglot.owner_id
+    assert repo.get(parkinglot.id).owner_id == parkinglot.owner_id
+    repo.save(make_parkinglot(0))
+
+    stats = repo.owner_cache_stats()
+    assert (stats.hits, stats.misses, stats.size) == (1, 1, 2)
+
+
+def test_reserve_space_books_each_space_once(
+    dynamodb_table: Any, make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX)
+    parkinglot = make_parkinglot(2)
+    repo.save(parkinglot)
+    driver_id = DriverId(str(uuid.uuid4()))
+    first, second, third = BookingId(), BookingId(), BookingId()
+
+    reservations = [
+        repo.reserve_space(parkinglot.id, driver_id, booking_id)
+        for booking_id in (first, second, third, first)
+    ]
+
+    assert [r.booking_id for r in reservations] == [first, second, third, first]
+    assert reservations[0].space_id != reservations[1].space_id
+    assert reservations[2].space_id is None
+    assert reservations[3].space_id == reservations[0].space_id
+    assert reservations[1].free_spaces == 0
+    loaded = repo.get(parkinglot.id, with_spaces=True)
+    assert loaded.version == 3
+    assert sorted(str(s.booking_id) for s in loaded.spaces) == sorted(
+        [str(first), str(second)]
+    )
+    marker = repo._table.get_item(
+        Key={
+            "pk": str(parkinglot.owner_id),
+            "sk": f"RESERVATION::{parkinglot.id}::{first}",
+        }
+    )["Item"]
+    assert marker["ttl"] > datetime.now().timestamp() + 86400
+
+
+def test_reserve_space_migrates_embedded_spaces(
+    dynamodb_table: Any, make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX)
+    parkinglot = make_parkinglot(1)
+    item = json.loads(
+        parkinglot.json(exclude={"id", "owner_id", "version"}),
+        parse_float=Decimal,
+    )
+    boto3.resource("dynamodb").Table(TABLE_NAME).put_item(
+        Item={
+            "pk": str(parkinglot.owner_id),
+            "sk": f"PARKINGLOT::{parkinglot.id}",
+            "version": 1,
+            **item,
+        }
+    )
+
+    reservation = repo.reserve_space(
+        parkinglot.id, DriverId(str(uuid.uuid4())), BookingId()
+    )
+
+    assert reservation.space_id == parkinglot.spaces[0].id
+
+
+def test_reserve_space_retries_a_conflict_on_the_lot(
+    dynamodb_table: Any, make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX)
+    parkinglot = make_parkinglot(1)
+    repo.save(parkinglot)
+    client = repo._table.meta.client
+    transact_write_items = client.transact_write_items
+    conflicts = [1]
+
+    # another booking updating free_spaces at the same time
+    def conflicting(**kwargs: Any) -> Any:
+        if conflicts and conflicts.pop():
+            raise client.exceptions.TransactionCanceledException(
+                {
+                    "Error": {"Code": "TransactionCanceledException"},
+                    "CancellationReasons": [
+                        {"Code": "TransactionConflict"},
+                        {"Code": "None"},
+                        {"Code": "None"},
+                    ],
+                },
+                "TransactWriteItems",
+            )
+        return transact_write_items(**kwargs)
+
+    client.transact_write_items = conflicting
+    bus = RamEventBus()
+    booking_id = BookingId()
+
+    accomodate_booking(
+        booking_id, parkinglot.id, DriverId(str(uuid.uuid4())), None, repo, bus
+    )
+
+    loaded = repo.get(parkinglot.id, with_spaces=True)
+    assert loaded.spaces[0].booking_id == booking_id
+    assert loaded.free_spaces == 0
+
+
+def test_command_retries_a_concurrent_save(
+    dynamodb_table: Any, make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX)
+    parkinglot = make_parkinglot(2)
+    repo.save(parkinglot)
+    save = repo.save
+    races = [True]
+
+    def racing_save(saved: ParkinglotAggregate) -> None:
+        if races and races.pop():
+            concurrent = repo.get(parkinglot.id, with_spaces=True)
+            concurrent.release_space(parkinglot.spaces[0].id)
+            save(concurrent)
+        save(saved)
+
+    repo.save = racing_save  # type: ignore
+    reset_command_stats()
+    bus = RamEventBus()
+
+    change_parkinglot_price(parkinglot.id, Decimal(200), parkinglot.owner_id, repo, bus)
+
+    assert repo.get(parkinglot.id).price == Decimal(200)
+    assert repo.get(parkinglot.id).version == 3
+    assert len(bus.events) == 1
+    stats = command_stats()["change_parkinglot_price"]
+    assert (stats.calls, stats.conflicts, stats.retries) == (1, 1, 1)
+    with pytest.raises(ConcurrencyConflict):
+        repo.save(parkinglot)
+
+
+def test_sweeper_releases_expired_spaces(
+    dynamodb_table: Any, make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX, EXPIRY_INDEX)
+    parkinglot = make_parkinglot(3)
+    repo.save(parkinglot)
+    driver_id = DriverId(str(uuid.uuid4()))
+    for duration in (timedelta(hours=1), timedelta(hours=3), None):
+        repo.reserve_space(parkinglot.id, driver_id, BookingId(), duration)
+    later = datetime.now() + timedelta(hours=2)
+    bus = RamEventBus()
+
+    assert repo.expired_parkinglots(datetime.now(), 10) == []
+    assert release_expired_bookings(later, 10, repo, bus) == 1
+
+    reloaded = repo.get(parkinglot.id, with_spaces=True)
+    assert reloaded.free_spaces == 1
+    assert [e.event_name for e in bus.events] == [
+        "BookingExpired",
+        "FreeSpacesChanged",
+    ]
+    assert repo.expired_parkinglots(later, 10) == []
+    assert repo.expired_parkinglots(later + timedelta(hours=2), 10) == [
+        (parkinglot.id, parkinglot.owner_id)
+    ]
+
+
+def test_occupancy_changes_are_saved_once_in_order(
+    dynamodb_table: Any, make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    repo = DynamodbParkinglotRepository(TABLE_NAME, INVERTED_INDEX)
+    parkinglot = make_parkinglot(3)
+    parkinglot.register_concentrator("concentrator")
+    for _ in range(2):
+        parkinglot.accommodate_booking(DriverId(str(uuid.uuid4())), BookingId())
+    repo.save(parkinglot)
+    first, second, _ = parkinglot.spaces
+    now = datetime.now()
+    writes = record_writes(repo._table)
+    bus = RamEventBus()
+
+    concentrator_apply_occupancy(
+        parkinglot.id,
+        [
+            OccupancyChange(space_id=first.id, action="release", timestamp=now),
+            OccupancyChange(
+                space_id=second.id,
+                action="take",
+                timestamp=now - timedelta(minutes=2),
+            ),
+            OccupancyChange(
+                space_id=first.id,
+                action="take",
+                timestamp=now - timedelta(minutes=1),
+            ),
+        ],
+        "concentrator",
+        repo,
+        bus,
+    )
+
+    assert writes == [
+        f"PARKINGLOT::{parkinglot.id}",
+        f"SPACE::{parkinglot.id}::000000",
+        f"SPACE::{parkinglot.id}::000001",
+    ]
+    assert [e.event_name for e in bus.events] == [
+        "DriverArrived",
+        "DriverArrived",
+        "DriverLeft",
+        "FreeSpacesChanged",
+    ]
+    reloaded = repo.get(parkinglot.id, with_spaces=True)
+    assert reloaded.free_spaces == 2
+    assert reloaded.spaces[1].driver_arrival_time == now - timedelta(minutes=2)
+
+
+def test_ram_repository_keeps_the_table_semantics(
+    make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    repo = RamParkinglotRepository()
+    parkinglot = make_parkinglot(2)
+    repo.save(parkinglot)
+    with pytest.raises(ConcurrencyConflict):
+        repo.save(parkinglot)
+
+    partial = repo.get(parkinglot.id)
+    assert partial.spaces == []
+    partial.change_price(Decimal(200))
+    repo.save(partial)
+    loaded = repo.get(parkinglot.id, parkinglot.owner_id, with_spaces=True)
+    assert (loaded.price, loaded.version, len(loaded.spaces)) == (200, 2, 2)
+    assert repo.get(parkinglot.id, OwnerId(str(uuid.uuid4()))) is None
+
+    driver_id, booking_id = DriverId(str(uuid.uuid4())), BookingId()
+    reservation = repo.reserve_space(
+        parkinglot.id, driver_id, booking_id, timedelta(hours=1)
+    )
+    assert reservation and reservation.space_id and reservation.free_spaces == 1
+    again = repo.reserve_space(parkinglot.id, driver_id, booking_id)
+    assert again and again.space_id == reservation.space_id
+    assert repo.get_version(parkinglot.id) == 3
+    with pytest.raises(ConcurrencyConflict):
+        repo.save(loaded)
+
+    later = datetime.now() + timedelta(hours=2)
+    assert repo.expired_parkinglots(datetime.now(), 10) == []
+    assert release_expired_bookings(later, 10, repo, RamEventBus()) == 1
+    assert repo.expired_parkinglots(later, 10) == []
+    assert repo.get(parkinglot.id).free_spaces == 2
+    assert [p.id for p in repo.list_page(parkinglot.owner_id, 10).parkinglots] == [
+        parkinglot.id
+    ]
+
+
+def test_sweep_goes_on_when_a_parkinglot_fails(
+    make_parkinglot: Callable[[int], ParkinglotAggregate]
+):
+    class FailingEventBus(RamEventBus):
+        def publish(self, events: List[Any]) -> None:
+            if any(e.aggregate_id == str(failing.id) for e in events):
+                raise RuntimeError("publish failed")
+            super().publish(events)
+
+    repo = RamParkinglotRepository()
+    failing, released = make_parkinglot(1), make_parkinglot(1)
+    for parkinglot in (failing, released):
+        repo.save(parkinglot)
+        repo.reserve_space(
+            parkinglot.id, DriverId(str(uuid.uuid4())), BookingId(), timedelta(hours=1)
+        )
+
+    later = datetime.now() + timedelta(hours=2)
+    assert release_expired_bookings(later, 10, repo, FailingEventBus()) == 1
+    assert repo.get(released.id).free_spaces == 1
@@ -0,0 +1,326 @@
+from decimal import Decimal
+from typing import Callable, List, Optional
+
+import h3
+import numpy as np
+import pytest
+
+from backend.contexts.parkinglot.domain import Coordinates
+from backend.contexts.searcher.application import (
+    cover_cells,
+    haversine,
+    ring,
+    index_parkinglot,
+    iter_search_by_cell,
+    search_bbox,
+    search_by_cell,
+    search_nearest,
+    update_parkinglot_free_spaces,
+)
+from backend.contexts.searcher.domain import (
+    Parkinglot,
+    SearchCursor,
+    SearchFilter,
+    ViewportTooLarge,
+)
+from backend.contexts.searcher.infraestructure import RamParkinglotSearchRepository
+from backend.contexts.shared.domain import ULID, InvalidCursor, encode_cursor
+
+CENTRAL_CELL = h3.latlng_to_cell(-34.6037, -58.3816, 8)
+
+
+class CountingParkinglotSearchRepository(RamParkinglotSearchRepository):
+    def __init__(self, parkinglots: List[Parkinglot]) -> None:
+        super().__init__()
+        self.queries: List[List[str]] = []
+        for parkinglot in parkinglots:
+            self.save(parkinglot)
+
+    def query(
+        self,
+        h3hashes: List[str],
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[Parkinglot]:
+        self.queries.append(list(h3hashes))
+        return super().query(h3hashes, search_filter)
+
+
+def test_cover_cells_covers_every_cell_once():
+    cells = h3.grid_disk(CENTRAL_CELL, 10)
+    cover = cover_cells(cells)
+    assert len(cover) < len(cells)
+    for cell in cells:
+        parents = [
+            c for c in cover if h3.cell_to_parent(cell, h3.get_resolution(c)) == c
+        ]
+        assert len(parents) == 1
+
+
+def test_cover_cells_with_full_coverage_is_exact():
+    cells = h3.grid_disk(CENTRAL_CELL, 10)
+    cover = cover_cells(cells, min_coverage=1.0)
+    assert set(h3.uncompact_cells(cover, 8)) == set(cells)
+
+
+def test_search_by_cell_returns_rings_in_order_until_limit(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    parkinglots = [make_search_parkinglot(c) for c in h3.grid_disk(CENTRAL_CELL, 12)]
+    repo = CountingParkinglotSearchRepository(parkinglots)
+
+    response = search_by_cell(
+        central_cell=CENTRAL_CELL,
+        start_distance=1,
+        end_distance=10,
+        limit=10,
+        repo=repo,
+    )
+
+    assert response.current_distance == 2
+    assert [p.h3cell for p in response.parkinglots] == ring(CENTRAL_CELL, 1) + ring(
+        CENTRAL_CELL, 2
+    )
+    assert len(repo.queries) == 1
+
+
+def test_iter_search_by_cell_yields_each_ring_until_limit(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    parkinglots = [make_search_parkinglot(c) for c in h3.grid_disk(CENTRAL_CELL, 12)]
+    repo = CountingParkinglotSearchRepository(parkinglots)
+
+    rings = iter_search_by_cell(
+        central_cell=CENTRAL_CELL,
+        start_distance=0,
+        end_distance=10,
+        limit=7,
+        repo=repo,
+    )
+
+    first = next(rings)
+    assert first.distance == 0
+    assert len(repo.queries) == 1
+    assert [r.distance for r in rings] == [1]
+    assert repo.queries == [ring(CENTRAL_CELL, 0), ring(CENTRAL_CELL, 1)]
+
+
+def test_search_by_cell_filters_lots_outside_the_rings(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    outside = make_search_parkinglot(ring(CENTRAL_CELL, 11)[0])
+    repo = CountingParkinglotSearchRepository([outside])
+
+    response = search_by_cell(
+        central_cell=CENTRAL_CELL,
+        start_distance=0,
+        end_distance=10,
+        limit=10,
+        repo=repo,
+    )
+
+    assert response.current_distance == 10
+    assert response.parkinglots == []
+
+
+def test_search_cursor_resumes_inside_a_hot_cell(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    hot_cell, *cells = ring(CENTRAL_CELL, 1)
+    central = make_search_parkinglot(CENTRAL_CELL)
+    hot = [make_search_parkinglot(hot_cell) for _ in range(5)]
+    ring_1 = hot + [make_search_parkinglot(c) for c in cells]
+    repo = CountingParkinglotSearchRepository([central, *ring_1])
+
+    first = search_by_cell(
+        central_cell=CENTRAL_CELL,
+        start_distance=0,
+        end_distance=1,
+        limit=1,
+        repo=repo,
+    )
+    assert first.parkinglots == [central]
+
+    pages = []
+    cursor = first.cursor
+    while cursor:
+        page = search_by_cell(
+            central_cell=CENTRAL_CELL,
+            start_distance=0,
+            end_distance=1,
+            limit=2,
+            repo=repo,
+            cursor=cursor,
+        )
+        pages.append(page.parkinglots)
+        cursor = page.cursor
+
+    assert pages[0] == sorted(hot, key=lambda p: str(p.parkinglot_id))[:2]
+    assert [len(page) for page in pages] == [2, 2, 2, 2, 2]
+    returned = [p.parkinglot_id for page in pages for p in page]
+    assert sorted(returned) == sorted(p.parkinglot_id for p in ring_1)
+    assert len(repo.queries) == 1
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not a cursor",
+        encode_cursor(SearchCursor(distance=10**6)),
+        encode_cursor(SearchCursor(distance=1, offset=-1)),
+        encode_cursor(SearchCursor(distance=1, offset=6)),
+        encode_cursor(SearchCursor(distance=1, last_key={"pk": "PARKINGLOT::x"})),
+    ],
+)
+def test_search_cursor_must_be_valid(cursor: str):
+    with pytest.raises(InvalidCursor):
+        search_by_cell(
+            central_cell=CENTRAL_CELL,
+            start_distance=0,
+            end_distance=1,
+            limit=1,
+            repo=RamParkinglotSearchRepository(),
+            cursor=cursor,
+        )
+
+
+def test_haversine_matches_h3_great_circle_distance():
+    lat, lng = h3.cell_to_latlng(CENTRAL_CELL)
+    points = [h3.cell_to_latlng(c) for c in ring(CENTRAL_CELL, 5)]
+
+    distances = haversine(
+        lat, lng, np.array([p[0] for p in points]), np.array([p[1] for p in points])
+    )
+
+    expected = [h3.great_circle_distance((lat, lng), p, unit="m") for p in points]
+    assert np.allclose(distances, expected, rtol=1e-6)
+
+
+def test_search_nearest_returns_limit_lots_sorted_by_distance(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    lat, lng = h3.cell_to_latlng(CENTRAL_CELL)
+    parkinglots = [make_search_parkinglot(c) for c in h3.grid_disk(CENTRAL_CELL, 12)]
+    repo = CountingParkinglotSearchRepository(parkinglots)
+
+    response = search_nearest(lat=lat, lng=lng, radius_m=3000, limit=15, repo=repo)
+
+    distances = [p.distance_m for p in response.parkinglots]
+    assert len(distances) == 15
+    assert distances == sorted(distances)
+    assert response.parkinglots[0].h3cell == CENTRAL_CELL
+
+
+def test_search_nearest_drops_lots_outside_the_radius(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    lat, lng = h3.cell_to_latlng(CENTRAL_CELL)
+    parkinglots = [make_search_parkinglot(c) for c in h3.grid_disk(CENTRAL_CELL, 12)]
+    repo = CountingParkinglotSearchRepository(parkinglots)
+
+    response = search_nearest(lat=lat, lng=lng, radius_m=1000, limit=100, repo=repo)
+
+    assert 0 < len(response.parkinglots) < len(h3.grid_disk(CENTRAL_CELL, 2))
+    assert all(p.distance_m <= 1000 for p in response.parkinglots)
+
+
+def test_search_bbox_clips_lots_to_the_box(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    parkinglots = [make_search_parkinglot(c) for c in h3.grid_disk(CENTRAL_CELL, 10)]
+    repo = CountingParkinglotSearchRepository(parkinglots)
+    south, west, north, east = -34.61, -58.39, -34.60, -58.37
+
+    response = search_bbox(south, west, north, east, limit=500, repo=repo)
+
+    expected = [
+        p.parkinglot_id
+        for p in parkinglots
+        if south <= p.coordinates.lat <= north and west <= p.coordinates.lng <= east
+    ]
+    assert response.resolution == 8
+    assert expected
+    assert sorted(p.parkinglot_id for p in response.parkinglots) == sorted(expected)
+    assert len(repo.queries) == 1
+
+
+def test_search_bbox_clusters_when_over_the_limit(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    parkinglots = [make_search_parkinglot(c) for c in h3.grid_disk(CENTRAL_CELL, 10)]
+    repo = CountingParkinglotSearchRepository(parkinglots)
+
+    response = search_bbox(-34.62, -58.40, -34.59, -58.36, limit=5, repo=repo)
+    inside = search_bbox(-34.62, -58.40, -34.59, -58.36, limit=500, repo=repo)
+
+    assert len(inside.parkinglots) > 5
+    assert response.parkinglots == []
+    assert 0 < len(response.clusters) <= 5
+    assert sum(c.count for c in response.clusters) == len(inside.parkinglots)
+
+
+def test_search_bbox_rejects_huge_viewports():
+    with pytest.raises(ViewportTooLarge):
+        search_bbox(-40, -65, -30, -55, limit=10, repo=RamParkinglotSearchRepository())
+
+
+def test_index_parkinglot_replaces_previous_cells(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    repo = RamParkinglotSearchRepository()
+    parkinglot = make_search_parkinglot(CENTRAL_CELL)
+    moved_to = ring(CENTRAL_CELL, 3)[0]
+    lat, lng = h3.cell_to_latlng(moved_to)
+
+    repo.save(parkinglot)
+    index_parkinglot(
+        parkinglot_id=parkinglot.parkinglot_id,
+        name=parkinglot.name,
+        street=parkinglot.street,
+        coordinates=Coordinates(lat=lat, lng=lng),
+        price=parkinglot.price,
+        repo=repo,
+    )
+
+    assert repo.query([CENTRAL_CELL]) == []
+    assert [p.h3cell for p in repo.query([moved_to])] == [moved_to]
+    assert len(repo.query([h3.cell_to_parent(moved_to, 6)])) == 1
+
+
+def test_search_by_cell_skips_lots_that_do_not_match_the_filter(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    full = [make_search_parkinglot(c, free_spaces=0) for c in ring(CENTRAL_CELL, 1)]
+    expensive = [make_search_parkinglot(c, price=500) for c in ring(CENTRAL_CELL, 1)]
+    available = [make_search_parkinglot(c) for c in ring(CENTRAL_CELL, 2)]
+    repo = CountingParkinglotSearchRepository(full + expensive + available)
+
+    response = search_by_cell(
+        central_cell=CENTRAL_CELL,
+        start_distance=0,
+        end_distance=10,
+        limit=len(available),
+        repo=repo,
+        search_filter=SearchFilter(min_free_spaces=1, max_price=Decimal(200)),
+    )
+
+    assert response.current_distance == 2
+    assert response.parkinglots == sorted(available, key=lambda p: p.h3cell)
+
+
+def test_free_spaces_updates_are_visible_to_filtered_searches(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    parkinglot = make_search_parkinglot(CENTRAL_CELL, free_spaces=0)
+    repo = CountingParkinglotSearchRepository([parkinglot])
+    search_filter = SearchFilter(min_free_spaces=1)
+    assert repo.query([CENTRAL_CELL], search_filter) == []
+
+    update_parkinglot_free_spaces(
+        parkinglot_id=parkinglot.parkinglot_id,
+        h3cell=parkinglot.h3cell,
+        free_spaces=3,
+        event_id=ULID(),
+        repo=repo,
+    )
+
+    assert [p.free_spaces for p in repo.query([CENTRAL_CELL], search_filter)] == [3]
@@ -0,0 +1,209 @@
+from decimal import Decimal
+from typing import Any, Callable, List
+
+import h3
+import pytest
+
+from backend.benchmarks.dynamodb import (
+    H3_CELL_INDEX,
+    H3_CELL_PARENT_INDEXES,
+    TABLE_NAME,
+)
+from backend.contexts.searcher.domain import Parkinglot, SearchFilter
+from backend.contexts.searcher.infraestructure import (
+    CachedParkinglotSearchRepository,
+    DynamodbParkinglotSearchRepository,
+    RamParkinglotSearchRepository,
+)
+from backend.contexts.shared.domain import ULID
+
+CENTRAL_CELL = h3.latlng_to_cell(-34.6037, -58.3816, 8)
+
+
+def test_cached_search_shares_cells_between_queries(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    cells = sorted(h3.grid_disk(CENTRAL_CELL, 1))
+    repo = CachedParkinglotSearchRepository(
+        RamParkinglotSearchRepository(), maxsize=100, ttl=60
+    )
+    for cell in cells:
+        repo.save(make_search_parkinglot(cell))
+
+    first = repo.query(cells[:4])
+    second = repo.query(cells[2:])
+
+    assert [p.h3cell for p in first] == cells[:4]
+    assert [p.h3cell for p in second] == cells[2:]
+    stats = repo._cache.stats()
+    assert (stats.hits, stats.misses, stats.size) == (2, len(cells), len(cells))
+
+
+def test_cached_search_splits_parent_cells(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    parent = h3.cell_to_parent(CENTRAL_CELL, 7)
+    repo = CachedParkinglotSearchRepository(
+        RamParkinglotSearchRepository(), maxsize=100, ttl=60
+    )
+    repo.save(make_search_parkinglot(CENTRAL_CELL))
+
+    assert len(repo.query([parent, CENTRAL_CELL])) == 2
+    assert len(repo.query([parent])) == 1
+    assert repo._cache.stats().hits == 1
+
+
+def test_saving_a_parkinglot_invalidates_its_cells(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    parent = h3.cell_to_parent(CENTRAL_CELL, 6)
+    repo = CachedParkinglotSearchRepository(
+        RamParkinglotSearchRepository(), maxsize=100, ttl=60
+    )
+    assert repo.query([CENTRAL_CELL, parent]) == []
+
+    repo.save(make_search_parkinglot(CENTRAL_CELL))
+
+    assert len(repo.query([CENTRAL_CELL, parent])) == 2
+    assert repo._cache.stats().hits == 0
+
+
+def test_cached_search_evicts_least_recently_used_cells():
+    cells = sorted(h3.grid_disk(CENTRAL_CELL, 1))
+    repo = CachedParkinglotSearchRepository(
+        RamParkinglotSearchRepository(), maxsize=2, ttl=60
+    )
+
+    repo.query(cells[:3])
+
+    stats = repo._cache.stats()
+    assert (stats.size, stats.evictions) == (2, 1)
+
+
+def test_cached_search_filters_shared_cells(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    repo = CachedParkinglotSearchRepository(
+        RamParkinglotSearchRepository(), maxsize=100, ttl=60
+    )
+    repo.save(make_search_parkinglot(CENTRAL_CELL, free_spaces=0))
+
+    assert len(repo.query([CENTRAL_CELL])) == 1
+    assert repo.query([CENTRAL_CELL], SearchFilter(min_free_spaces=1)) == []
+    assert repo._cache.stats().hits == 1
+
+
+def test_price_updates_invalidate_cached_cells(
+    make_search_parkinglot: Callable[..., Parkinglot]
+):
+    parkinglot = make_search_parkinglot(CENTRAL_CELL)
+    repo = CachedParkinglotSearchRepository(
+        RamParkinglotSearchRepository(), maxsize=100, ttl=60
+    )
+    repo.save(parkinglot)
+    repo.query([CENTRAL_CELL])
+
+    repo.update_price(parkinglot.parkinglot_id, parkinglot.h3cell, Decimal(300), ULID())
+
+    assert [p.price for p in repo.query([CENTRAL_CELL])] == [Decimal(300)]
+    assert repo._cache.stats().hits == 0
+
+
+def test_dynamodb_projection_ignores_stale_events(
+    dynamodb_table: Any, make_search_parkinglot: Callable[..., Parkinglot]
+):
+    repo = DynamodbParkinglotSearchRepository(
+        table_name=TABLE_NAME,
+        index_name=H3_CELL_INDEX,
+        parent_index_names=H3_CELL_PARENT_INDEXES,
+    )
+    parkinglot = make_search_parkinglot(CENTRAL_CELL, free_spaces=0)
+    older, newer = ULID.from_timestamp(1), ULID.from_timestamp(2)
+
+    # the free spaces event arrives before the parkinglot is indexed
+    repo.update_free_spaces(parkinglot.parkinglot_id, CENTRAL_CELL, 5, newer)
+    repo.update_free_spaces(parkinglot.parkinglot_id, CENTRAL_CELL, 9, older)
+    assert repo.query([CENTRAL_CELL]) == []
+
+    repo.save(parkinglot)
+
+    parent = h3.cell_to_parent(CENTRAL_CELL, 6)
+    assert repo.query([CENTRAL_CELL]) == repo.query([parent])
+    assert [p.free_spaces for p in repo.query([CENTRAL_CELL])] == [5]
+
+
+def test_dynamodb_fan_out_merges_cells_in_order_once(
+    dynamodb_table: Any, make_search_parkinglot: Callable[..., Parkinglot]
+):
+    repo = DynamodbParkinglotSearchRepository(
+        table_name=TABLE_NAME,
+        index_name=H3_CELL_INDEX,
+        parent_index_names=H3_CELL_PARENT_INDEXES,
+        max_workers=4,
+    )
+    cells = sorted(h3.grid_disk(CENTRAL_CELL, 1))
+    for cell in cells:
+        repo.save(make_search_parkinglot(cell))
+    parent = h3.cell_to_parent(CENTRAL_CELL, 7)
+
+    results = [repo.query([*cells, parent, cells[0]]) for _ in range(5)]
+
+    ids = [p.parkinglot_id for p in results[0]]
+    assert len(ids) == len(set(ids)) == len(cells)
+    assert [p.h3cell for p in results[0]] == cells
+    assert all(r == results[0] for r in results)
+
+
+def test_dynamodb_fan_out_raises_when_a_cell_fails(
+    dynamodb_table: Any, make_search_parkinglot: Callable[..., Parkinglot]
+):
+    repo = DynamodbParkinglotSearchRepository(
+        table_name=TABLE_NAME,
+        index_name=H3_CELL_INDEX,
+        parent_index_names=H3_CELL_PARENT_INDEXES,
+        max_workers=4,
+    )
+    cells = sorted(h3.grid_disk(CENTRAL_CELL, 1))
+    for cell in cells:
+        repo.save(make_search_parkinglot(cell))
+    query_cell = repo._query_cell
+
+    def failing(h3cell: str, **kwargs: Any) -> List[Parkinglot]:
+        if h3cell == cells[3]:
+            raise RuntimeError("query failed")
+        return query_cell(h3cell, **kwargs)
+
+    repo._query_cell = failing  # type: ignore[method-assign]
+    with pytest.raises(RuntimeError):
+        repo.query(cells)
+
+    repo._query_cell = query_cell  # type: ignore[method-assign]
+    assert len(repo.query(cells)) == len(cells)
+
+
+def test_dynamodb_pages_a_cell_past_filtered_items(
+    dynamodb_table: Any, make_search_parkinglot: Callable[..., Parkinglot]
+):
+    repo = DynamodbParkinglotSearchRepository(
+        table_name=TABLE_NAME,
+        index_name=H3_CELL_INDEX,
+        parent_index_names=H3_CELL_PARENT_INDEXES,
+    )
+    parkinglots = [
+        make_search_parkinglot(CENTRAL_CELL, free_spaces=i % 2) for i in range(10)
+    ]
+    for parkinglot in parkinglots:
+        repo.save(parkinglot)
+
+    search_filter = SearchFilter(min_free_spaces=1)
+    returned = []
+    page = repo.query_page(CENTRAL_CELL, 2, search_filter)
+    returned.extend(page.parkinglots)
+    while page.last_key:
+        assert len(page.parkinglots) == 2
+        page = repo.query_page(CENTRAL_CELL, 2, search_filter, page.last_key)
+        returned.extend(page.parkinglots)
+
+    assert sorted(p.parkinglot_id for p in returned) == sorted(
+        p.parkinglot_id for p in parkinglots if p.free_spaces
+    )
@@ -0,0 +1,83 @@
+import uuid
+from typing import Any, Dict, List
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from backend.benchmarks.dynamodb import setup_aws_env
+from backend.contexts.parkinglot.domain import ParkingSpaceCreated
+from backend.contexts.shared.domain import ParkingSpaceId
+from backend.contexts.shared.infrastructure import EventsNotPublished, SnsEventBus
+
+
+def make_events(count: int) -> List[ParkingSpaceCreated]:
+    return [
+        ParkingSpaceCreated(
+            aggregate_id=str(uuid.uuid4()),
+            space_id=ParkingSpaceId(str(uuid.uuid4())),
+        )
+        for _ in range(count)
+    ]
+
+
+class FlakyClient:
+    def __init__(self, failures: Dict[str, bool]) -> None:
+        self.failures = failures
+        self.calls: List[List[str]] = []
+
+    def publish_batch(self, **kwargs: Any) -> Dict[str, Any]:
+        ids = [e["Id"] for e in kwargs["PublishBatchRequestEntries"]]
+        self.calls.append(ids)
+        failed = [
+            {"Id": i, "Code": "InternalError", "SenderFault": self.failures.pop(i)}
+            for i in ids
+            if i in self.failures
+        ]
+        return {"Successful": [], "Failed": failed}
+
+
+def test_publish_splits_events_in_batches_of_ten():
+    setup_aws_env()
+    with mock_aws():
+        topic_arn = boto3.client("sns").create_topic(Name="events")["TopicArn"]
+        bus = SnsEventBus(topic_arn)
+        batches: List[int] = []
+        bus._client.meta.events.register(
+            "provide-client-params.sns.PublishBatch",
+            lambda params, **kwargs: batches.append(
+                len(params["PublishBatchRequestEntries"])
+            ),
+        )
+
+        bus.publish(make_events(25))
+
+        assert sorted(batches) == [5, 10, 10]
+        stats = bus.stats()
+        assert (stats.requests, stats.entries, stats.failed) == (3, 25, 0)
+        assert 0 < stats.mean_latency_ms <= stats.max_latency_ms
+
+
+def test_publish_retries_only_the_failed_entries():
+    setup_aws_env()
+    events = make_events(3)
+    bus = SnsEventBus("topic", base_delay=0)
+    bus._client = FlakyClient({str(events[1].id): False})  # type: ignore
+
+    bus.publish(events)
+
+    assert bus._client.calls == [[str(e.id) for e in events], [str(events[1].id)]]
+    assert (bus.stats().requests, bus.stats().entries, bus.stats().failed) == (2, 4, 1)
+
+
+def test_publish_does_not_retry_sender_faults():
+    setup_aws_env()
+    events = make_events(12)
+    bus = SnsEventBus("topic", base_delay=0)
+    bus._client = FlakyClient({str(events[11].id): True})  # type: ignore
+
+    with pytest.raises(EventsNotPublished) as e:
+        bus.publish(events)
+
+    assert e.value.event_ids == [str(events[11].id)]
+    assert len(bus._client.calls) == 2